@@ -15,9 +15,13 @@ if app.config.get('OAUTHLIB_INSECURE_TRANSPORT'):
     import os
     os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = app.config['OAUTHLIB_INSECURE_TRANSPORT']
 
-db = SQLAlchemy(app)
+from app.replica import RoutingSession
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 login = LoginManager(app)
 login.login_view = 'login'
 
-from app import routes, models
+from app import routes, models, instrumentation, profiling, quota, search, feed, workload, jobs, tasks, notifications, warmup, export, fragment_cache, mutations, cleanup, compression, server, replica, attachments
 
+if app.config['ASYNC_VIEWS']:
+    from app import async_views
+    async_views.register()
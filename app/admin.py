@@ -0,0 +1,35 @@
+"""
+Helpers for admin-only functionality.
+Admins are the users whose email addresses are listed in the ADMIN_EMAILS setting.
+"""
+from functools import wraps
+from flask import abort
+from flask_login import current_user
+from app import app
+
+def is_admin(user):
+    """
+    Checks whether a user is an administrator.
+
+    Args:
+        user (User): The user to check (may be anonymous).
+
+    Returns:
+        bool: True if the user is logged in and listed in ADMIN_EMAILS.
+    """
+    if not user or not user.is_authenticated:
+        return False
+    return user.email.lower() in app.config['ADMIN_EMAILS']
+
+def admin_required(view):
+    """
+    Decorator that restricts a view to administrators.
+
+    Non-admins (including anonymous users) receive a 404 so admin endpoints are not advertised.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not is_admin(current_user):
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapped
@@ -0,0 +1,101 @@
+"""
+Async variants of the Google-heavy views, used when ASYNC_VIEWS is set (see asgi.py).
+Each view issues its Classroom calls concurrently through app.async_google and then hands the
+results to the same rendering code as the synchronous view.
+Flask runs an async view on its own event loop for the duration of the request; the gain is that
+a page's Google calls overlap instead of running one after another.
+"""
+import asyncio
+from flask import flash
+from flask_login import current_user, login_required
+from app import app, latency_budget, roster, routes, tasks, warmup
+from app.async_google import AsyncClassroom
+
+def prefetched(result):
+    """
+    Wraps a result from ``asyncio.gather(..., return_exceptions=True)`` as a callable for the
+    shared renderers: it returns the value, or raises the exception the fetch ended with.
+    """
+    def get():
+        if isinstance(result, BaseException):
+            raise result
+        return result
+    return get
+
+async def index():
+    """
+    Async dashboard: refreshes a stale course list without blocking a thread, then renders as usual.
+    """
+    budget = latency_budget.current('index')
+    if current_user.is_authenticated and not warmup.in_progress(current_user.id) \
+            and roster.course_list_row(current_user.id, app.config['COURSE_LIST_CACHE_SECONDS']) is None:
+        stale = roster.course_list_row(current_user.id, app.config['STALE_MAX_AGE_HOURS'] * 3600)
+        try:
+            async with AsyncClassroom(current_user) as classroom:
+                courses = await budget.wait_for(classroom.list_all('courses', 'courses', studentId='me'),
+                                                fallback=stale is not None)
+            roster.store_course_list(current_user.id, courses)
+        except Exception as e:
+            # The synchronous path below falls back to the stale list (its budget is spent) or
+            # retries the fetch and reports the error
+            app.logger.warning(f"Async course list fetch failed: {e}")
+    return routes.index()
+
+@login_required
+async def missing_assignments():
+    """
+    Async missing assignments page: coursework and submissions of all courses are fetched concurrently.
+    """
+    assignments = []
+    try:
+        async with AsyncClassroom(current_user) as classroom:
+            courses = await classroom.list_all('courses', 'courses', studentId='me', courseStates='ACTIVE')
+            course_ids = [course['id'] for course in courses]
+            (all_course_work, cw_errors), (all_submissions, sub_errors) = await asyncio.gather(
+                classroom.list_for_courses(course_ids, 'courses/{course_id}/courseWork', 'courseWork'),
+                classroom.list_for_courses(course_ids, 'courses/{course_id}/courseWork/-/studentSubmissions',
+                                           'studentSubmissions', userId='me'),
+            )
+        for course_id, error in cw_errors.items():
+            app.logger.warning(f"Error fetching coursework for {course_id}: {error}")
+        for course_id, error in sub_errors.items():
+            app.logger.warning(f"Error fetching submissions for {course_id}: {error}")
+        if courses:
+            assignments = routes.collect_missing_assignments(courses, all_course_work, all_submissions)
+    except Exception as e:
+        flash(f'Error fetching missing assignments: {str(e)}', 'error')
+    return routes.render_missing_assignments(assignments)
+
+@login_required
+async def course_stream(course_id):
+    """
+    Async course stream: the course and its three item lists are fetched concurrently, within the
+    page's latency budget.
+    """
+    budget = latency_budget.current('course_stream')
+    source = latency_budget.CourseStreamSource(budget, current_user.id, course_id)
+    available = source.available()
+    tasks.refresh_token_soon(current_user)
+    async with AsyncClassroom(current_user) as classroom:
+        course, announcements, coursework, materials = await asyncio.gather(
+            budget.wait_for(classroom.get(f'courses/{course_id}'), 'course' in available),
+            budget.wait_for(classroom.list_all(f'courses/{course_id}/announcements', 'announcements'),
+                            'announcement' in available),
+            budget.wait_for(classroom.list_all(f'courses/{course_id}/courseWork', 'courseWork'),
+                            'assignment' in available),
+            budget.wait_for(classroom.list_all(f'courses/{course_id}/courseWorkMaterials', 'courseWorkMaterial'),
+                            'material' in available),
+            return_exceptions=True,
+        )
+    listings = (
+        ('announcement', prefetched(announcements)),
+        ('assignment', prefetched(coursework)),
+        ('material', prefetched(materials)),
+    )
+    return routes.render_course_stream(course_id, prefetched(course), listings, source)
+
+def register():
+    """Replaces the synchronous view functions with the async variants."""
+    app.view_functions['index'] = index
+    app.view_functions['missing_assignments'] = missing_assignments
+    app.view_functions['course_stream'] = course_stream
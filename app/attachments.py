@@ -0,0 +1,261 @@
+"""
+Attachment index behind the Files page.
+The Drive files, links, YouTube videos and forms attached to announcements, coursework and
+materials are extracted into Attachment rows as stream items are fetched from Google (the course
+stream and Missing Assignments pages), with their icon and MIME category worked out once when they
+are indexed. The Files page lists every attachment across the user's courses, filtered by course and
+category, from a single query on that table.
+
+An attachment is identified within its course by its Drive file ID (or video ID, form or link URL),
+so a handout posted on many assignments is listed once, under its latest post. When a course's whole
+stream is fetched, attachments no longer on any of its items are dropped; those of courses that
+leave the roster are deleted by the garbage collection (see app.cleanup).
+"""
+from datetime import datetime
+from flask import render_template, request
+from flask_login import current_user, login_required
+from app import app, db
+from app.models import Attachment
+
+# MIME type fragments of each Drive file category, checked in order
+MIME_CATEGORIES = (
+    ('pdf', ('pdf',)),
+    ('image', ('image',)),
+    ('video', ('video',)),
+    ('audio', ('audio',)),
+    ('spreadsheet', ('sheet', 'excel', 'spreadsheet')),
+    ('presentation', ('presentation', 'powerpoint', 'slides')),
+    ('document', ('document', 'word')),
+    ('form', ('form',)),
+)
+
+# Font Awesome icon (without the style prefix) of each Drive file category
+FILE_ICONS = {
+    'pdf': 'file-pdf text-red-500',
+    'image': 'file-image text-purple-500',
+    'video': 'file-video text-red-600',
+    'audio': 'file-audio text-yellow-500',
+    'spreadsheet': 'file-excel text-green-500',
+    'presentation': 'file-powerpoint text-orange-500',
+    'document': 'file-word text-blue-500',
+    'form': 'file-alt text-purple-600',
+    'file': 'file text-gray-500',
+}
+
+# Filter options of the Files page, in display order
+CATEGORY_LABELS = {
+    'pdf': 'PDFs',
+    'document': 'Documents',
+    'spreadsheet': 'Spreadsheets',
+    'presentation': 'Presentations',
+    'image': 'Images',
+    'video': 'Videos',
+    'audio': 'Audio',
+    'form': 'Forms',
+    'link': 'Links',
+    'file': 'Other files',
+}
+
+def mime_category(mime_type):
+    """
+    Classifies a Drive file by its MIME type.
+
+    Returns:
+        str: A key of FILE_ICONS ('file' if the type is missing or not recognized).
+    """
+    mime_type = (mime_type or '').lower()
+    for category, fragments in MIME_CATEGORIES:
+        if any(fragment in mime_type for fragment in fragments):
+            return category
+    return 'file'
+
+def attachment_fields(material):
+    """
+    Extracts the indexed fields of one of an item's materials.
+
+    Args:
+        material (dict): An entry of a Google Classroom item's 'materials'.
+
+    Returns:
+        dict: Column values for an Attachment (with 'key'), or None for a material without an ID or URL.
+    """
+    if 'driveFile' in material:
+        drive_file = material['driveFile'].get('driveFile', {})
+        category = mime_category(drive_file.get('mimeType'))
+        fields = {'key': f"drive:{drive_file.get('id')}" if drive_file.get('id') else None, 'kind': 'drive',
+                  'category': category, 'icon': f'fas fa-{FILE_ICONS[category]}', 'title': drive_file.get('title'),
+                  'url': drive_file.get('alternateLink'), 'mime_type': drive_file.get('mimeType')}
+    elif 'youtubeVideo' in material:
+        video = material['youtubeVideo']
+        fields = {'key': f"youtube:{video.get('id')}" if video.get('id') else None, 'kind': 'youtube',
+                  'category': 'video', 'icon': 'fab fa-youtube text-red-600', 'title': video.get('title'),
+                  'url': video.get('alternateLink'), 'mime_type': None}
+    elif 'form' in material:
+        form = material['form']
+        fields = {'key': f"form:{form.get('formUrl')}" if form.get('formUrl') else None, 'kind': 'form',
+                  'category': 'form', 'icon': f"fas fa-{FILE_ICONS['form']}", 'title': form.get('title'),
+                  'url': form.get('formUrl'), 'mime_type': None}
+    elif 'link' in material:
+        link = material['link']
+        fields = {'key': f"link:{link.get('url')}" if link.get('url') else None, 'kind': 'link',
+                  'category': 'link', 'icon': 'fas fa-link text-slate-500',
+                  'title': link.get('title') or link.get('url'), 'url': link.get('url'), 'mime_type': None}
+    else:
+        return None
+    if fields['key'] is None or len(fields['key']) > 600:
+        return None
+    return fields
+
+def extract_attachments(items):
+    """
+    Collects the attachments of stream items, one per identity, each with its latest post.
+
+    Args:
+        items (list): Google stream items, each with a 'type' key.
+
+    Returns:
+        dict: Attachment key -> column values.
+    """
+    found = {}
+    for item in items:
+        posted_at = item.get('updateTime') or item.get('creationTime')
+        for material in item.get('materials', []):
+            fields = attachment_fields(material)
+            if fields is None:
+                continue
+            previous = found.get(fields['key'])
+            if previous is not None and (previous['posted_at'] or '') >= (posted_at or ''):
+                continue
+            fields.update(google_item_id=item.get('id'), item_type=item.get('type'), posted_at=posted_at,
+                          item_title=item.get('title') or (item.get('text') or '').split('\n', 1)[0][:200])
+            found[fields['key']] = fields
+    return found
+
+def index_attachments(user_id, streams, complete=False):
+    """
+    Incrementally indexes the attachments of stream items of one or more courses.
+
+    The existing rows of all the courses are read with one SELECT and changes are committed once, so
+    re-fetching unchanged streams costs a single query. Unless the items are the whole stream, a row
+    that points to a later post on another item is kept as well: the Missing Assignments page only
+    sees coursework, and must not move an attachment off the newer announcement the course stream
+    indexed it under.
+
+    Args:
+        user_id (int): The local user ID.
+        streams (dict): Google course ID -> (course (display) name, Google stream items, each with
+            a 'type' key).
+        complete (bool): Whether the items are each course's whole stream, so that attachments on
+            none of them can be dropped.
+
+    Returns:
+        int: Number of rows inserted, updated or deleted.
+    """
+    found = {course_id: extract_attachments(items) for course_id, (_, items) in streams.items()}
+    if not complete:
+        found = {course_id: attachments for course_id, attachments in found.items() if attachments}
+    if not found:
+        return 0
+    existing = {}
+    for row in Attachment.query.filter(Attachment.user_id == user_id, Attachment.google_course_id.in_(list(found))):
+        existing[(row.google_course_id, row.key)] = row
+    changed = 0
+    now = datetime.utcnow()
+    for course_id, attachments in found.items():
+        course_name = streams[course_id][0]
+        for key, fields in attachments.items():
+            fields['course_name'] = course_name
+            row = existing.get((course_id, key))
+            if row is None:
+                row = Attachment(user_id=user_id, google_course_id=course_id)
+                db.session.add(row)
+            elif all(getattr(row, name) == value for name, value in fields.items()):
+                continue
+            elif (not complete and row.google_item_id != fields['google_item_id']
+                  and (row.posted_at or '') >= (fields['posted_at'] or '')):
+                continue # Posted later on an item the caller did not fetch (e.g. an announcement)
+            for name, value in fields.items():
+                setattr(row, name, value)
+            row.indexed_at = now
+            changed += 1
+    if complete:
+        for (course_id, key), row in existing.items():
+            if key not in found[course_id]:
+                db.session.delete(row)
+                changed += 1
+    if changed:
+        db.session.commit()
+    return changed
+
+def safe_index_attachments(user_id, streams, complete=False):
+    """
+    Indexes attachments without ever failing the calling request.
+
+    Returns:
+        int: Number of rows written, or 0 if indexing failed.
+    """
+    try:
+        return index_attachments(user_id, streams, complete)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Error indexing attachments in {', '.join(streams)}: {e}")
+        return 0
+
+def list_attachments(user_id, course_id=None, category=None, limit=30, offset=0):
+    """
+    Lists a user's indexed attachments, most recently posted first.
+
+    Args:
+        user_id (int): The local user ID.
+        course_id (str, optional): Restrict to one Google course.
+        category (str, optional): Restrict to one category (a key of CATEGORY_LABELS).
+        limit (int): Maximum number of rows.
+        offset (int): Number of rows to skip.
+
+    Returns:
+        list: Attachment rows.
+    """
+    query = Attachment.query.filter(Attachment.user_id == user_id)
+    if course_id:
+        query = query.filter(Attachment.google_course_id == course_id)
+    if category:
+        query = query.filter(Attachment.category == category)
+    return query.order_by(Attachment.posted_at.desc(), Attachment.id.desc()).limit(limit).offset(offset).all()
+
+def attachment_courses(user_id):
+    """
+    Lists the courses that have indexed attachments, for the course filter.
+
+    Returns:
+        list: (google_course_id, course_name) tuples sorted by name.
+    """
+    rows = db.session.query(Attachment.google_course_id, db.func.max(Attachment.course_name)) \
+        .filter(Attachment.user_id == user_id) \
+        .group_by(Attachment.google_course_id).all()
+    return sorted(rows, key=lambda r: (r[1] or '').lower())
+
+@app.route('/files')
+@login_required
+def files_page():
+    """
+    Renders the attachments of all the user's courses from the local index.
+
+    Query Parameters:
+        course (str, optional): Google course ID to filter by.
+        type (str, optional): Category to filter by (see CATEGORY_LABELS).
+        page (int, optional): Page number.
+
+    Returns:
+        str: Rendered HTML template for the Files page.
+    """
+    course_id = request.args.get('course') or None
+    category = request.args.get('type') if request.args.get('type') in CATEGORY_LABELS else None
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+    per_page = app.config['FILES_PAGE_SIZE']
+    files = list_attachments(current_user.id, course_id, category, limit=per_page + 1, offset=(page - 1) * per_page)
+    return render_template('files.html', title='Files', files=files[:per_page], has_more=len(files) > per_page,
+                           course_id=course_id, category=category, page=page, categories=CATEGORY_LABELS,
+                           courses=attachment_courses(current_user.id))
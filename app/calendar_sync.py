@@ -0,0 +1,303 @@
+"""
+Incremental, idempotent Classroom-to-Calendar sync.
+Keeps a CalendarEventMap row (event ID and content hash) per synced coursework item and, on each
+run, sends only the inserts, patches and deletes needed to bring the user's calendar in line with
+the current due dates, using Calendar batch requests. Mapping rows are committed after every batch,
+so a run that fails part-way resumes from where it stopped.
+
+Events are inserted with an ID derived from the coursework ID. If a run dies after Calendar created
+its events but before their mapping rows were committed, the next run's inserts are rejected as
+duplicates (409); the existing events are then mapped and patched instead of being created again.
+Events of courses that are no longer active (archived, or left) are deleted.
+"""
+import base64
+import hashlib
+import json
+from datetime import datetime, timedelta
+from googleapiclient.errors import HttpError
+from app import app, db, quota, jobs, coursework_cache
+from app.models import User, CalendarEventMap, CalendarSync
+from app.google_client import get_credentials, build_service
+from app.quota import QuotaExceeded
+
+# Calendar recommends at most 50 calls per batch request
+CALENDAR_BATCH_LIMIT = 50
+
+# A 'running' sync older than this is assumed to have died (e.g., a serverless instance was frozen)
+STALE_RUN = timedelta(minutes=10)
+
+# Calendar event IDs may only use the base32hex alphabet (RFC 4648 section 7), in lower case
+_BASE32HEX = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', '0123456789abcdefghijklmnopqrstuv')
+
+def event_id(coursework_id):
+    """
+    Returns the Calendar event ID of a coursework item's due date event.
+
+    The ID is the base32hex encoding of the coursework ID, so that inserting the same item twice
+    fails with a 409 instead of creating a duplicate event.
+    """
+    return base64.b32encode(f'classdeck:{coursework_id}'.encode()).decode().rstrip('=').translate(_BASE32HEX)
+
+def due_datetime(work):
+    """
+    Returns the due date of a coursework item.
+
+    Args:
+        work (dict): A Google Classroom coursework item.
+
+    Returns:
+        tuple: (datetime, has_time) in UTC, or (None, False) if there is no valid due date.
+    """
+    due = work.get('dueDate')
+    if not due:
+        return None, False
+    time = work.get('dueTime')
+    try:
+        if time is None:
+            return datetime(due['year'], due['month'], due['day']), False
+        return datetime(due['year'], due['month'], due['day'], time.get('hours', 0), time.get('minutes', 0)), True
+    except (KeyError, ValueError):
+        return None, False
+
+def event_body(work, course_name):
+    """
+    Builds the Calendar event for a coursework item's due date.
+
+    Items with a due time become point-in-time events; items with only a due date become all-day events.
+
+    Args:
+        work (dict): A Google Classroom coursework item.
+        course_name (str): The name of the item's course.
+
+    Returns:
+        dict: The event resource, or None if the item has no due date.
+    """
+    due, has_time = due_datetime(work)
+    if due is None:
+        return None
+    if has_time:
+        moment = {'dateTime': due.strftime('%Y-%m-%dT%H:%M:%SZ'), 'timeZone': 'UTC'}
+        start, end = moment, moment
+    else:
+        start = {'date': due.strftime('%Y-%m-%d')}
+        end = {'date': (due + timedelta(days=1)).strftime('%Y-%m-%d')}
+    link = work.get('alternateLink')
+    description = work.get('description') or ''
+    if link:
+        description = f'{description}\n\n{link}'.strip()
+    body = {
+        'summary': f"{work.get('title') or 'Assignment'} ({course_name})",
+        'description': description,
+        'start': start,
+        'end': end,
+        'extendedProperties': {'private': {'classdeckCourseWorkId': work['id']}},
+    }
+    if link:
+        body['source'] = {'title': 'Google Classroom', 'url': link}
+    return body
+
+def content_hash(body):
+    """Returns a stable hash of an event body."""
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+def plan_changes(desired, mapped, synced_courses, active_courses):
+    """
+    Diffs the desired events against what has already been written to Calendar.
+
+    Args:
+        desired (dict): Coursework ID -> (course ID, event body, hash).
+        mapped (dict): Coursework ID -> CalendarEventMap.
+        synced_courses (set): Course IDs whose coursework was fetched successfully. Events of
+            active courses whose fetch failed are never deleted, so a failed fetch cannot wipe a calendar.
+        active_courses (set): IDs of all of the user's active courses. Events of other courses are deleted.
+
+    Returns:
+        tuple: (inserts, patches, deletes) lists of coursework IDs.
+    """
+    inserts = [cw_id for cw_id in desired if cw_id not in mapped]
+    patches = [cw_id for cw_id, (_, _, digest) in desired.items()
+               if cw_id in mapped and mapped[cw_id].content_hash != digest]
+    deletes = [cw_id for cw_id, row in mapped.items() if cw_id not in desired and
+               (row.google_course_id in synced_courses or row.google_course_id not in active_courses)]
+    return inserts, patches, deletes
+
+def fetch_desired_events(classroom, user_id):
+    """
+    Fetches all coursework with due dates from the user's active courses, refreshing the coursework cache.
+
+    Args:
+        classroom (Resource): Classroom service for the user.
+        user_id (int): The local user ID.
+
+    Returns:
+        tuple: (desired, synced_courses, active_courses) as used by plan_changes().
+    """
+    with quota.background():
+        quota.require(user_id, coursework_cache.refresh_cost(user_id, submissions=False))
+        courses, coursework, _ = coursework_cache.fetch_active_coursework(classroom)
+    names = coursework_cache.display_names(user_id, courses)
+    coursework_cache.safe_store_coursework(user_id, names, coursework)
+
+    desired = {}
+    for course_id, items in coursework.items():
+        for work in items:
+            body = event_body(work, names[course_id])
+            if body is not None:
+                desired[work['id']] = (course_id, body, content_hash(body))
+    return desired, set(coursework), {course['id'] for course in courses}
+
+def apply_changes(calendar, user_id, desired, mapped, inserts, patches, deletes, state):
+    """
+    Sends the planned changes to Calendar in batches, committing mapping rows after each batch.
+
+    Args:
+        calendar (Resource): Calendar service for the user.
+        user_id (int): The local user ID.
+        desired (dict): Coursework ID -> (course ID, event body, hash).
+        mapped (dict): Coursework ID -> CalendarEventMap.
+        inserts, patches, deletes (list): Coursework IDs from plan_changes().
+        state (CalendarSync): The sync state row; counters are updated in place.
+    """
+    calendar_id = app.config['CALENDAR_SYNC_CALENDAR_ID']
+    operations = [('insert', cw_id) for cw_id in inserts] + \
+                 [('patch', cw_id) for cw_id in patches] + \
+                 [('delete', cw_id) for cw_id in deletes]
+
+    def callback(request_id, response, exception):
+        action, cw_id = request_id.split(':', 1)
+        if action == 'insert' and isinstance(exception, HttpError) and exception.resp.status == 409:
+            # Inserted by a run that died before recording it: map the event, then patch it below
+            course_id = desired[cw_id][0]
+            row = CalendarEventMap(user_id=user_id, google_course_id=course_id, google_coursework_id=cw_id,
+                                   calendar_event_id=event_id(cw_id), content_hash='')
+            db.session.add(row)
+            mapped[cw_id] = row
+            operations.append(('patch', cw_id))
+            return
+        if exception:
+            # An event deleted by the user in Calendar: forget it, it will be re-inserted next run
+            if action != 'insert' and isinstance(exception, HttpError) and exception.resp.status in (404, 410):
+                db.session.delete(mapped.pop(cw_id))
+                if action == 'delete':
+                    state.deleted += 1
+                return
+            state.failed += 1
+            state.last_error = str(exception)[:500]
+            return
+        if action == 'insert':
+            course_id, _, digest = desired[cw_id]
+            row = CalendarEventMap(user_id=user_id, google_course_id=course_id, google_coursework_id=cw_id,
+                                   calendar_event_id=response['id'], content_hash=digest)
+            db.session.add(row)
+            mapped[cw_id] = row
+            state.inserted += 1
+        elif action == 'patch':
+            mapped[cw_id].content_hash = desired[cw_id][2]
+            mapped[cw_id].synced_at = datetime.utcnow()
+            state.patched += 1
+        else:
+            db.session.delete(mapped.pop(cw_id))
+            state.deleted += 1
+
+    start = 0
+    while start < len(operations): # The callback appends patches of events that already existed
+        batch = calendar.new_batch_http_request(callback=callback)
+        for action, cw_id in operations[start:start + CALENDAR_BATCH_LIMIT]:
+            if action == 'insert':
+                request = calendar.events().insert(calendarId=calendar_id,
+                                                   body=dict(desired[cw_id][1], id=event_id(cw_id)))
+            elif action == 'patch':
+                body = desired[cw_id][1]
+                if not mapped[cw_id].content_hash:
+                    body = dict(body, status='confirmed') # Restores the event if the user had deleted it
+                request = calendar.events().patch(calendarId=calendar_id, eventId=mapped[cw_id].calendar_event_id,
+                                                  body=body)
+            else:
+                request = calendar.events().delete(calendarId=calendar_id, eventId=mapped[cw_id].calendar_event_id)
+            batch.add(request, request_id=f'{action}:{cw_id}')
+        start += CALENDAR_BATCH_LIMIT
+        batch.execute()
+        db.session.commit()
+
+def sync_user(user_id):
+    """
+    Runs one incremental sync for a user. Must be called inside an app context.
+
+    Args:
+        user_id (int): The local user ID.
+
+    Returns:
+        CalendarSync: The updated sync state.
+    """
+    user = User.query.get(user_id)
+    state = CalendarSync.query.filter_by(user_id=user_id).first() or CalendarSync(user_id=user_id)
+    state.status = 'running'
+    state.started_at = datetime.utcnow()
+    state.finished_at = None
+    state.inserted = state.patched = state.deleted = state.failed = 0
+    state.last_error = None
+    db.session.add(state)
+    db.session.commit()
+
+    try:
+        credentials = get_credentials(user)
+        classroom = build_service('classroom', 'v1', credentials, user_id)
+        calendar = build_service('calendar', 'v3', credentials, user_id)
+
+        desired, synced_courses, active_courses = fetch_desired_events(classroom, user_id)
+        mapped = {row.google_coursework_id: row for row in CalendarEventMap.query.filter_by(user_id=user_id)}
+        inserts, patches, deletes = plan_changes(desired, mapped, synced_courses, active_courses)
+        apply_changes(calendar, user_id, desired, mapped, inserts, patches, deletes, state)
+
+        state.status = 'partial' if state.failed else 'done'
+    except QuotaExceeded as e:
+        db.session.rollback()
+        state.status = 'deferred'
+        state.last_error = str(e)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Calendar sync failed for user {user_id}: {e}")
+        state.status = 'failed'
+        state.last_error = str(e)[:500]
+
+    state.finished_at = datetime.utcnow()
+    db.session.add(state)
+    db.session.commit()
+    return state
+
+def is_running(user_id):
+    """
+    Checks whether a sync for the user is already in progress.
+
+    Returns:
+        bool: True if a non-stale sync is running.
+    """
+    state = CalendarSync.query.filter_by(user_id=user_id).first()
+    return bool(state and state.status == 'running' and state.started_at
+                and datetime.utcnow() - state.started_at < STALE_RUN)
+
+@jobs.handler('calendar_sync')
+def sync_job(user_id):
+    """Job handler: runs a sync, leaving quota-deferred runs to be retried by the job queue."""
+    state = sync_user(user_id)
+    if state.status == 'deferred':
+        raise QuotaExceeded(state.last_error)
+
+def start_sync(user_id):
+    """
+    Queues a sync for the user unless one is already queued or running.
+
+    Args:
+        user_id (int): The local user ID.
+
+    Returns:
+        bool: True if a new sync was queued.
+    """
+    dedup_key = f'calendar-sync:{user_id}'
+    if is_running(user_id) or jobs.is_pending(dedup_key):
+        return False
+    state = CalendarSync.query.filter_by(user_id=user_id).first() or CalendarSync(user_id=user_id)
+    state.status = 'queued'
+    db.session.add(state)
+    jobs.enqueue('calendar_sync', {'user_id': user_id}, dedup_key=dedup_key)
+    return True
@@ -0,0 +1,318 @@
+"""
+Garbage collection of stale local rows.
+Course overrides, item tags and mutes are keyed by Google IDs and nothing removed them once the
+Classroom side went away, so their tables only grew. A collection reconciles one user's rows with the
+current Google IDs and deletes:
+
+* Course rows (with their tags) of courses that are no longer on the user's roster,
+* ItemTag rows of items that no longer exist in their course,
+* MutedItem rows of coursework that is no longer in any of the user's active courses, or that was
+  turned in more than GC_MUTE_RETENTION_DAYS ago,
+* Attachment rows (the Files page index) of courses that are no longer on the roster.
+
+Rows are only deleted on complete information: a course whose item lists could not all be fetched
+keeps its item tags, and mutes are only checked for existence if the coursework of every active
+course was fetched. Deletes run in transactions of at most GC_BATCH_SIZE rows with a
+GC_BATCH_PAUSE_MS pause in between, so a large collection never holds locks for long.
+
+The cron endpoint queues collections for users not collected within GC_INTERVAL_HOURS, plus a sweep
+of expired FetchLock and CachedFragment rows, of last known good data older than STALE_MAX_AGE_HOURS
+and of item tags whose tag is gone; ``flask gc`` runs them directly and reports what was reclaimed.
+"""
+import json
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import delete, func, or_, select, update
+from app import app, db, jobs, quota, roster, coursework_cache
+from app.google_client import batch_list, classroom_service
+from app.models import (User, Course, CourseTag, ItemTag, MutedItem, FetchLock, CachedFragment, CachedResource,
+                        Attachment, course_tags_map)
+
+# Lists of a course whose items can be tagged: (resource, response key)
+ITEM_LISTS = (('announcements', 'announcements'), ('courseWork', 'courseWork'),
+              ('courseWorkMaterials', 'courseWorkMaterial'))
+
+# Submission states of work that has been handed in
+HANDED_IN = ('TURNED_IN', 'RETURNED')
+
+class Collector:
+    """
+    Deletes rows in bounded, throttled transactions and counts what it reclaimed.
+
+    Attributes:
+        batch_size (int): Rows deleted per transaction.
+        pause (float): Seconds slept between transactions.
+        dry_run (bool): Only count the rows that would be deleted.
+        reclaimed (defaultdict): Table name -> rows deleted.
+    """
+    def __init__(self, batch_size=None, pause_ms=None, dry_run=False):
+        self.batch_size = batch_size or app.config['GC_BATCH_SIZE']
+        self.pause = (app.config['GC_BATCH_PAUSE_MS'] if pause_ms is None else pause_ms) / 1000.0
+        self.dry_run = dry_run
+        self.reclaimed = defaultdict(int)
+        self._transactions = 0
+
+    def _throttle(self):
+        if self._transactions and self.pause:
+            time.sleep(self.pause)
+        self._transactions += 1
+
+    def delete_ids(self, model, ids):
+        """Deletes the rows of ``model`` with the given primary keys, ``batch_size`` at a time."""
+        ids = list(ids)
+        for start in range(0, len(ids), self.batch_size):
+            chunk = ids[start:start + self.batch_size]
+            if self.dry_run:
+                self.reclaimed[model.__tablename__] += len(chunk)
+                continue
+            self._throttle()
+            result = db.session.execute(delete(model).where(model.id.in_(chunk)))
+            db.session.commit()
+            self.reclaimed[model.__tablename__] += result.rowcount
+
+    def delete_where(self, model, *criteria):
+        """Deletes every row of ``model`` matching ``criteria``, ``batch_size`` at a time."""
+        if self.dry_run:
+            self.reclaimed[model.__tablename__] += db.session.scalar(
+                select(func.count()).select_from(model).where(*criteria))
+            return
+        while True:
+            ids = db.session.execute(select(model.id).where(*criteria).limit(self.batch_size)).scalars().all()
+            if not ids:
+                return
+            self._throttle()
+            result = db.session.execute(delete(model).where(model.id.in_(ids)))
+            db.session.commit()
+            self.reclaimed[model.__tablename__] += result.rowcount
+            if len(ids) < self.batch_size:
+                return
+
+    def delete_courses(self, course_ids):
+        """Deletes local Course rows together with their tags, item tags and class tag links."""
+        course_ids = list(course_ids)
+        for start in range(0, len(course_ids), self.batch_size):
+            chunk = course_ids[start:start + self.batch_size]
+            tag_ids = db.session.execute(select(CourseTag.id).where(CourseTag.course_id.in_(chunk))).scalars().all()
+            if tag_ids:
+                self.delete_where(ItemTag, ItemTag.tag_id.in_(tag_ids))
+            if self.dry_run:
+                self.reclaimed[CourseTag.__tablename__] += len(tag_ids)
+                self.reclaimed[Course.__tablename__] += len(chunk)
+                continue
+            self._throttle()
+            db.session.execute(delete(CourseTag).where(CourseTag.course_id.in_(chunk)))
+            db.session.execute(delete(course_tags_map).where(course_tags_map.c.course_id.in_(chunk)))
+            result = db.session.execute(delete(Course).where(Course.id.in_(chunk)))
+            db.session.commit()
+            self.reclaimed[CourseTag.__tablename__] += len(tag_ids)
+            self.reclaimed[Course.__tablename__] += result.rowcount
+
+def list_courses(classroom):
+    """Fetches every course on the user's roster (in any state), following all result pages."""
+    courses, token = [], None
+    while True:
+        response = classroom.courses().list(studentId='me', pageToken=token).execute()
+        courses.extend(response.get('courses', []))
+        token = response.get('nextPageToken')
+        if not token:
+            return courses
+
+def fetch_item_ids(classroom, course_ids):
+    """
+    Fetches the IDs of all announcements, coursework and materials of the given courses.
+
+    Returns:
+        dict: Course ID -> set of item IDs, only for courses whose every list was fetched.
+    """
+    item_ids = {course_id: set() for course_id in course_ids}
+    for resource, key in ITEM_LISTS:
+        results, errors = batch_list(
+            classroom,
+            lambda course_id, token, resource=resource: getattr(classroom.courses(), resource)().list(
+                courseId=course_id, pageToken=token),
+            list(item_ids), key)
+        for course_id, error in errors.items():
+            app.logger.warning(f"GC: keeping item tags of {course_id}, {resource} fetch failed: {error}")
+            item_ids.pop(course_id, None)
+        for course_id, items in results.items():
+            if course_id in item_ids:
+                item_ids[course_id].update(item['id'] for item in items)
+    return item_ids
+
+def stale_mutes(classroom, user_id, active_ids, muted):
+    """
+    Finds a user's mutes of coursework that is gone or was handed in long ago.
+
+    Args:
+        classroom (Resource): Classroom service for the user.
+        user_id (int): The local user ID.
+        active_ids (list): IDs of the user's active courses.
+        muted (dict): MutedItem ID -> Google coursework ID.
+
+    Returns:
+        list: MutedItem IDs to delete.
+    """
+    coursework, cw_errors = batch_list(
+        classroom,
+        lambda course_id, token: classroom.courses().courseWork().list(courseId=course_id, pageToken=token),
+        active_ids, 'courseWork')
+    submissions, _ = coursework_cache.fetch_submissions(classroom, active_ids)
+
+    cutoff = (datetime.utcnow() - timedelta(days=app.config['GC_MUTE_RETENTION_DAYS'])).strftime('%Y-%m-%dT%H:%M:%S')
+    handed_in = set()
+    for course_submissions in submissions.values():
+        for submission in course_submissions:
+            fields = coursework_cache.submission_fields(submission)
+            if fields['state'] in HANDED_IN and fields['turned_in_at'] and fields['turned_in_at'] < cutoff:
+                handed_in.add(submission.get('courseWorkId'))
+    existing = None
+    if cw_errors:
+        app.logger.warning(f"GC: not checking mutes of user {user_id} for deleted coursework, "
+                           f"{len(cw_errors)} course(s) failed")
+    else:
+        existing = {work['id'] for items in coursework.values() for work in items}
+    return [mute_id for mute_id, item_id in muted.items()
+            if item_id in handed_in or (existing is not None and item_id not in existing)]
+
+def collect_user(user, collector):
+    """
+    Reconciles a user's local rows with Google and deletes the stale ones.
+
+    Args:
+        user (User): The user to collect.
+        collector (Collector): Deletes the rows and counts them.
+
+    Raises:
+        Exception: If the course list cannot be fetched; nothing is deleted then.
+    """
+    user_id = user.id
+    classroom = classroom_service(user)
+    with quota.background():
+        # At least the calls of a coursework refresh: the mute check lists coursework and submissions per active course
+        quota.require(user_id, coursework_cache.refresh_cost(user_id))
+        courses = list_courses(classroom)
+    roster_ids = {course['id'] for course in courses}
+
+    gone = [local_id for local_id, course_id in db.session.execute(
+        select(Course.id, Course.google_course_id).where(Course.user_id == user_id)) if course_id not in roster_ids]
+
+    tagged = defaultdict(list)
+    for item_tag_id, item_id, course_id in db.session.execute(
+            select(ItemTag.id, ItemTag.google_item_id, Course.google_course_id)
+            .join(CourseTag, ItemTag.tag_id == CourseTag.id).join(Course, CourseTag.course_id == Course.id)
+            .where(Course.user_id == user_id)):
+        if course_id in roster_ids:
+            tagged[course_id].append((item_tag_id, item_id))
+    muted = dict(db.session.execute(
+        select(MutedItem.id, MutedItem.google_item_id).where(MutedItem.user_id == user_id)).all())
+    # The reads are done; don't hold the transaction open across the Google calls below
+    db.session.commit()
+
+    stale_tags, mutes = [], []
+    with quota.background():
+        if tagged:
+            item_ids = fetch_item_ids(classroom, list(tagged))
+            stale_tags = [item_tag_id for course_id, known in item_ids.items()
+                          for item_tag_id, item_id in tagged[course_id] if item_id not in known]
+        if muted:
+            active_ids = [course['id'] for course in courses if course.get('courseState') == 'ACTIVE']
+            mutes = stale_mutes(classroom, user_id, active_ids, muted)
+
+    collector.delete_courses(gone)
+    collector.delete_ids(ItemTag, stale_tags)
+    collector.delete_ids(MutedItem, mutes)
+    collector.delete_where(Attachment, Attachment.user_id == user_id, Attachment.google_course_id.not_in(roster_ids))
+    if collector.dry_run:
+        return
+    if gone:
+        roster.course_changed(user_id)
+        jobs.enqueue('cleanup_user_tags', {'user_id': user_id}, dedup_key=f'cleanup-user-tags:{user_id}')
+    if mutes:
+        # Unmuted coursework is back in the deadline feed
+        coursework_cache.touch(user_id)
+        db.session.commit()
+
+def collect_expired(collector):
+    """
+    Sweeps expired single-flight locks, stored fragments and last known good data, and item tags
+    whose tag is gone.
+    """
+    now = datetime.utcnow()
+    collector.delete_where(FetchLock, FetchLock.expires_at < now)
+    collector.delete_where(CachedFragment, CachedFragment.expires_at <= now)
+    collector.delete_where(CachedResource, CachedResource.fetched_at <
+                           now - timedelta(hours=app.config['STALE_MAX_AGE_HOURS']))
+    collector.delete_where(ItemTag, ItemTag.tag_id.not_in(select(CourseTag.id)))
+
+@jobs.handler('gc_user', max_attempts=3)
+def collect_user_job(user_id):
+    """Job handler: collects one user's stale rows."""
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    collector = Collector()
+    collect_user(user, collector)
+    app.logger.info(f"GC: reclaimed {dict(collector.reclaimed)} for user {user_id}")
+
+@jobs.handler('gc_expired')
+def collect_expired_job():
+    """Job handler: sweeps expired and dangling rows."""
+    collector = Collector()
+    collect_expired(collector)
+    app.logger.info(f"GC: reclaimed {dict(collector.reclaimed)} expired rows")
+
+@jobs.periodic
+def queue_collections():
+    """
+    Queues collections for users not collected within GC_INTERVAL_HOURS (at most GC_USERS_PER_RUN,
+    least recently collected first) and an expired-row sweep.
+
+    Returns:
+        int: Number of jobs queued.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(hours=app.config['GC_INTERVAL_HOURS'])
+    user_ids = db.session.execute(
+        select(User.id).where(or_(User.collected_at.is_(None), User.collected_at < cutoff))
+        .order_by(User.collected_at.isnot(None), User.collected_at).limit(app.config['GC_USERS_PER_RUN'])).scalars().all()
+    if user_ids:
+        # Marked when queued, so a failing collection waits for the next interval instead of every cron run
+        db.session.execute(update(User).where(User.id.in_(user_ids)).values(collected_at=now))
+        db.session.commit()
+    for user_id in user_ids:
+        jobs.enqueue('gc_user', {'user_id': user_id}, dedup_key=f'gc-user:{user_id}')
+    jobs.enqueue('gc_expired', dedup_key='gc-expired')
+    return len(user_ids) + 1
+
+@app.cli.command('gc')
+@click.option('--email', help='Collect only this user (default: every user, plus expired rows).')
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction (default: GC_BATCH_SIZE).')
+@click.option('--pause-ms', type=float, default=None, help='Pause between transactions (default: GC_BATCH_PAUSE_MS).')
+@click.option('--dry-run', is_flag=True, help='Only report how many rows would be deleted.')
+def gc_command(email, batch_size, pause_ms, dry_run):
+    """Deletes local rows whose Classroom courses, items or submissions are gone."""
+    total = defaultdict(int)
+    users = User.query.filter_by(email=email) if email else User.query.order_by(User.id)
+    for user in users.all():
+        collector = Collector(batch_size, pause_ms, dry_run)
+        try:
+            collect_user(user, collector)
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f'{user.email}: skipped ({e})', err=True)
+            continue
+        if not dry_run:
+            user.collected_at = datetime.utcnow()
+            db.session.commit()
+        click.echo(f'{user.email}: {json.dumps(collector.reclaimed)}')
+        for table, count in collector.reclaimed.items():
+            total[table] += count
+    if not email:
+        collector = Collector(batch_size, pause_ms, dry_run)
+        collect_expired(collector)
+        click.echo(f'expired: {json.dumps(collector.reclaimed)}')
+        for table, count in collector.reclaimed.items():
+            total[table] += count
+    click.echo(f"{'Would reclaim' if dry_run else 'Reclaimed'} {sum(total.values())} rows: {json.dumps(total)}")
@@ -0,0 +1,194 @@
+"""
+Response compression and HTML minification.
+Responses of the types in COMPRESSION_MIMETYPES are compressed with brotli or gzip, whichever the
+client's ``Accept-Encoding`` prefers (brotli on a tie, if the ``brotli`` package is installed).
+Buffered responses smaller than COMPRESSION_MIN_BYTES, or that would not get smaller, are sent as
+they are. Streamed responses (the .ics feed, exports) are compressed incrementally when
+COMPRESSION_STREAMING is set, so they are never buffered as a whole: chunks are collected until
+COMPRESSION_STREAM_FLUSH_BYTES have accumulated (0: every chunk on its own) and then compressed
+and flushed to the client together, which bounds how much is held back without paying a flush for
+each of many small chunks.
+
+With HTML_MINIFY set, the indentation and blank lines of the HTML templates are collapsed once, when
+a template is compiled, so rendered pages are smaller at no cost per request. A run of whitespace
+that contains a line break is replaced by a single line break, which browsers render the same way
+(and which keeps inline scripts intact); ``<pre>`` and ``<textarea>`` contents are left alone.
+"""
+import gzip
+import re
+import zlib
+from flask import request
+from jinja2.ext import Extension
+from app import app
+from app.instrumentation import timed
+
+try:
+    import brotli
+except ImportError: # Optional: without it, responses are gzip-compressed only
+    brotli = None
+
+PRESERVED_BLOCK = re.compile(r'(<(pre|textarea)\b.*?</\2\s*>)', re.IGNORECASE | re.DOTALL)
+LINE_BREAK_WHITESPACE = re.compile(r'[ \t\r\f\v]*\n\s*')
+
+def minify_html(source):
+    """
+    Collapses every run of whitespace containing a line break into a single line break, outside of
+    ``<pre>`` and ``<textarea>`` elements.
+
+    Args:
+        source (str): HTML (or HTML template) source.
+
+    Returns:
+        str: The minified source.
+    """
+    parts = PRESERVED_BLOCK.split(source)
+    # split() returns text, whole preserved block and its tag name, repeating
+    return ''.join(LINE_BREAK_WHITESPACE.sub('\n', part) if i % 3 == 0 else part
+                   for i, part in enumerate(parts) if i % 3 != 2)
+
+class WhitespaceMinifier(Extension):
+    """
+    Jinja extension minifying HTML template sources at compile time (see minify_html()).
+    """
+    def preprocess(self, source, name, filename=None):
+        if app.config['HTML_MINIFY'] and name and name.endswith('.html'):
+            return minify_html(source)
+        return source
+
+app.jinja_env.add_extension(WhitespaceMinifier)
+
+def available_encodings():
+    """Returns the supported content codings, preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def choose_encoding(accept_encodings):
+    """
+    Picks the content coding to use for a request.
+
+    Args:
+        accept_encodings (werkzeug.datastructures.Accept): The parsed Accept-Encoding header.
+
+    Returns:
+        str: 'br', 'gzip', or None to send the response uncompressed.
+    """
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(data, encoding):
+    """
+    Compresses a whole body.
+
+    Args:
+        data (bytes): The body.
+        encoding (str): 'br' or 'gzip'.
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=app.config['COMPRESSION_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=app.config['COMPRESSION_GZIP_LEVEL'], mtime=0)
+
+class StreamCompressor:
+    """
+    Incremental compressor that flushes after every piece of input.
+
+    Attributes:
+        encoding (str): 'br' or 'gzip'.
+    """
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=app.config['COMPRESSION_BROTLI_QUALITY'])
+        else:
+            # wbits 31: gzip container
+            self._compressor = zlib.compressobj(app.config['COMPRESSION_GZIP_LEVEL'], zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        """Compresses a piece of the body and returns everything needed to decode the stream so far."""
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """Ends the stream and returns the remaining bytes."""
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+def compress_stream(chunks, encoding, flush_bytes=None):
+    """
+    Compresses a streamed body chunk by chunk.
+
+    Args:
+        chunks (iterable): The body's encoded (bytes) chunks.
+        encoding (str): 'br' or 'gzip'.
+        flush_bytes (int, optional): Bytes collected before they are compressed and flushed
+            (defaults to COMPRESSION_STREAM_FLUSH_BYTES; 0 flushes every chunk).
+
+    Yields:
+        bytes: Compressed chunks.
+    """
+    if flush_bytes is None:
+        flush_bytes = app.config['COMPRESSION_STREAM_FLUSH_BYTES']
+    compressor = StreamCompressor(encoding)
+    pending, pending_bytes = [], 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending.append(chunk)
+        pending_bytes += len(chunk)
+        if pending_bytes >= flush_bytes:
+            yield compressor.compress(b''.join(pending))
+            pending, pending_bytes = [], 0
+    yield compressor.compress(b''.join(pending)) + compressor.finish()
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.mimetype in app.config['COMPRESSION_MIMETYPES']
+
+@app.after_request
+def compress_response(response):
+    """
+    Compresses the response if its type, size and the client's Accept-Encoding allow it.
+    """
+    if not app.config['COMPRESSION_ENABLED'] or not _compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        if not app.config['COMPRESSION_STREAMING']:
+            return response
+        body = response.response
+        if hasattr(body, 'close'):
+            response.call_on_close(body.close)
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESSION_MIN_BYTES']:
+            return response
+        with timed('compress', encoding):
+            compressed = compress(data, encoding)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is a different byte sequence; only a weak validator still applies
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,302 @@
+"""
+Local cache of each user's Classroom coursework and submissions.
+Whenever coursework or the user's submissions for their active courses are fetched from Google
+(Missing Assignments, calendar sync, deadline feed refreshes), they are written to CachedCourseWork
+and CachedSubmission rows so that features which only need due dates, titles and submission states
+can be served without calling Google again.
+"""
+from datetime import datetime, timedelta
+from app import app, db, quota, jobs
+from app.models import User, Course, CachedCourseList, CachedCourseWork, CachedSubmission, DeadlineFeed
+from app.google_client import get_credentials, build_service, batch_list
+
+def coursework_fields(work, course_name):
+    """
+    Extracts the cached fields of a coursework item.
+
+    Args:
+        work (dict): A Google Classroom coursework item.
+        course_name (str): The (display) name of the item's course.
+
+    Returns:
+        dict: Column values for a CachedCourseWork.
+    """
+    due = work.get('dueDate')
+    due_date = due_time = None
+    if due and all(k in due for k in ('year', 'month', 'day')):
+        due_date = f"{due['year']:04d}-{due['month']:02d}-{due['day']:02d}"
+        time = work.get('dueTime')
+        if time is not None:
+            due_time = f"{time.get('hours', 0):02d}:{time.get('minutes', 0):02d}"
+    return {
+        'course_name': course_name,
+        'title': work.get('title'),
+        'description': work.get('description'),
+        'url': work.get('alternateLink'),
+        'work_type': work.get('workType'),
+        'max_points': work.get('maxPoints'),
+        'due_date': due_date,
+        'due_time': due_time,
+        'creation_time': work.get('creationTime'),
+        'google_update_time': work.get('updateTime') or work.get('creationTime'),
+    }
+
+def submission_fields(submission):
+    """
+    Extracts the cached fields of a student submission.
+
+    Args:
+        submission (dict): A Google Classroom studentSubmission.
+
+    Returns:
+        dict: Column values for a CachedSubmission.
+    """
+    turned_in_at = None
+    for entry in submission.get('submissionHistory', []):
+        state_history = entry.get('stateHistory')
+        if state_history and state_history.get('state') == 'TURNED_IN':
+            turned_in_at = state_history.get('stateTimestamp')
+    if turned_in_at is None and submission.get('state') == 'TURNED_IN':
+        turned_in_at = submission.get('updateTime')
+    return {
+        'state': submission.get('state'),
+        'late': bool(submission.get('late')),
+        'turned_in_at': turned_in_at,
+        'google_update_time': submission.get('updateTime') or submission.get('creationTime'),
+    }
+
+def feed_state(user_id):
+    """
+    Returns (creating if needed) the DeadlineFeed row for a user. The row is added to the session but not committed.
+
+    Args:
+        user_id (int): The local user ID.
+
+    Returns:
+        DeadlineFeed: The user's feed state.
+    """
+    state = DeadlineFeed.query.filter_by(user_id=user_id).first()
+    if state is None:
+        state = DeadlineFeed(user_id=user_id, changed_at=datetime.utcnow())
+        db.session.add(state)
+    return state
+
+def last_refreshed(user_id):
+    """
+    Returns when the user's cache was last refreshed from Google.
+
+    Returns:
+        datetime: The refresh time, or None if it never was.
+    """
+    row = db.session.query(DeadlineFeed.refreshed_at).filter_by(user_id=user_id).first()
+    return row[0] if row else None
+
+def touch(user_id):
+    """
+    Marks the user's cached coursework as changed, e.g. after muting an item.
+    The caller is responsible for committing.
+
+    Args:
+        user_id (int): The local user ID.
+    """
+    feed_state(user_id).changed_at = datetime.utcnow()
+
+def display_names(user_id, courses):
+    """
+    Resolves course names, applying the user's local name overrides.
+
+    Args:
+        user_id (int): The local user ID.
+        courses (list): Google Classroom course dicts.
+
+    Returns:
+        dict: Course ID -> display name.
+    """
+    custom_names = {c.google_course_id: c.custom_name for c in Course.query.filter_by(user_id=user_id)}
+    return {c['id']: custom_names.get(c['id']) or c.get('name') for c in courses}
+
+def _sync_rows(model, user_id, items_by_course, item_key, fields_for, course_names, complete):
+    """
+    Upserts fetched items into a cache table and removes rows that Google no longer returns.
+
+    Returns:
+        int: Number of rows inserted, updated or deleted.
+    """
+    existing = {row.google_coursework_id: row for row in model.query.filter_by(user_id=user_id)}
+    now = datetime.utcnow()
+    changed = 0
+    seen = set()
+    for course_id, items in items_by_course.items():
+        for item in items:
+            cw_id = item.get(item_key)
+            if not cw_id:
+                continue
+            seen.add(cw_id)
+            fields = fields_for(item, course_id)
+            row = existing.get(cw_id)
+            if row is None:
+                row = model(user_id=user_id, google_course_id=course_id, google_coursework_id=cw_id)
+                db.session.add(row)
+            elif all(getattr(row, key) == fields[key] for key in ('google_update_time', 'course_name') if key in fields):
+                continue
+            for key, value in fields.items():
+                setattr(row, key, value)
+            row.cached_at = now
+            changed += 1
+
+    for cw_id, row in existing.items():
+        if cw_id in seen:
+            continue
+        if row.google_course_id in items_by_course or (complete and row.google_course_id not in course_names):
+            db.session.delete(row)
+            changed += 1
+    return changed
+
+def store_coursework(user_id, course_names, coursework, complete=True, submissions=None):
+    """
+    Writes fetched coursework (and optionally the user's submissions) to the cache.
+
+    Items whose updateTime and course name are unchanged are skipped. Cached items that are no
+    longer returned for a fetched course are removed, and when ``complete`` is set, so are items
+    of courses that are no longer active. Courses whose fetch failed (absent from ``coursework``
+    or ``submissions``) keep their cached rows.
+
+    Args:
+        user_id (int): The local user ID.
+        course_names (dict): Course ID -> display name for all of the user's active courses.
+        coursework (dict): Course ID -> list of coursework items, for each successfully fetched course.
+        complete (bool): Whether ``course_names`` lists all of the user's active courses.
+        submissions (dict, optional): Course ID -> list of the user's submissions (all states).
+
+    Returns:
+        int: Number of rows inserted, updated or deleted.
+    """
+    changed = _sync_rows(CachedCourseWork, user_id, coursework, 'id',
+                         lambda work, course_id: coursework_fields(work, course_names.get(course_id)),
+                         course_names, complete)
+    now = datetime.utcnow()
+    state = feed_state(user_id)
+    state.refreshed_at = now
+    # Only coursework changes affect the deadline feed
+    if changed:
+        state.changed_at = now
+    if submissions is not None:
+        changed += _sync_rows(CachedSubmission, user_id, submissions, 'courseWorkId',
+                              lambda submission, course_id: submission_fields(submission),
+                              course_names, complete)
+    db.session.commit()
+    return changed
+
+def safe_store_coursework(user_id, course_names, coursework, complete=True, submissions=None):
+    """
+    Caches coursework without ever failing the calling request.
+
+    Returns:
+        int: Number of rows written, or 0 if caching failed.
+    """
+    try:
+        return store_coursework(user_id, course_names, coursework, complete, submissions)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Error caching coursework for user {user_id}: {e}")
+        return 0
+
+def fetch_active_coursework(classroom):
+    """
+    Fetches all coursework from the user's active courses using paginated batch requests.
+
+    Args:
+        classroom (Resource): Classroom service for the user.
+
+    Returns:
+        tuple: (courses, coursework, errors) where courses is the list of active course dicts,
+            coursework maps course ID -> items and errors maps course ID -> exception.
+    """
+    courses = classroom.courses().list(studentId='me', courseStates=['ACTIVE']).execute().get('courses', [])
+    coursework, errors = batch_list(
+        classroom,
+        lambda course_id, token: classroom.courses().courseWork().list(courseId=course_id, pageToken=token),
+        [c['id'] for c in courses], 'courseWork'
+    )
+    for course_id, error in errors.items():
+        app.logger.warning(f"Error fetching coursework for {course_id}: {error}")
+    return courses, coursework, errors
+
+def fetch_submissions(classroom, course_ids):
+    """
+    Fetches the user's own submissions (in every state) for the given courses using paginated batch requests.
+
+    Args:
+        classroom (Resource): Classroom service for the user.
+        course_ids (list): Google course IDs.
+
+    Returns:
+        tuple: (submissions, errors) mapping course ID -> submissions / exception.
+    """
+    submissions, errors = batch_list(
+        classroom,
+        lambda course_id, token: classroom.courses().courseWork().studentSubmissions().list(
+            courseId=course_id, courseWorkId='-', userId='me', pageToken=token),
+        course_ids, 'studentSubmissions'
+    )
+    for course_id, error in errors.items():
+        app.logger.warning(f"Error fetching submissions for {course_id}: {error}")
+    return submissions, errors
+
+def refresh_cost(user_id, submissions=True):
+    """
+    Estimates the Google calls of a coursework refresh from the user's last course list.
+
+    Args:
+        user_id (int): The local user ID.
+        submissions (bool): Whether submissions are fetched as well as coursework.
+
+    Returns:
+        int: One call for the course list plus one (or two) per active course.
+    """
+    row = CachedCourseList.query.filter_by(user_id=user_id).first()
+    active = sum(1 for course in row.courses if course.get('courseState') == 'ACTIVE') if row else 0
+    return 1 + active * (2 if submissions else 1)
+
+def refresh(user, deadline=None):
+    """
+    Refreshes a user's cached coursework and submissions from Google as background (quota-deferrable) work.
+
+    Args:
+        user (User): The user to refresh.
+        deadline (float, optional): time.monotonic() by which the Google calls must be done.
+
+    Returns:
+        int: Number of cached rows changed.
+
+    Raises:
+        QuotaExceeded: If the quota reserve does not allow a refresh right now.
+        TimeoutError: If the deadline passed before the refresh finished.
+    """
+    classroom = build_service('classroom', 'v1', get_credentials(user), user.id, deadline)
+    with quota.background():
+        quota.require(user.id, refresh_cost(user.id))
+        courses, coursework, _ = fetch_active_coursework(classroom)
+        submissions, _ = fetch_submissions(classroom, [c['id'] for c in courses])
+    return store_coursework(user.id, display_names(user.id, courses), coursework, submissions=submissions)
+
+@jobs.handler('refresh_coursework')
+def refresh_job(user_id):
+    """Job handler: refreshes a user's cached coursework and submissions."""
+    user = db.session.get(User, user_id)
+    if user is not None:
+        refresh(user)
+
+def refresh_in_background(user_id, max_age_minutes):
+    """
+    Queues a cache refresh job if the cache is older than ``max_age_minutes``.
+
+    Args:
+        user_id (int): The local user ID.
+        max_age_minutes (int): Maximum cache age; 0 never refreshes.
+    """
+    if not max_age_minutes:
+        return
+    refreshed_at = last_refreshed(user_id)
+    if refreshed_at is None or datetime.utcnow() - refreshed_at > timedelta(minutes=max_age_minutes):
+        jobs.enqueue('refresh_coursework', {'user_id': user_id}, dedup_key=f'refresh-coursework:{user_id}')
@@ -0,0 +1,247 @@
+"""
+Bulk export of a user's Classroom data and local customizations.
+The export is produced while it is sent: Google list calls are paged one page at a time, records
+are serialized as they arrive and written either as NDJSON or into a ZIP archive built on the fly.
+The response body is a generator, so the WSGI server only asks for the next chunk once it has
+written the previous one to the client, and memory stays constant however large the archive gets.
+"""
+import json
+import zipfile
+from datetime import datetime
+from flask import Response, abort, stream_with_context
+from flask_login import current_user, login_required
+from googleapiclient.errors import HttpError
+from sqlalchemy.orm import lazyload
+from app import app, db
+from app.models import Course, CourseTag, ItemTag, MutedItem, UserTag
+from app.google_client import get_credentials, build_service
+
+# Record type -> file name inside the ZIP archive
+FILE_NAMES = {
+    'course': 'course.ndjson',
+    'announcement': 'announcements.ndjson',
+    'coursework': 'coursework.ndjson',
+    'material': 'materials.ndjson',
+    'submission': 'submissions.ndjson',
+    'course_override': 'course_overrides.ndjson',
+    'user_tag': 'user_tags.ndjson',
+    'course_tag': 'course_tags.ndjson',
+    'item_tag': 'item_tags.ndjson',
+    'muted_item': 'muted_items.ndjson',
+}
+
+def paginate(make_request, key):
+    """
+    Yields the items of a paged Google list call, fetching one page at a time.
+
+    Args:
+        make_request (callable): Called with a page token (None first) and returns the request.
+        key (str): Response field holding the items.
+    """
+    token = None
+    while True:
+        response = make_request(token).execute()
+        yield from response.get(key, [])
+        token = response.get('nextPageToken')
+        if not token:
+            return
+
+def classroom_records(classroom):
+    """
+    Walks all of the user's courses and their announcements, coursework, materials and submissions.
+
+    A failing list call for one course (for example, a feature the course has turned off) is
+    recorded as an 'error' record and the walk continues.
+
+    Yields:
+        tuple: (record type, Google course ID, resource).
+    """
+    courses = paginate(lambda token: classroom.courses().list(studentId='me', pageToken=token), 'courses')
+    for course in courses:
+        course_id = course['id']
+        yield 'course', course_id, course
+        listings = (
+            ('announcement', 'announcements', lambda token: classroom.courses().announcements().list(
+                courseId=course_id, pageToken=token)),
+            ('coursework', 'courseWork', lambda token: classroom.courses().courseWork().list(
+                courseId=course_id, pageToken=token)),
+            ('material', 'courseWorkMaterial', lambda token: classroom.courses().courseWorkMaterials().list(
+                courseId=course_id, pageToken=token)),
+            ('submission', 'studentSubmissions', lambda token: classroom.courses().courseWork().studentSubmissions().list(
+                courseId=course_id, courseWorkId='-', userId='me', pageToken=token)),
+        )
+        for record_type, key, make_request in listings:
+            try:
+                for item in paginate(make_request, key):
+                    yield record_type, course_id, item
+            except HttpError as e:
+                yield 'error', course_id, {'type': record_type, 'status': e.resp.status, 'message': str(e)}
+
+def local_records(user_id):
+    """
+    Yields the user's local customizations: course overrides, tags, item tags and muted items.
+
+    Yields:
+        tuple: (record type, Google course ID or None, record).
+    """
+    # Course tags are eager-loaded by default, which cannot be combined with yield_per
+    courses = Course.query.filter_by(user_id=user_id).options(lazyload(Course.user_tags)).order_by(Course.id)
+    for course in courses.yield_per(200):
+        yield 'course_override', course.google_course_id, {
+            'custom_name': course.custom_name,
+            'custom_section': course.custom_section,
+            'custom_code': course.custom_code,
+            'custom_banner': course.custom_banner,
+            'custom_icon': course.custom_icon,
+            'custom_teacher_name': course.custom_teacher_name,
+            'is_archived': course.is_archived,
+            'display_order': course.display_order,
+        }
+    for tag in UserTag.query.filter_by(user_id=user_id).order_by(UserTag.id).yield_per(200):
+        yield 'user_tag', None, {'name': tag.name, 'courses': [c.google_course_id for c in tag.courses]}
+    course_tags = db.session.query(CourseTag, Course.google_course_id).join(Course, CourseTag.course_id == Course.id) \
+        .filter(Course.user_id == user_id).order_by(CourseTag.id)
+    for tag, course_id in course_tags.yield_per(200):
+        yield 'course_tag', course_id, {'name': tag.name, 'color': tag.color}
+    item_tags = db.session.query(ItemTag, CourseTag.name, Course.google_course_id) \
+        .join(CourseTag, ItemTag.tag_id == CourseTag.id).join(Course, CourseTag.course_id == Course.id) \
+        .filter(Course.user_id == user_id).order_by(ItemTag.id)
+    for item_tag, tag_name, course_id in item_tags.yield_per(200):
+        yield 'item_tag', course_id, {'tag': tag_name, 'google_item_id': item_tag.google_item_id}
+    for muted in MutedItem.query.filter_by(user_id=user_id).order_by(MutedItem.id).yield_per(200):
+        yield 'muted_item', None, {'google_item_id': muted.google_item_id}
+
+def export_records(user):
+    """
+    Yields every exported record for a user: Google data first, then local customizations.
+
+    Yields:
+        tuple: (record type, Google course ID or None, data).
+    """
+    classroom = build_service('classroom', 'v1', get_credentials(user), user.id)
+    yield from classroom_records(classroom)
+    yield from local_records(user.id)
+
+def ndjson_line(record_type, course_id, data):
+    """Serializes one record as a line of NDJSON."""
+    return (json.dumps({'type': record_type, 'course_id': course_id, 'data': data}, separators=(',', ':')) + '\n').encode()
+
+def generate_ndjson(records):
+    """
+    Streams records as NDJSON, in chunks of about EXPORT_CHUNK_BYTES.
+
+    Yields:
+        bytes: Chunks of the document.
+    """
+    chunk_size = app.config['EXPORT_CHUNK_BYTES']
+    chunk = []
+    size = 0
+    for record in records:
+        line = ndjson_line(*record)
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+class _ChunkSink:
+    """
+    Write-only file object that collects what zipfile writes until the generator hands it on.
+
+    It is not seekable, so zipfile streams each entry with a trailing data descriptor instead of
+    seeking back to patch sizes into its header.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+def archive_path(record_type, course_id, data=None):
+    """
+    Returns the file inside the ZIP archive that a record goes into.
+
+    Errors are filed by the listing that failed (e.g. 'errors-coursework.ndjson'): a course's
+    listings fail independently, between the records of other listings, and each file may only be
+    written once.
+    """
+    if record_type in ('course_override', 'user_tag', 'course_tag', 'item_tag', 'muted_item'):
+        return f'local/{FILE_NAMES[record_type]}'
+    if record_type == 'error':
+        return f"courses/{course_id}/errors-{data['type']}.ndjson"
+    return f'courses/{course_id}/{FILE_NAMES[record_type]}'
+
+def generate_zip(records):
+    """
+    Streams records as a ZIP archive with one NDJSON file per course and record type.
+
+    Records of one file arrive together, so each entry is opened once, written and closed before
+    the next begins. A manifest with record counts is added last.
+
+    Yields:
+        bytes: Chunks of the archive, each about EXPORT_CHUNK_BYTES.
+    """
+    chunk_size = app.config['EXPORT_CHUNK_BYTES']
+    sink = _ChunkSink()
+    counts = {}
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        entry, entry_path = None, None
+        try:
+            for record in records:
+                path = archive_path(*record)
+                if path != entry_path:
+                    if entry is not None:
+                        entry.close()
+                    entry, entry_path = archive.open(path, 'w', force_zip64=True), path
+                entry.write(ndjson_line(*record))
+                counts[record[0]] = counts.get(record[0], 0) + 1
+                if sink.size >= chunk_size:
+                    yield sink.drain()
+        finally:
+            if entry is not None:
+                entry.close()
+        archive.writestr('manifest.json', json.dumps({
+            'exported_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'counts': counts,
+        }, indent=2))
+    yield sink.drain()
+
+@app.route('/export.<fmt>')
+@login_required
+def export_data(fmt):
+    """
+    Streams an export of the user's Classroom data and ClassDeck customizations.
+
+    Args:
+        fmt (str): 'ndjson' for one JSON record per line, or 'zip' for an archive with one file
+            per course and record type.
+
+    Returns:
+        Response: A streamed attachment.
+    """
+    if fmt not in ('ndjson', 'zip'):
+        abort(404)
+    records = export_records(current_user._get_current_object())
+    if fmt == 'zip':
+        body, mimetype = generate_zip(records), 'application/zip'
+    else:
+        body, mimetype = generate_ndjson(records), 'application/x-ndjson'
+    filename = f"classdeck-export-{datetime.utcnow().strftime('%Y%m%d')}.{fmt}"
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,171 @@
+"""
+Subscribable iCalendar (.ics) feed of a user's coursework deadlines.
+Calendar apps poll the feed URL, which is authenticated by a secret per-user token. The feed is
+streamed from the local coursework cache and carries ETag/Last-Modified validators, so polls of an
+unchanged feed are answered with a 304 without touching Google.
+"""
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from flask import Response, abort, flash, redirect, request, stream_with_context, url_for
+from flask_login import current_user, login_required
+from werkzeug.http import is_resource_modified
+from app import app, db, coursework_cache
+from app.models import CachedCourseWork, DeadlineFeed, MutedItem
+
+PRODID = '-//ClassDeck//Deadlines//EN'
+
+def feed_url(user_id):
+    """
+    Returns the user's feed URL, creating their secret token on first use.
+
+    Args:
+        user_id (int): The local user ID.
+
+    Returns:
+        str: Absolute URL of the .ics feed.
+    """
+    state = coursework_cache.feed_state(user_id)
+    if not state.token:
+        state.token = secrets.token_urlsafe(24)
+        db.session.commit()
+    return url_for('deadline_feed', token=state.token, _external=True)
+
+def escape_text(value):
+    """Escapes a value for an iCalendar TEXT property (RFC 5545 3.3.11)."""
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+def fold_line(line):
+    """
+    Folds a content line to at most 75 octets per physical line (RFC 5545 3.1).
+
+    Returns:
+        str: The folded line, terminated with CRLF.
+    """
+    parts = []
+    current = ''
+    size = 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > 75:
+            parts.append(current)
+            current, size = ' ', 1
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n'.join(parts) + '\r\n'
+
+def event_lines(row, dtstamp):
+    """
+    Builds the VEVENT for a cached coursework item.
+
+    Items with a due time become point-in-time events; items with only a due date become all-day events.
+
+    Args:
+        row (CachedCourseWork): A cached coursework item with a due date.
+        dtstamp (str): DTSTAMP value for the event.
+
+    Returns:
+        list: Unfolded content lines.
+    """
+    day = row.due_date.replace('-', '')
+    if row.due_time:
+        moment = f"{day}T{row.due_time.replace(':', '')}00Z"
+        start, end = f'DTSTART:{moment}', f'DTEND:{moment}'
+    else:
+        next_day = (datetime.strptime(row.due_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y%m%d')
+        start, end = f'DTSTART;VALUE=DATE:{day}', f'DTEND;VALUE=DATE:{next_day}'
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{row.google_coursework_id}@classdeck',
+        f'DTSTAMP:{dtstamp}',
+        start,
+        end,
+        f"SUMMARY:{escape_text(row.title or 'Assignment')} ({escape_text(row.course_name)})",
+    ]
+    description = row.description or ''
+    if row.url:
+        description = f'{description}\n\n{row.url}'.strip()
+        lines.append(f'URL:{row.url}')
+    if description:
+        lines.append(f'DESCRIPTION:{escape_text(description)}')
+    lines.append('END:VEVENT')
+    return lines
+
+def generate_ics(user_id, changed_at):
+    """
+    Streams the iCalendar document for a user, one event at a time.
+
+    Args:
+        user_id (int): The local user ID.
+        changed_at (datetime): When the user's feed last changed (used as DTSTAMP).
+
+    Yields:
+        str: Folded content lines.
+    """
+    dtstamp = changed_at.strftime('%Y%m%dT%H%M%SZ')
+    for line in ('BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN',
+                 'METHOD:PUBLISH', 'X-WR-CALNAME:ClassDeck Deadlines',
+                 f"REFRESH-INTERVAL;VALUE=DURATION:PT{max(app.config['ICS_FEED_REFRESH_MINUTES'], 15)}M"):
+        yield fold_line(line)
+
+    muted = db.session.query(MutedItem.google_item_id).filter(MutedItem.user_id == user_id)
+    rows = CachedCourseWork.query.filter(
+        CachedCourseWork.user_id == user_id,
+        CachedCourseWork.due_date.isnot(None),
+        CachedCourseWork.google_coursework_id.notin_(muted)
+    ).order_by(CachedCourseWork.due_date).yield_per(200)
+    for row in rows:
+        yield ''.join(fold_line(line) for line in event_lines(row, dtstamp))
+
+    yield fold_line('END:VCALENDAR')
+
+@app.route('/feed/<token>.ics')
+def deadline_feed(token):
+    """
+    Serves a user's deadlines as an iCalendar feed, authenticated by the token in the URL.
+
+    Supports conditional requests: If-None-Match/If-Modified-Since matching the current
+    ETag/Last-Modified yield a 304 with no body.
+
+    Args:
+        token (str): The user's secret feed token.
+
+    Returns:
+        Response: A streamed text/calendar response, or 304 Not Modified.
+    """
+    state = DeadlineFeed.query.filter_by(token=token).first()
+    if state is None:
+        abort(404)
+
+    # Calendar apps poll on a timer; a stale cache is refreshed by a job, and a later poll picks it up
+    coursework_cache.refresh_in_background(state.user_id, app.config['ICS_FEED_REFRESH_MINUTES'])
+    changed_at = state.changed_at.replace(microsecond=0)
+    etag = hashlib.sha256(f'{state.user_id}:{token}:{changed_at.isoformat()}'.encode()).hexdigest()[:32]
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=changed_at):
+        response = Response(status=304)
+    else:
+        response = Response(stream_with_context(generate_ics(state.user_id, changed_at)),
+                            mimetype='text/calendar')
+        response.headers['Content-Disposition'] = 'inline; filename="classdeck-deadlines.ics"'
+    response.set_etag(etag)
+    response.last_modified = changed_at
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/feed/reset', methods=['POST'])
+@login_required
+def reset_deadline_feed():
+    """
+    Replaces the user's feed token, invalidating the old feed URL.
+
+    Returns:
+        redirect: Redirects to the missing assignments page.
+    """
+    state = coursework_cache.feed_state(current_user.id)
+    state.token = secrets.token_urlsafe(24)
+    db.session.commit()
+    flash('Your calendar feed link has been reset. Update your calendar subscriptions with the new link.', 'success')
+    return redirect(url_for('missing_assignments'))
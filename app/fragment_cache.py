@@ -0,0 +1,202 @@
+"""
+Fragment caching for templates.
+Adds a ``{% cache %}`` block to Jinja. The block's arguments form the cache key and should
+identify the content version it renders, for example::
+
+    {% cache 'course-card', current_user.id, course.id, course.updateTime, course.revision, tag_names %}
+        ...
+    {% endcache %}
+
+On a hit the stored HTML is emitted without evaluating the body, so a warm render of a large
+dashboard or a long stream is mostly string concatenation. Fragments live in a bounded in-process
+LRU. With FRAGMENT_CACHE_SHARED set, fragments are also stored in the CachedFragment table,
+grouped by page (user and path): the first LRU miss of a request loads all of the page's stored
+fragments with one query, so processes that start cold (e.g. serverless) render warm. Fragments
+rendered during a request are written to the table in one transaction after the response. Entries are never invalidated explicitly: a new version means a new key,
+and old ones fall out of the LRU (or expire from the table).
+"""
+import hashlib
+import random
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from flask import g, has_request_context, request
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from app import app, db
+from app.admin import admin_required
+from app.models import CachedFragment
+
+class FragmentCache:
+    """
+    Bounded, thread-safe LRU of rendered fragments.
+
+    Attributes:
+        max_entries (int): Number of fragments kept.
+        entries (OrderedDict): Key -> HTML, least recently used first.
+        stats (dict): Hit/miss counters.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = defaultdict(int)
+
+    def get(self, key):
+        with self.lock:
+            html = self.entries.get(key)
+            if html is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return html
+
+    def put(self, key, html):
+        with self.lock:
+            self.entries[key] = html
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def metrics(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'max_entries': self.max_entries, 'stats': dict(self.stats)}
+
+cache = FragmentCache(app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+
+def shared_key(value):
+    """Returns the SHA-256 hex digest used to store a key in the shared store."""
+    return hashlib.sha256(value.encode()).hexdigest()
+
+def page_key():
+    """Returns the shared-store group of the current page: the user and the request path."""
+    return shared_key(f'{current_user.get_id()} {request.path}')
+
+def load_page():
+    """
+    Loads every stored fragment of the current page into the LRU with a single query.
+
+    Returns:
+        int: Number of fragments loaded.
+    """
+    try:
+        with db.engine.connect() as conn:
+            rows = conn.execute(select(CachedFragment.key, CachedFragment.html).where(
+                CachedFragment.page == page_key(), CachedFragment.expires_at > datetime.utcnow())).all()
+    except SQLAlchemyError as e:
+        app.logger.warning(f"Fragment cache store unavailable: {e}")
+        return 0
+    for key, html in rows:
+        cache.put(key, html)
+    cache.count('shared_loads')
+    return len(rows)
+
+def write_page(page, fragments):
+    """
+    Writes a page's newly rendered fragments to the shared store in one transaction, and
+    occasionally removes expired ones.
+
+    Args:
+        page (str): The page's shared-store group.
+        fragments (dict): Key -> HTML.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=app.config['FRAGMENT_CACHE_SHARED_TTL_SECONDS'])
+    try:
+        with db.engine.begin() as conn:
+            existing = set(conn.execute(select(CachedFragment.key).where(
+                CachedFragment.page == page, CachedFragment.key.in_(list(fragments)))).scalars())
+            rows = [{'page': page, 'key': key, 'html': html, 'expires_at': expires_at}
+                    for key, html in fragments.items() if key not in existing]
+            if rows:
+                conn.execute(CachedFragment.__table__.insert(), rows)
+            if random.random() < 0.01:
+                conn.execute(delete(CachedFragment).where(CachedFragment.expires_at <= now))
+        cache.count('shared_writes')
+    except SQLAlchemyError as e:
+        app.logger.warning(f"Fragment cache store unavailable: {e}")
+
+@app.teardown_request
+def flush_shared_writes(exc=None):
+    fragments = g.pop('fragment_writes', None)
+    if fragments:
+        write_page(g.pop('fragment_page'), fragments)
+
+def render_cached(key, render):
+    """
+    Returns the cached HTML for ``key``, rendering and storing it on a miss.
+
+    Args:
+        key (str): Content-version key.
+        render (callable): Renders the fragment.
+
+    Returns:
+        Markup: The fragment's HTML.
+    """
+    if not app.config['FRAGMENT_CACHE_ENABLED']:
+        return render()
+    shared = app.config['FRAGMENT_CACHE_SHARED'] and has_request_context()
+    html = cache.get(key)
+    if html is None and shared and 'fragment_page' not in g:
+        # First miss of the request: fetch the page's fragments from the shared store at once
+        g.fragment_page = page_key()
+        if load_page():
+            html = cache.get(key)
+    if html is None:
+        html = str(render())
+        cache.put(key, html)
+        if shared:
+            g.setdefault('fragment_writes', {})[key] = html
+    return Markup(html)
+
+class FragmentCacheExtension(Extension):
+    """
+    Jinja extension providing ``{% cache key, ... %}...{% endcache %}``.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        # The template's name and source keep equal keys in different templates (and in different
+        # versions of a template, which matters for fragments kept in the shared store) apart
+        key = nodes.Tuple([nodes.Const(parser.name), nodes.Const(self._version(parser.name)), *parts], 'load')
+        return nodes.CallBlock(self.call_method('_render', [key]), [], [], body).set_lineno(lineno)
+
+    def _version(self, name):
+        try:
+            source, filename, _ = self.environment.loader.get_source(self.environment, name)
+        except Exception:
+            return None
+        # Hash what is compiled, i.e. after other extensions (such as minification) have run
+        source = self.environment.preprocess(source, name, filename)
+        return hashlib.sha256(source.encode()).hexdigest()[:12]
+
+    def _render(self, key, caller):
+        # repr() makes any key part usable, including lists and undefined values
+        return render_cached(repr(key), caller)
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+
+@app.route('/admin/metrics/fragments')
+@admin_required
+def fragment_metrics():
+    """
+    Exposes fragment cache size and hit rates (admin only).
+
+    Returns:
+        dict: JSON metrics.
+    """
+    return cache.metrics()
@@ -0,0 +1,241 @@
+"""
+Helpers for talking to Google APIs on behalf of a user.
+Builds OAuth credentials from the stored user record and constructs API service objects
+whose HTTP transport can be redirected to a local Classroom API emulator.
+"""
+import time
+from urllib.parse import urlsplit
+import httplib2
+import google_auth_httplib2
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from app import app
+from app.instrumentation import timed
+from app import quota, singleflight
+
+# Hosts used by the Google APIs this app talks to. When GOOGLE_API_ENDPOINT is set,
+# requests to these prefixes are rewritten to the emulator instead.
+CLASSROOM_URL_PREFIX = 'https://classroom.googleapis.com/'
+GOOGLE_URL_PREFIXES = (
+    CLASSROOM_URL_PREFIX,
+    'https://www.googleapis.com/',
+    'https://oauth2.googleapis.com/',
+)
+
+def get_credentials(user):
+    """
+    Builds Google OAuth credentials from a user's stored (decrypted) tokens.
+
+    Args:
+        user (User): The user whose tokens should be used.
+
+    Returns:
+        google.oauth2.credentials.Credentials: Credentials for the user.
+    """
+    return Credentials(
+        token=user.access_token,
+        refresh_token=user.refresh_token,
+        expiry=user.token_expiry,
+        token_uri=user.token_uri,
+        client_id=user.client_id,
+        client_secret=user.client_secret,
+        scopes=user.scopes.split(',') if user.scopes else []
+    )
+
+def is_batch(uri, method):
+    """Returns True if the request is a Google batch request."""
+    return method == 'POST' and urlsplit(uri).path.strip('/').startswith('batch')
+
+def batch_size(body):
+    """Returns the number of calls contained in a batch request body."""
+    if not body:
+        return 0
+    return body.count(b'application/http' if isinstance(body, bytes) else 'application/http')
+
+def call_label(uri, method, body):
+    """
+    Describes a Google HTTP request for instrumentation.
+
+    Args:
+        uri (str): The request URL.
+        method (str): The HTTP method.
+        body (str or bytes): The request body.
+
+    Returns:
+        tuple: (metric name, human readable label). Batch requests are reported
+        under 'google-batch' with the number of calls they contain.
+    """
+    if is_batch(uri, method):
+        return 'google-batch', f'batch of {batch_size(body)}'
+    return 'google', f'{method} {urlsplit(uri).path}'
+
+class GoogleHttp(httplib2.Http):
+    """
+    httplib2 transport used for all Google API traffic.
+
+    Rewrites Google API URLs to GOOGLE_API_ENDPOINT when an emulator is configured,
+    so that service calls, batch requests and token refreshes all reach the emulator.
+    Classroom calls are charged against the user's quota budget.
+    Identical GET calls in flight for the same user share one response (see app.singleflight).
+    With a deadline, each call's socket timeout is cut to the time left and calls made past it
+    fail with TimeoutError.
+
+    Attributes:
+        endpoint (str): Base URL of the emulator, or None to talk to Google.
+        user_id (int): The local user the calls are made for, for quota accounting.
+        deadline (float): time.monotonic() by which all calls must be done, or None without one.
+    """
+    def __init__(self, endpoint=None, user_id=None, deadline=None, **kwargs):
+        super().__init__(**kwargs)
+        self.endpoint = endpoint.rstrip('/') + '/' if endpoint else None
+        self.user_id = user_id
+        self.deadline = deadline
+        self.base_timeout = self.timeout
+
+    def limit_timeout(self):
+        """
+        Cuts the socket timeout of new and open connections to the time left before the deadline.
+
+        Raises:
+            TimeoutError: If the deadline has passed.
+        """
+        left = self.deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError('Google call deadline passed')
+        self.timeout = min(self.base_timeout, left) if self.base_timeout else left
+        for conn in self.connections.values():
+            conn.timeout = self.timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(self.timeout)
+
+    def rewrite_uri(self, uri):
+        """
+        Maps a Google API URL onto the configured emulator endpoint.
+
+        Args:
+            uri (str): The URL the client library wants to call.
+
+        Returns:
+            str: The URL that should actually be requested.
+        """
+        if self.endpoint:
+            for prefix in GOOGLE_URL_PREFIXES:
+                if uri.startswith(prefix):
+                    return self.endpoint + uri[len(prefix):]
+        return uri
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        metric, label = call_label(uri, method, body)
+        if method == 'GET' and self.user_id is not None and app.config['SINGLE_FLIGHT_ENABLED']:
+            # Identical calls already in flight for this user share one response
+            return singleflight.do(self.user_id, uri, lambda: self._send(uri, method, body, headers, metric, label,
+                                                                         *args, **kwargs), label, self.deadline)
+        return self._send(uri, method, body, headers, metric, label, *args, **kwargs)
+
+    def _send(self, uri, method, body, headers, metric, label, *args, **kwargs):
+        if self.deadline is not None:
+            self.limit_timeout()
+        batch = is_batch(uri, method)
+        if uri.startswith(CLASSROOM_URL_PREFIX):
+            quota.charge(self.user_id, batch_size(body) if batch else 1)
+        with timed(metric, label):
+            resp, content = super().request(self.rewrite_uri(uri), method, body, headers, *args, **kwargs)
+        if resp.status == 429 or (batch and content and b'HTTP/1.1 429' in content):
+            quota.rate_limited(self.user_id)
+        return resp, content
+
+def build_http(credentials, user_id=None, deadline=None):
+    """
+    Creates an authorized HTTP transport for the given credentials.
+
+    Args:
+        credentials (Credentials): The OAuth credentials to authorize requests with.
+        user_id (int, optional): The local user ID, for quota accounting.
+        deadline (float, optional): time.monotonic() by which all calls must be done.
+
+    Returns:
+        google_auth_httplib2.AuthorizedHttp: The authorized transport.
+    """
+    http = GoogleHttp(
+        endpoint=app.config.get('GOOGLE_API_ENDPOINT'),
+        user_id=user_id,
+        deadline=deadline,
+        timeout=app.config.get('GOOGLE_HTTP_TIMEOUT')
+    )
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+
+def build_service(name, version, credentials, user_id=None, deadline=None):
+    """
+    Builds a Google API service object using the bundled discovery documents.
+
+    Args:
+        name (str): The API name (e.g., 'classroom').
+        version (str): The API version (e.g., 'v1').
+        credentials (Credentials): The OAuth credentials to use.
+        user_id (int, optional): The local user ID, for quota accounting.
+        deadline (float, optional): time.monotonic() by which all calls must be done; calls
+            past it raise TimeoutError.
+
+    Returns:
+        googleapiclient.discovery.Resource: The service object.
+    """
+    return build(name, version, http=build_http(credentials, user_id, deadline), cache_discovery=False,
+                 static_discovery=True)
+
+def classroom_service(user):
+    """
+    Builds a Classroom API service for a user.
+
+    Args:
+        user (User): The user to act on behalf of.
+
+    Returns:
+        googleapiclient.discovery.Resource: The Classroom v1 service object.
+    """
+    return build_service('classroom', 'v1', get_credentials(user), user.id)
+
+def batch_list(service, make_request, request_ids, key, batch_limit=50):
+    """
+    Runs a paginated list call for many IDs using batch requests.
+
+    The first page for every ID is fetched in batches of ``batch_limit``; IDs whose responses
+    carry a nextPageToken are fetched again in follow-up batches until exhausted.
+
+    Args:
+        service (Resource): The API service whose batch endpoint should be used.
+        make_request (callable): ``make_request(request_id, page_token)`` returning an HttpRequest.
+        request_ids (iterable): IDs to fetch (e.g., course IDs); used as batch request IDs.
+        key (str): Response key holding the items (e.g., 'courseWork').
+        batch_limit (int): Maximum number of calls per batch.
+
+    Returns:
+        tuple: (results, errors) where results maps ID -> list of items for every ID that
+        succeeded, and errors maps ID -> exception for IDs that failed.
+    """
+    results = {}
+    errors = {}
+    pending = {request_id: None for request_id in request_ids}
+
+    while pending:
+        next_pending = {}
+
+        def callback(request_id, response, exception):
+            if exception:
+                errors[request_id] = exception
+                results.pop(request_id, None)
+                return
+            results.setdefault(request_id, []).extend(response.get(key, []))
+            if response.get('nextPageToken'):
+                next_pending[request_id] = response['nextPageToken']
+
+        items = list(pending.items())
+        # Background batches are cut to what the quota reserve lets through at once
+        limit = quota.batch_limit(batch_limit)
+        for start in range(0, len(items), limit):
+            batch = service.new_batch_http_request(callback=callback)
+            for request_id, page_token in items[start:start + limit]:
+                batch.add(make_request(request_id, page_token), request_id=request_id)
+            batch.execute()
+        pending = {request_id: token for request_id, token in next_pending.items() if request_id not in errors}
+
+    return results, errors
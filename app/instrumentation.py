@@ -0,0 +1,213 @@
+"""
+Per-request timing instrumentation.
+Times Google API calls and batches, SQL statements, credential decryption and template
+rendering, and reports the breakdown as a ``Server-Timing`` response header and as one
+structured JSON log line per request. Everything is controlled by the INSTRUMENTATION_* settings;
+when disabled no hooks are registered.
+"""
+import hashlib
+import json
+import logging
+import time
+from contextlib import contextmanager
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+logger = logging.getLogger('classdeck.requests')
+
+ENABLED = bool(app.config.get('INSTRUMENTATION_ENABLED'))
+
+# Order (and descriptions) of metrics in the Server-Timing header
+METRICS = [
+    ('google', 'Google API calls'),
+    ('google-batch', 'Google API batches'),
+    ('google-wait', 'Waits for coalesced Google calls'),
+    ('budget', 'Waits for Google calls within the latency budget'),
+    ('sql', 'SQL statements'),
+    ('decrypt', 'Credential decryption'),
+    ('render', 'Template rendering'),
+    ('compress', 'Response compression'),
+]
+
+class RequestTimings:
+    """
+    Accumulates timings for a single request.
+
+    Attributes:
+        start (float): perf_counter() value at the start of the request.
+        metrics (dict): Metric name -> [count, total milliseconds].
+        slow_calls (list): Individual calls slower than INSTRUMENTATION_SLOW_CALL_MS.
+    """
+    def __init__(self, slow_ms):
+        self.start = time.perf_counter()
+        self.slow_ms = slow_ms
+        self.metrics = {}
+        self.slow_calls = []
+
+    def add(self, metric, ms, label=None):
+        """
+        Records one timed operation.
+
+        Args:
+            metric (str): Metric name (e.g., 'google', 'sql').
+            ms (float): Duration in milliseconds.
+            label (str, optional): Description of the call, used when flagging slow calls.
+        """
+        entry = self.metrics.setdefault(metric, [0, 0.0])
+        entry[0] += 1
+        entry[1] += ms
+        if label is not None and ms >= self.slow_ms:
+            self.slow_calls.append({'metric': metric, 'call': label[:200], 'ms': round(ms, 1)})
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+def current_timings():
+    """
+    Returns the timings collector for the current request.
+
+    Returns:
+        RequestTimings: The collector, or None if instrumentation is disabled or
+        there is no request in progress (e.g., background threads).
+    """
+    if not ENABLED or not has_request_context():
+        return None
+    return g.get('_timings')
+
+@contextmanager
+def timed(metric, label=None):
+    """
+    Context manager that records the duration of its body under ``metric``.
+
+    Args:
+        metric (str): Metric name.
+        label (str, optional): Description of the call for slow-call flags.
+    """
+    timings = current_timings()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(metric, (time.perf_counter() - start) * 1000, label)
+
+def user_hash(user_id):
+    """
+    Returns a short, non-reversible identifier for a user for use in logs.
+
+    Args:
+        user_id (int): The local user ID.
+
+    Returns:
+        str: A 12 character hex digest, keyed with the app's SECRET_KEY.
+    """
+    key = f"{app.config['SECRET_KEY']}:{user_id}".encode()
+    return hashlib.sha256(key).hexdigest()[:12]
+
+def server_timing_header(timings, total_ms):
+    """
+    Formats the collected timings as a Server-Timing header value.
+
+    Args:
+        timings (RequestTimings): The request's timings.
+        total_ms (float): Total time spent handling the request.
+
+    Returns:
+        str: The header value.
+    """
+    parts = []
+    for metric, description in METRICS:
+        if metric in timings.metrics:
+            count, ms = timings.metrics[metric]
+            parts.append(f'{metric};dur={ms:.1f};desc="{description} ({count})"')
+    parts.append(f'total;dur={total_ms:.1f}')
+    return ', '.join(parts)
+
+def log_record(timings, response, total_ms):
+    """
+    Builds the structured log record for a finished request.
+
+    Returns:
+        dict: JSON-serializable record.
+    """
+    record = {
+        'event': 'request',
+        'route': request.endpoint,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'user': user_hash(current_user.id) if current_user and current_user.is_authenticated else None,
+        'total_ms': round(total_ms, 1),
+        'slow': total_ms >= app.config['INSTRUMENTATION_SLOW_REQUEST_MS'],
+        'slow_calls': timings.slow_calls,
+    }
+    for metric, _ in METRICS:
+        count, ms = timings.metrics.get(metric, (0, 0.0))
+        key = metric.replace('-', '_')
+        record[f'{key}_count'] = count
+        record[f'{key}_ms'] = round(ms, 1)
+    return record
+
+def _before_request():
+    g._timings = RequestTimings(app.config['INSTRUMENTATION_SLOW_CALL_MS'])
+
+def _after_request(response):
+    timings = g.pop('_timings', None)
+    if timings is None:
+        return response
+    total_ms = timings.elapsed_ms()
+    if app.config['INSTRUMENTATION_SERVER_TIMING']:
+        response.headers['Server-Timing'] = server_timing_header(timings, total_ms)
+    if app.config['INSTRUMENTATION_LOG']:
+        logger.info(json.dumps(log_record(timings, response, total_ms)))
+    return response
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context: a statement that raises never reaches
+    # after_cursor_execute, and its start must not outlive it on the pooled connection
+    if context is not None:
+        context._classdeck_query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_classdeck_query_start', None)
+    if start is None:
+        return
+    timings = current_timings()
+    if timings is not None:
+        timings.add('sql', (time.perf_counter() - start) * 1000, ' '.join(statement.split()))
+
+def _before_render_template(sender, template, context, **extra):
+    # A stack, so renders nested in another render (or several per request) are timed separately
+    if current_timings() is not None:
+        g.setdefault('_render_starts', []).append((template, time.perf_counter()))
+
+def _template_rendered(sender, template, context, **extra):
+    timings = current_timings()
+    starts = g.get('_render_starts')
+    # Skip renders that failed before template_rendered was sent
+    while starts:
+        started, start = starts.pop()
+        if started is template:
+            if timings is not None:
+                timings.add('render', (time.perf_counter() - start) * 1000, template.name)
+            return
+
+if ENABLED:
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
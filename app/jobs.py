@@ -0,0 +1,363 @@
+"""
+Database-backed background job queue.
+Request handlers enqueue slow work (Google lookups, cache refreshes, cleanup) as Job rows and return
+immediately. Jobs are leased by workers with a conditional UPDATE, so any number of worker threads
+and processes can share the table safely; failed jobs are retried with exponential backoff, and a
+dedup key keeps the same work from being queued twice.
+
+Jobs are run by the ``flask worker`` command, by the ``/cron/jobs`` endpoint (for platforms like
+Vercel that only offer scheduled HTTP calls) and, unless JOBS_RUN_IN_PROCESS is off, by a short-lived
+thread in the web process that drains the queue after each enqueue.
+"""
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import click
+from flask import abort, request
+from sqlalchemy import and_, or_, update
+from sqlalchemy.exc import IntegrityError
+from app import app, db, quota
+from app.models import Job
+from app.quota import QuotaExceeded
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# kind -> (function, max_attempts)
+HANDLERS = {}
+
+# Functions called by the cron endpoint to enqueue recurring work
+PERIODIC = []
+
+class PermanentError(Exception):
+    """Raised by a job handler to fail the job without further retries."""
+
+def handler(kind, max_attempts=None):
+    """
+    Registers a function as the handler for a kind of job.
+
+    The function is called with the job payload as keyword arguments, inside an app context and
+    with Google calls marked as background quota work.
+
+    Args:
+        kind (str): The job kind.
+        max_attempts (int, optional): Attempts before giving up (defaults to JOBS_MAX_ATTEMPTS).
+    """
+    def decorator(func):
+        HANDLERS[kind] = (func, max_attempts)
+        return func
+    return decorator
+
+def periodic(func):
+    """Registers a function, called on every cron run, that enqueues recurring jobs and returns how many."""
+    PERIODIC.append(func)
+    return func
+
+def _due():
+    # Queued jobs whose time has come, and running jobs whose worker lost its lease
+    now = datetime.utcnow()
+    return or_(and_(Job.status == QUEUED, Job.run_at <= now),
+               and_(Job.status == RUNNING, Job.locked_until < now))
+
+def is_pending(dedup_key):
+    """Returns True if a job with the given dedup key is queued or running."""
+    return db.session.query(Job.id).filter_by(dedup_key=dedup_key).first() is not None
+
+def enqueue(kind, payload=None, dedup_key=None, delay=0, max_attempts=None):
+    """
+    Adds a job to the queue. Commits the current session.
+
+    Args:
+        kind (str): A registered job kind.
+        payload (dict, optional): JSON-serializable keyword arguments for the handler.
+        dedup_key (str, optional): If a job with this key is already queued or running, it is
+            returned instead of adding a new one.
+        delay (float): Seconds to wait before the job may run.
+        max_attempts (int, optional): Overrides the handler's attempt limit.
+
+    Returns:
+        Job: The new or already queued job.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    if dedup_key:
+        existing = Job.query.filter_by(dedup_key=dedup_key).first()
+        if existing:
+            return existing
+
+    job = Job(kind=kind, payload=json.dumps(payload or {}), dedup_key=dedup_key,
+              run_at=datetime.utcnow() + timedelta(seconds=delay),
+              max_attempts=max_attempts or HANDLERS[kind][1] or app.config['JOBS_MAX_ATTEMPTS'])
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request enqueued the same dedup key concurrently
+        db.session.rollback()
+        return Job.query.filter_by(dedup_key=dedup_key).first()
+
+    if delay <= 0:
+        _kick()
+    return job
+
+def claim(worker_id, limit):
+    """
+    Leases up to ``limit`` due jobs for a worker.
+
+    Each job is taken with a conditional UPDATE that only succeeds if the job is still due, so
+    concurrent workers never run the same job.
+
+    Args:
+        worker_id (str): Identifies the worker taking the lease.
+        limit (int): Maximum number of jobs to claim.
+
+    Returns:
+        list: IDs of the claimed jobs.
+    """
+    candidates = [job_id for (job_id,) in db.session.query(Job.id).filter(_due())
+                  .order_by(Job.run_at).limit(limit * 2)]
+    lease_until = datetime.utcnow() + timedelta(seconds=app.config['JOBS_LEASE_SECONDS'])
+    claimed = []
+    for job_id in candidates:
+        if len(claimed) >= limit:
+            break
+        result = db.session.execute(
+            update(Job).where(Job.id == job_id, _due())
+            .values(status=RUNNING, locked_by=worker_id, locked_until=lease_until, attempts=Job.attempts + 1)
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    return claimed
+
+def backoff(attempts):
+    """Returns the delay in seconds before retry number ``attempts``, with jitter."""
+    delay = min(app.config['JOBS_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1), app.config['JOBS_RETRY_MAX_SECONDS'])
+    return delay * random.uniform(0.5, 1.0)
+
+def _finish(job_id, worker_id, **values):
+    # Only the lease holder may record the outcome
+    db.session.execute(update(Job).where(Job.id == job_id, Job.locked_by == worker_id)
+                       .values(locked_by=None, locked_until=None, **values))
+    db.session.commit()
+
+def run_job(job_id, worker_id):
+    """
+    Runs a claimed job and records its outcome. Must be called inside an app context.
+
+    Args:
+        job_id (int): The job to run.
+        worker_id (str): The worker holding the lease.
+
+    Returns:
+        str: 'done', 'retried', 'deferred' or 'failed'.
+    """
+    job = db.session.get(Job, job_id)
+    if job is None or job.locked_by != worker_id:
+        return 'failed'
+    kind, attempts, max_attempts, deferrals = job.kind, job.attempts, job.max_attempts, job.deferrals or 0
+    now = datetime.utcnow()
+    try:
+        if attempts > max_attempts:
+            raise PermanentError('Lease expired too many times')
+        func = HANDLERS.get(kind, (None, None))[0]
+        if func is None:
+            raise PermanentError(f'No handler registered for {kind}')
+        with quota.background():
+            func(**json.loads(job.payload or '{}'))
+    except QuotaExceeded as e:
+        db.session.rollback()
+        if deferrals >= app.config['JOBS_MAX_DEFERRALS']:
+            # The budget never had room for it; more retries would only spend quota on its first calls
+            app.logger.error(f"Job {job_id} ({kind}) failed after {deferrals} quota deferrals: {e}")
+            _finish(job_id, worker_id, status=FAILED, dedup_key=None, last_error=f'QuotaExceeded: {e}',
+                    finished_at=now)
+            return 'failed'
+        # Not the job's fault: try again once the buckets have refilled, without using up an attempt
+        _finish(job_id, worker_id, status=QUEUED, attempts=attempts - 1, deferrals=deferrals + 1, last_error=str(e),
+                run_at=now + timedelta(seconds=app.config['JOBS_QUOTA_RETRY_SECONDS']))
+        return 'deferred'
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'[:1000]
+        if isinstance(e, PermanentError) or attempts >= max_attempts:
+            app.logger.warning(f"Job {job_id} ({kind}) failed after {attempts} attempt(s): {error}")
+            _finish(job_id, worker_id, status=FAILED, dedup_key=None, last_error=error, finished_at=now)
+            return 'failed'
+        _finish(job_id, worker_id, status=QUEUED, last_error=error,
+                run_at=now + timedelta(seconds=backoff(attempts)))
+        return 'retried'
+
+    _finish(job_id, worker_id, status=DONE, dedup_key=None, last_error=None, finished_at=datetime.utcnow())
+    return 'done'
+
+class Worker:
+    """
+    Claims due jobs and runs them on a thread pool.
+
+    Attributes:
+        worker_id (str): Unique name of this worker, recorded on leased jobs.
+        threads (int): Number of jobs run concurrently.
+        poll_interval (float): Seconds to wait between polls when the queue is empty.
+        stats (dict): Counts of job outcomes.
+    """
+    def __init__(self, threads, poll_interval=1.0):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stats = {'done': 0, 'retried': 0, 'deferred': 0, 'failed': 0}
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    def stop(self):
+        """Stops claiming new jobs; running jobs are allowed to finish."""
+        self.stopping.set()
+
+    def _run(self, job_id):
+        with app.app_context():
+            try:
+                outcome = run_job(job_id, self.worker_id)
+            except Exception as e:
+                # Recording the outcome failed (e.g., the database is down); the lease will expire
+                app.logger.warning(f"Job {job_id} could not be completed: {e}")
+                outcome = 'failed'
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def run(self, stop_when_idle=False, time_budget=None, should_continue=None):
+        """
+        Runs jobs until stopped.
+
+        Args:
+            stop_when_idle (bool): Return once no jobs are due and none are running.
+            time_budget (float, optional): Stop claiming new jobs after this many seconds.
+            should_continue (callable, optional): Called when idle with stop_when_idle set;
+                returning True keeps the worker polling.
+
+        Returns:
+            dict: Counts of job outcomes.
+        """
+        deadline = datetime.utcnow() + timedelta(seconds=time_budget) if time_budget else None
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='classdeck-job') as pool:
+            while True:
+                in_flight = {f for f in in_flight if not f.done()}
+                accepting = not self.stopping.is_set() and (deadline is None or datetime.utcnow() < deadline)
+                claimed = []
+                if accepting and len(in_flight) < self.threads:
+                    try:
+                        with app.app_context():
+                            claimed = claim(self.worker_id, self.threads - len(in_flight))
+                    except Exception as e:
+                        app.logger.warning(f"Could not claim jobs: {e}")
+                    for job_id in claimed:
+                        in_flight.add(pool.submit(self._run, job_id))
+                if claimed:
+                    continue
+                if not in_flight and (not accepting or (stop_when_idle and not (should_continue and should_continue()))):
+                    break
+                if in_flight:
+                    wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    self.stopping.wait(self.poll_interval)
+        return dict(self.stats)
+
+# In-process draining: one thread per process, woken by enqueue()
+_drain_lock = threading.Lock()
+_drain_wake = threading.Event()
+_draining = False
+
+def _wants_more():
+    # Called by the drain thread when idle: keep going if something was enqueued meanwhile
+    global _draining
+    with _drain_lock:
+        if _drain_wake.is_set():
+            _drain_wake.clear()
+            return True
+        _draining = False
+        return False
+
+def _drain():
+    global _draining
+    try:
+        Worker(app.config['JOBS_IN_PROCESS_THREADS'], poll_interval=0.2).run(stop_when_idle=True, should_continue=_wants_more)
+    finally:
+        with _drain_lock:
+            _draining = False
+
+def _kick():
+    global _draining
+    if not app.config['JOBS_RUN_IN_PROCESS']:
+        return
+    with _drain_lock:
+        _drain_wake.set()
+        if _draining:
+            return
+        _draining = True
+        _drain_wake.clear()
+    threading.Thread(target=_drain, name='classdeck-job-drain', daemon=True).start()
+
+def purge_finished():
+    """
+    Deletes completed and failed jobs older than JOBS_RETENTION_HOURS.
+
+    Returns:
+        int: Number of jobs deleted.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=app.config['JOBS_RETENTION_HOURS'])
+    deleted = Job.query.filter(Job.status.in_([DONE, FAILED]), Job.finished_at < cutoff) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+@app.cli.command('worker')
+@click.option('--threads', type=int, default=None, help='Jobs run concurrently (default: JOBS_WORKER_THREADS).')
+@click.option('--poll-interval', type=float, default=1.0, show_default=True, help='Seconds between polls when idle.')
+@click.option('--once', is_flag=True, help='Exit once no jobs are due instead of polling forever.')
+def worker_command(threads, poll_interval, once):
+    """Runs background jobs from the job queue."""
+    # This process is the worker; enqueues from job handlers must not start extra drain threads
+    app.config['JOBS_RUN_IN_PROCESS'] = False
+    worker = Worker(threads or app.config['JOBS_WORKER_THREADS'], poll_interval)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: worker.stop())
+    click.echo(f'Worker {worker.worker_id} started with {worker.threads} thread(s)')
+    stats = worker.run(stop_when_idle=once)
+    click.echo(f'Worker stopped: {json.dumps(stats)}')
+
+@app.route('/cron/jobs')
+def cron_jobs():
+    """
+    Scheduled entry point for platforms without long-running workers (e.g., Vercel cron).
+
+    Requires ``Authorization: Bearer <CRON_SECRET>``. Enqueues recurring jobs, purges old finished
+    jobs and then runs due jobs until the queue is empty or JOBS_CRON_TIME_BUDGET runs out.
+
+    Returns:
+        dict: Counts of enqueued, purged and processed jobs.
+    """
+    secret = app.config.get('CRON_SECRET')
+    if not secret:
+        abort(404)
+    if request.headers.get('Authorization') != f'Bearer {secret}':
+        abort(401)
+
+    enqueued = 0
+    for func in PERIODIC:
+        try:
+            enqueued += func() or 0
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Periodic job {func.__name__} failed to enqueue: {e}")
+    purged = purge_finished()
+    stats = Worker(app.config['JOBS_WORKER_THREADS'], poll_interval=0.2) \
+        .run(stop_when_idle=True, time_budget=app.config['JOBS_CRON_TIME_BUDGET'])
+    return {'enqueued': enqueued, 'purged': purged, **stats}
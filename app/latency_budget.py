@@ -0,0 +1,341 @@
+"""
+Per-request latency budgets with a stale-while-revalidate fallback.
+The dashboard and course stream pages wait at most LATENCY_BUDGET_MS for Google. Their calls run
+concurrently on a shared thread pool; a call that has not answered by the page's deadline, or that
+failed without an authoritative answer (a timeout, a connection error, a 429 or 5xx, the quota
+budget), is replaced by the last known good copy of its data, the page says which data is stale and
+as of when, and a deduplicated job fetches it again in the background. The served latency is then
+bounded by the budget rather than by Google's slowest call.
+
+Last known good data is the cached course list for the dashboard and the CachedResource rows
+written whenever a course stream is fetched in full or in part. Data older than STALE_MAX_AGE_HOURS
+is not served. A call whose data has never been fetched has nothing to fall back to, so the page
+waits for it as before; so do errors that are real answers (403, 404, an expired grant).
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from flask import g
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+from sqlalchemy import insert, select, update
+from app import app, db, jobs, quota
+from app.admin import admin_required
+from app.instrumentation import timed
+from app.models import CachedResource, User
+from app.google_client import classroom_service
+
+# Parts of a course stream, in the order the page fetches them: (part, list response key)
+STREAM_PARTS = (('course', None), ('announcement', 'announcements'), ('assignment', 'courseWork'),
+                ('material', 'courseWorkMaterial'))
+
+executor = ThreadPoolExecutor(max_workers=app.config['LATENCY_BUDGET_THREADS'],
+                              thread_name_prefix='latency-budget')
+
+_stats = defaultdict(int)
+_stats_lock = threading.Lock()
+
+def _count(route, outcome):
+    with _stats_lock:
+        _stats[f'{route}:{outcome}'] += 1
+
+class DeadlineExceeded(Exception):
+    """A Google call did not answer within the request's latency budget."""
+
+def is_transient(error):
+    """
+    Returns whether a failed call may be answered with last known good data.
+
+    HTTP errors count only if they are timeouts, rate limits or server errors; anything else
+    Google answered (e.g. 403 or 404) is shown to the user as before. A refresh token that Google
+    rejected needs a new login, so it does not count either.
+    """
+    if isinstance(error, HttpError):
+        return error.resp.status in (408, 429) or error.resp.status >= 500
+    return not isinstance(error, RefreshError)
+
+def _settled(value=None, error=None):
+    """Wraps a finished call as a callable that returns its value or raises its error."""
+    def get():
+        if error is not None:
+            raise error
+        return value
+    return get
+
+def _in_app_context(fetch):
+    with app.app_context():
+        return fetch()
+
+class Budget:
+    """
+    The latency budget of one request.
+
+    Attributes:
+        route (str): Key into LATENCY_BUDGET_MS.
+        deadline (float): time.monotonic() by which the page must render, or None without one.
+        stale (dict): Description -> fetched_at of the data served from the last known good copy.
+    """
+    def __init__(self, route):
+        budget_ms = app.config['LATENCY_BUDGET_MS'].get(route) or 0
+        self.route = route
+        self.deadline = time.monotonic() + budget_ms / 1000.0 if budget_ms else None
+        self.stale = {}
+
+    def remaining(self, limit=None):
+        """Returns the seconds left before the deadline (never negative), capped at ``limit`` if given."""
+        if self.deadline is None:
+            return limit
+        left = max(0.0, self.deadline - time.monotonic())
+        return left if limit is None else min(left, limit)
+
+    def gather(self, fetches, fallbacks=()):
+        """
+        Runs calls concurrently and waits for them until the deadline.
+
+        Without a deadline the calls are made one by one when their results are asked for, as
+        the page always did.
+
+        Args:
+            fetches (dict): Key -> callable making the call. Each runs on its own thread and must
+                not share an httplib2 transport with the others.
+            fallbacks (iterable): Keys that have last known good data. Calls without it are
+                waited for past the deadline, since there is nothing else to show.
+
+        Returns:
+            dict: Key -> callable returning the call's result, or raising its error
+            (DeadlineExceeded if it missed the deadline; the call itself carries on and is
+            discarded).
+        """
+        if self.deadline is None:
+            return dict(fetches)
+        fallbacks = set(fallbacks)
+        results = {}
+        futures = {}
+        for key, fetch in fetches.items():
+            if key in fallbacks and not self.remaining():
+                # The budget is already spent: don't make a call whose result would be discarded
+                results[key] = _settled(error=DeadlineExceeded(f'{self.route} latency budget spent before {key}'))
+            else:
+                futures[key] = executor.submit(_in_app_context, fetch)
+        with timed('budget', self.route):
+            for key, future in futures.items():
+                try:
+                    results[key] = _settled(future.result(self.remaining() if key in fallbacks else None))
+                except FutureTimeout:
+                    results[key] = _settled(error=DeadlineExceeded(f'{key} missed the {self.route} latency budget'))
+                except Exception as e:
+                    results[key] = _settled(error=e)
+        return {key: results[key] for key in fetches}
+
+    def call(self, fetch, fallback=True):
+        """
+        Makes one call within the deadline (see gather()).
+
+        Returns:
+            The call's result.
+
+        Raises:
+            DeadlineExceeded: If the call missed the deadline and ``fallback`` is set.
+        """
+        return self.gather({'call': fetch}, ('call',) if fallback else ())['call']()
+
+    async def wait_for(self, awaitable, fallback=True):
+        """
+        Async counterpart of call(): awaits a call until the deadline, cancelling it past it.
+
+        Raises:
+            DeadlineExceeded: If the call missed the deadline and ``fallback`` is set.
+        """
+        if self.deadline is None or not fallback:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f'a call missed the {self.route} latency budget')
+
+    def fall_back(self, description, fetched_at, error):
+        """
+        Records that stale data is served in place of a failed or late call.
+
+        Args:
+            description (str): What is stale, for the page and the log.
+            fetched_at (datetime): When the stale data was fetched.
+            error (Exception): Why the call's result is not used.
+        """
+        self.stale[description] = fetched_at
+        _count(self.route, 'timeout' if isinstance(error, DeadlineExceeded) else 'error')
+        app.logger.warning(f"Serving {description} from {fetched_at:%Y-%m-%d %H:%M} on {self.route}: {error}")
+
+    def finish(self):
+        """Counts the request's outcome; call once the page's data is in place."""
+        _count(self.route, 'stale' if self.stale else 'fresh')
+
+    @property
+    def stale_since(self):
+        """datetime: When the oldest stale data on the page was fetched, or None if all of it is fresh."""
+        return min(self.stale.values()) if self.stale else None
+
+def current(route):
+    """
+    Returns the current request's latency budget, starting it on first use, so the async views
+    and the synchronous code they hand over to share one deadline.
+
+    Args:
+        route (str): Key into LATENCY_BUDGET_MS.
+    """
+    budget = g.get('_latency_budget')
+    if budget is None:
+        budget = g._latency_budget = Budget(route)
+    return budget
+
+def usable(fetched_at):
+    """Returns whether last known good data fetched at ``fetched_at`` may still be served."""
+    return datetime.utcnow() - fetched_at < timedelta(hours=app.config['STALE_MAX_AGE_HOURS'])
+
+def _hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+def remember(user_id, results):
+    """
+    Stores freshly fetched data as the last known good copy.
+
+    Only rows whose data changed are rewritten; unchanged ones just have fetched_at moved on.
+    Commits the session.
+
+    Args:
+        user_id (int): The local user ID.
+        results (dict): CachedResource key -> data.
+    """
+    if not results:
+        return
+    now = datetime.utcnow()
+    hashes = {key: _hash(data) for key, data in results.items()}
+    existing = dict(db.session.execute(select(CachedResource.key, CachedResource.content_hash).where(
+        CachedResource.user_id == user_id, CachedResource.key.in_(list(results)))).all())
+    new = [key for key in results if key not in existing]
+    if new:
+        db.session.execute(insert(CachedResource), [
+            {'user_id': user_id, 'key': key, 'data': results[key], 'content_hash': hashes[key], 'fetched_at': now}
+            for key in new])
+    for key, content_hash in existing.items():
+        if content_hash != hashes[key]:
+            db.session.execute(update(CachedResource).where(
+                CachedResource.user_id == user_id, CachedResource.key == key).values(
+                data=results[key], content_hash=hashes[key], fetched_at=now))
+    unchanged = [key for key, content_hash in existing.items() if content_hash == hashes[key]]
+    if unchanged:
+        db.session.execute(update(CachedResource).where(
+            CachedResource.user_id == user_id, CachedResource.key.in_(unchanged)).values(fetched_at=now))
+    db.session.commit()
+
+class CourseStreamSource:
+    """
+    The Google data of one course stream page, with last known good copies to fall back on.
+
+    Attributes:
+        budget (Budget): The request's latency budget.
+        user_id (int): The local user ID.
+        course_id (str): The Google course ID.
+        fresh (dict): Part -> data fetched during this request.
+    """
+    def __init__(self, budget, user_id, course_id):
+        self.budget = budget
+        self.user_id = user_id
+        self.course_id = course_id
+        self.fresh = {}
+        self._stored = None
+
+    def key(self, part):
+        return f'{part}:{self.course_id}'
+
+    def available(self):
+        """Returns the parts that have usable last known good data, without loading it."""
+        rows = db.session.execute(select(CachedResource.key, CachedResource.fetched_at).where(
+            CachedResource.user_id == self.user_id,
+            CachedResource.key.in_([self.key(part) for part, _ in STREAM_PARTS])))
+        return {key.split(':', 1)[0] for key, fetched_at in rows if usable(fetched_at)}
+
+    def _load(self):
+        if self._stored is None:
+            rows = CachedResource.query.filter(
+                CachedResource.user_id == self.user_id,
+                CachedResource.key.in_([self.key(part) for part, _ in STREAM_PARTS])).all()
+            self._stored = {row.key.split(':', 1)[0]: row for row in rows if usable(row.fetched_at)}
+        return self._stored
+
+    def get(self, part, fetch):
+        """
+        Returns a part of the page: fetched, or its last known good copy if the call was late or
+        failed transiently.
+
+        Args:
+            part (str): 'course', 'announcement', 'assignment' or 'material'.
+            fetch (callable): Returns the fresh data or raises.
+
+        Raises:
+            Exception: The call's error, if it cannot be answered with stored data.
+        """
+        try:
+            data = fetch()
+        except Exception as e:
+            row = self._load().get(part) if is_transient(e) else None
+            if row is None:
+                raise
+            self.budget.fall_back(f'{part} list' if part != 'course' else 'course details', row.fetched_at, e)
+            return row.data
+        self.fresh[part] = data
+        return data
+
+    def finish(self):
+        """
+        Stores what was fetched fresh and, if anything was stale, queues a refresh of the rest.
+        """
+        try:
+            remember(self.user_id, {self.key(part): data for part, data in self.fresh.items()})
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Could not store course stream {self.course_id}: {e}")
+        if self.budget.stale:
+            jobs.enqueue('refresh_course_stream', {'user_id': self.user_id, 'course_id': self.course_id},
+                         dedup_key=f'refresh-course-stream:{self.user_id}:{self.course_id}')
+        self.budget.finish()
+
+@jobs.handler('refresh_course_stream', max_attempts=3)
+def refresh_course_stream(user_id, course_id):
+    """
+    Fetches a course stream's data from Google and stores it as the last known good copy.
+
+    Args:
+        user_id (int): The local user ID.
+        course_id (str): The Google course ID.
+    """
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    courses = classroom_service(user).courses()
+    with quota.background():
+        quota.require(user_id, len(STREAM_PARTS))
+        results = {f'course:{course_id}': courses.get(id=course_id).execute()}
+        for (part, key), resource in zip(STREAM_PARTS[1:], (courses.announcements(), courses.courseWork(),
+                                                            courses.courseWorkMaterials())):
+            results[f'{part}:{course_id}'] = resource.list(courseId=course_id).execute().get(key, [])
+    remember(user_id, results)
+
+@app.route('/admin/metrics/latency_budget')
+@admin_required
+def latency_budget_metrics():
+    """
+    Exposes how often pages were served fresh or with stale data (admin only).
+
+    Returns:
+        dict: Counters keyed 'route:outcome' ('fresh', 'stale', 'timeout', 'error'), plus the
+            configured budgets.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    return {'budgets_ms': app.config['LATENCY_BUDGET_MS'], 'stats': stats}
@@ -1,6 +1,9 @@
 from app import db, app
+from app.instrumentation import timed
 from flask_login import UserMixin
 from cryptography.fernet import Fernet
+from sqlalchemy import event, DDL
+from datetime import datetime
 import base64
 import hashlib
 
@@ -36,7 +39,7 @@ def encrypt_value(value):
     try:
         return cipher.encrypt(value.encode()).decode()
     except Exception as e:
-        print(f"Encryption error: {e}")
+        app.logger.error(f"Encryption error: {e}")
         return value
 
 def decrypt_value(value):
@@ -50,12 +53,13 @@ def decrypt_value(value):
         str: The decrypted string, or the original value if decryption fails or value is None.
     """
     if not value: return None
-    cipher = get_cipher_suite()
-    if not cipher: return value
-    try:
-        return cipher.decrypt(value.encode()).decode()
-    except Exception:
-        return value
+    with timed('decrypt'):
+        cipher = get_cipher_suite()
+        if not cipher: return value
+        try:
+            return cipher.decrypt(value.encode()).decode()
+        except Exception:
+            return value
 
 class User(UserMixin, db.Model):
     """
@@ -74,6 +78,8 @@ class User(UserMixin, db.Model):
         _client_id (str): Encrypted OAuth client ID.
         _client_secret (str): Encrypted OAuth client secret.
         scopes (str): Comma-separated list of granted OAuth scopes.
+        collected_at (datetime): When the user's local rows were last reconciled against Google.
+        reconsent_required (bool): Whether Google refused a lookup for lack of newly required scopes.
         courses (dynamic): Relationship to the user's courses.
     """
     id = db.Column(db.Integer, primary_key=True)
@@ -90,6 +96,8 @@ class User(UserMixin, db.Model):
     _client_id = db.Column('client_id', db.Text)
     _client_secret = db.Column('client_secret', db.Text)
     scopes = db.Column(db.String(500))
+    collected_at = db.Column(db.DateTime)
+    reconsent_required = db.Column(db.Boolean, default=False)
     
     courses = db.relationship('Course', backref='user', lazy='dynamic')
 
@@ -151,6 +159,9 @@ class Course(db.Model):
         is_archived (bool): Whether the course is archived locally.
         is_pinned (bool): Whether the course is pinned (not currently used).
         display_order (int): Order index for display sorting.
+        revision (int): Incremented whenever an override shown on the course's card changes,
+            so cached renderings of the card are replaced. Starts at 1, as a course without a
+            local row is rendered with revision 0.
         user_tags (list): List of UserTags associated with this course.
     """
     id = db.Column(db.Integer, primary_key=True)
@@ -171,6 +182,7 @@ class Course(db.Model):
     is_archived = db.Column(db.Boolean, default=False) # User archived
     is_pinned = db.Column(db.Boolean, default=False)
     display_order = db.Column(db.Integer, default=0)
+    revision = db.Column(db.Integer, default=1)
 
     user_tags = db.relationship('UserTag', secondary='course_tags_map', lazy='subquery',
         backref=db.backref('courses', lazy=True))
@@ -180,6 +192,16 @@ class Course(db.Model):
     def __repr__(self):
         return '<Course {}>'.format(self.google_course_id)
 
+# Course columns that change what a course card shows; display_order only moves the card
+COURSE_VERSIONED_COLUMNS = ('custom_name', 'custom_section', 'custom_code', 'custom_banner', 'custom_icon',
+                            'cached_teacher_name', 'custom_teacher_name', 'is_archived')
+
+@event.listens_for(Course, 'before_update')
+def _bump_course_revision(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in COURSE_VERSIONED_COLUMNS):
+        target.revision = (target.revision or 0) + 1
+
 class CourseTag(db.Model):
     """
     Represents a tag specific to a course, used for tagging items within that course.
@@ -252,3 +274,379 @@ class UserTag(db.Model):
     name = db.Column(db.String(50), nullable=False)
     
     __table_args__ = (db.UniqueConstraint('user_id', 'name', name='_user_tag_name_uc'),)
+
+class SearchDocument(db.Model):
+    """
+    A locally indexed stream item (announcement, coursework or material) used for full-text search.
+    Rows are upserted as items are fetched from Google; the text is indexed by SQLite FTS5
+    (``search_document_fts``) or a Postgres ``tsvector`` column created alongside the table.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User.
+        google_course_id (str): ID of the course in Google Classroom.
+        google_item_id (str): ID of the item in Google Classroom.
+        item_type (str): 'announcement', 'assignment' or 'material'.
+        course_name (str): Name of the course when the item was indexed.
+        title (str): Item title (announcement text is truncated into the title).
+        body (str): Announcement text or coursework/material description.
+        attachments (str): Titles of attached files, links and videos, one per line.
+        url (str): Link to the item in Google Classroom.
+        google_update_time (str): Google's updateTime, used to skip unchanged items.
+        indexed_at (datetime): When the row was last written.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    google_course_id = db.Column(db.String(100), nullable=False)
+    google_item_id = db.Column(db.String(100), nullable=False)
+    item_type = db.Column(db.String(20), nullable=False)
+    course_name = db.Column(db.String(200))
+    title = db.Column(db.Text)
+    body = db.Column(db.Text)
+    attachments = db.Column(db.Text)
+    url = db.Column(db.String(500))
+    google_update_time = db.Column(db.String(40))
+    indexed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'google_item_id', name='_user_search_item_uc'),
+        db.Index('ix_search_document_user_course', 'user_id', 'google_course_id'),
+    )
+
+class CalendarEventMap(db.Model):
+    """
+    Maps a Classroom coursework item to the Google Calendar event created for its due date.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User.
+        google_course_id (str): ID of the course in Google Classroom.
+        google_coursework_id (str): ID of the coursework in Google Classroom.
+        calendar_event_id (str): ID of the event in the user's Google Calendar.
+        content_hash (str): Hash of the event body last written to Calendar.
+        synced_at (datetime): When the event was last written.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    google_course_id = db.Column(db.String(100), nullable=False)
+    google_coursework_id = db.Column(db.String(100), nullable=False)
+    calendar_event_id = db.Column(db.String(200), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'google_coursework_id', name='_user_coursework_event_uc'),)
+
+class CalendarSync(db.Model):
+    """
+    Tracks the state of a user's Classroom-to-Calendar sync runs.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User (one row per user).
+        status (str): 'queued', 'running', 'done', 'partial', 'deferred' or 'failed'.
+        started_at (datetime): When the current or last run started.
+        finished_at (datetime): When the last run finished.
+        inserted (int): Events created by the last run.
+        patched (int): Events updated by the last run.
+        deleted (int): Events removed by the last run.
+        failed (int): Calendar operations that failed in the last run (retried next run).
+        last_error (str): Last error message, if any.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    status = db.Column(db.String(20))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    inserted = db.Column(db.Integer, default=0)
+    patched = db.Column(db.Integer, default=0)
+    deleted = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+
+class CachedCourseWork(db.Model):
+    """
+    A local copy of a Classroom coursework item, refreshed whenever coursework is fetched from Google.
+    Lets features such as the deadline feed read due dates without calling Google.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User.
+        google_course_id (str): ID of the course in Google Classroom.
+        google_coursework_id (str): ID of the coursework in Google Classroom.
+        course_name (str): (Display) name of the course when the item was cached.
+        title (str): Coursework title.
+        description (str): Coursework description.
+        url (str): Link to the coursework in Google Classroom.
+        work_type (str): Google workType (e.g., 'ASSIGNMENT').
+        max_points (float): Maximum grade, if graded.
+        due_date (str): Due date as 'YYYY-MM-DD' (UTC), if any.
+        due_time (str): Due time as 'HH:MM' (UTC), if any.
+        creation_time (str): Google's creationTime.
+        google_update_time (str): Google's updateTime, used to skip unchanged items.
+        cached_at (datetime): When the row was last written.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    google_course_id = db.Column(db.String(100), nullable=False)
+    google_coursework_id = db.Column(db.String(100), nullable=False)
+    course_name = db.Column(db.String(200))
+    title = db.Column(db.Text)
+    description = db.Column(db.Text)
+    url = db.Column(db.String(500))
+    work_type = db.Column(db.String(40))
+    max_points = db.Column(db.Float)
+    due_date = db.Column(db.String(10))
+    due_time = db.Column(db.String(5))
+    creation_time = db.Column(db.String(40))
+    google_update_time = db.Column(db.String(40))
+    cached_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'google_coursework_id', name='_user_cached_coursework_uc'),
+        db.Index('ix_cached_course_work_user_due', 'user_id', 'due_date'),
+    )
+
+class CachedSubmission(db.Model):
+    """
+    A local copy of the user's own submission for a coursework item, cached alongside CachedCourseWork.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User.
+        google_course_id (str): ID of the course in Google Classroom.
+        google_coursework_id (str): ID of the coursework the submission belongs to.
+        state (str): Google submission state (e.g., 'CREATED', 'TURNED_IN').
+        late (bool): Whether Google flagged the submission as late.
+        turned_in_at (str): Timestamp of the last turn-in, if any.
+        google_update_time (str): Google's updateTime, used to skip unchanged submissions.
+        cached_at (datetime): When the row was last written.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    google_course_id = db.Column(db.String(100), nullable=False)
+    google_coursework_id = db.Column(db.String(100), nullable=False)
+    state = db.Column(db.String(40))
+    late = db.Column(db.Boolean, default=False)
+    turned_in_at = db.Column(db.String(40))
+    google_update_time = db.Column(db.String(40))
+    cached_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'google_coursework_id', name='_user_cached_submission_uc'),)
+
+class DeadlineFeed(db.Model):
+    """
+    A user's subscribable iCalendar deadline feed and the freshness of their coursework cache.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User (one row per user).
+        token (str): Secret token in the feed URL.
+        changed_at (datetime): When the user's cached coursework (or muted items) last changed;
+            used as the feed's Last-Modified and ETag.
+        refreshed_at (datetime): When the cache was last refreshed from Google.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    token = db.Column(db.String(64), unique=True)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    refreshed_at = db.Column(db.DateTime)
+
+class CachedCourseList(db.Model):
+    """
+    A user's Google Classroom course list as last fetched, so the dashboard can render without
+    waiting on Google right after login.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User (one row per user).
+        courses (list): Course resources as returned by courses.list.
+        fetched_at (datetime): When the list was fetched.
+        revision (int): Incremented whenever the user's local course overrides change, so cached
+            rosters in other processes know to rebuild.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    courses = db.Column(db.JSON, nullable=False)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    """
+    A unit of background work in the database-backed job queue.
+
+    Attributes:
+        id (int): Primary key.
+        kind (str): Name of the registered handler that runs the job.
+        payload (str): JSON-encoded handler arguments.
+        dedup_key (str): Optional key; while a job with the same key is queued or running,
+            enqueuing another one returns the existing job. Cleared when the job finishes.
+        status (str): 'queued', 'running', 'done' or 'failed'.
+        attempts (int): Number of times the job has been started.
+        max_attempts (int): Attempts before the job is marked as failed.
+        deferrals (int): Number of times the quota budget put the job off; these do not count as attempts.
+        run_at (datetime): Earliest time the job may (re)run.
+        locked_by (str): Worker that holds the lease on a running job.
+        locked_until (datetime): When the lease expires and another worker may take the job over.
+        last_error (str): Error from the last failed attempt.
+        created_at (datetime): When the job was enqueued.
+        finished_at (datetime): When the job completed or finally failed.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text)
+    dedup_key = db.Column(db.String(200), unique=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    deferrals = db.Column(db.Integer, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+class FetchLock(db.Model):
+    """
+    Lock table for cross-process request coalescing: the process holding a key's row makes the
+    Google call and publishes the response in the row for processes waiting on the same call.
+
+    Attributes:
+        id (int): Primary key.
+        key (str): SHA-256 of the user ID and request URL.
+        holder (str): Random ID of the flight holding the lock.
+        expires_at (datetime): When an unfinished flight is considered abandoned, or when a
+            published response stops being served to waiting processes.
+        status (int): HTTP status of the published response; NULL while the call is in flight.
+        headers (str): JSON-encoded response headers.
+        content (bytes): Response body.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), unique=True, nullable=False)
+    holder = db.Column(db.String(32), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    status = db.Column(db.Integer)
+    headers = db.Column(db.Text)
+    content = db.Column(db.LargeBinary)
+
+class CachedFragment(db.Model):
+    """
+    A rendered template fragment in the shared fragment cache.
+
+    Attributes:
+        id (int): Primary key.
+        page (str): SHA-256 of the user and path of the page the fragment was rendered on; a
+            page's fragments are loaded together.
+        key (str): The fragment's content-version key.
+        html (str): The rendered HTML.
+        expires_at (datetime): When the fragment is removed.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    page = db.Column(db.String(64), nullable=False)
+    key = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (db.Index('ix_cached_fragment_page', 'page'),)
+
+class CachedResource(db.Model):
+    """
+    The last successfully fetched copy of a Google resource or list, served in its place when a
+    fresh fetch misses the page's latency budget or fails.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User.
+        key (str): What was fetched, e.g. 'course:<id>' or 'announcement:<course id>'.
+        data (dict or list): The resource or list items as returned by Google.
+        content_hash (str): SHA-256 of the data, so unchanged data is not rewritten.
+        fetched_at (datetime): When the data was last confirmed by Google.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(200), nullable=False)
+    data = db.Column(db.JSON, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_cached_resource_user_key'),)
+
+class Attachment(db.Model):
+    """
+    A Drive file, link, YouTube video or form attached to a stream item, indexed for the Files page.
+    Rows are upserted as stream items are fetched from Google; an attachment posted several times
+    in a course (e.g. the same Drive file on many assignments) has one row, for its latest post.
+
+    Attributes:
+        id (int): Primary key.
+        user_id (int): Foreign key to the User.
+        google_course_id (str): ID of the course in Google Classroom.
+        course_name (str): (Display) name of the course when the attachment was indexed.
+        key (str): Identity of the attachment within the course: 'drive:<file id>',
+            'youtube:<video id>', 'form:<form URL>' or 'link:<URL>'.
+        kind (str): 'drive', 'youtube', 'link' or 'form'.
+        category (str): What the file is, for filtering: 'pdf', 'document', 'spreadsheet',
+            'presentation', 'image', 'video', 'audio', 'form', 'link' or 'file'.
+        icon (str): Font Awesome classes of the attachment's icon.
+        title (str): Title of the file, video, form or page.
+        url (str): Where the attachment opens.
+        mime_type (str): MIME type of a Drive file.
+        google_item_id (str): ID of the stream item it was last posted on.
+        item_type (str): 'announcement', 'assignment' or 'material'.
+        item_title (str): Title of that item.
+        posted_at (str): Google's updateTime (or creationTime) of that item.
+        indexed_at (datetime): When the row was last written.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    google_course_id = db.Column(db.String(100), nullable=False)
+    course_name = db.Column(db.String(200))
+    key = db.Column(db.String(600), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
+    category = db.Column(db.String(20), nullable=False)
+    icon = db.Column(db.String(60), nullable=False)
+    title = db.Column(db.Text)
+    url = db.Column(db.String(1000))
+    mime_type = db.Column(db.String(200))
+    google_item_id = db.Column(db.String(100))
+    item_type = db.Column(db.String(20))
+    item_title = db.Column(db.Text)
+    posted_at = db.Column(db.String(40))
+    indexed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'google_course_id', 'key', name='_user_course_attachment_uc'),
+        db.Index('ix_attachment_user_posted', 'user_id', 'posted_at'),
+        db.Index('ix_attachment_user_category_posted', 'user_id', 'category', 'posted_at'),
+    )
+
+# Full-text index for SearchDocument: FTS5 external-content table kept in sync by triggers on SQLite,
+# a generated tsvector column with a GIN index on Postgres.
+_SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_document_fts USING fts5("
+    "title, body, attachments, content='search_document', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS search_document_ai AFTER INSERT ON search_document BEGIN "
+    "INSERT INTO search_document_fts(rowid, title, body, attachments) VALUES (new.id, new.title, new.body, new.attachments); END",
+    "CREATE TRIGGER IF NOT EXISTS search_document_ad AFTER DELETE ON search_document BEGIN "
+    "INSERT INTO search_document_fts(search_document_fts, rowid, title, body, attachments) "
+    "VALUES ('delete', old.id, old.title, old.body, old.attachments); END",
+    "CREATE TRIGGER IF NOT EXISTS search_document_au AFTER UPDATE ON search_document BEGIN "
+    "INSERT INTO search_document_fts(search_document_fts, rowid, title, body, attachments) "
+    "VALUES ('delete', old.id, old.title, old.body, old.attachments); "
+    "INSERT INTO search_document_fts(rowid, title, body, attachments) VALUES (new.id, new.title, new.body, new.attachments); END",
+]
+_POSTGRES_SEARCH_DDL = [
+    "ALTER TABLE search_document ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(attachments, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(body, '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_search_document_vector ON search_document USING GIN (search_vector)",
+]
+for _statement in _SQLITE_SEARCH_DDL:
+    event.listen(SearchDocument.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in _POSTGRES_SEARCH_DDL:
+    event.listen(SearchDocument.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+event.listen(SearchDocument.__table__, 'before_drop',
+             DDL("DROP TABLE IF EXISTS search_document_fts").execute_if(dialect='sqlite'))
@@ -0,0 +1,295 @@
+"""
+Batched JSON mutations of the local tagging and muting state.
+The course stream and missing assignments pages send their edits here instead of posting forms:
+a request carries a list of operations, all of them are applied in one transaction with a few
+set-based statements, and the response holds only the state that changed, so the page updates in
+place without a redirect (and without the Google calls of re-rendering it).
+
+Operations::
+
+    {"op": "delete_tag", "course_id": ..., "tag_id": ...}
+    {"op": "create_tag", "course_id": ..., "name": ..., "color": ...}
+    {"op": "tag" | "untag", "course_id": ..., "item_id": ..., "tag_id": ...}
+    {"op": "mute" | "unmute", "item_id": ...}
+
+Whatever their order in the request, tag deletions are applied first, then creations, then item
+tags, then mutes. Of several operations on the same item tag or muted item, the last one wins.
+If any operation is invalid, nothing is applied. A batch that collides with the same change made
+concurrently (another tab, a double-click) is retried once and then sees that change as done.
+"""
+from collections import defaultdict
+from flask import request
+from flask_login import current_user, login_required
+from sqlalchemy import delete, insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from app import app, db, coursework_cache
+from app.models import Course, CourseTag, ItemTag, MutedItem
+
+MAX_OPERATIONS = 200
+MAX_COURSE_TAGS = 6
+
+class MutationError(Exception):
+    """
+    An operation that cannot be applied.
+
+    Attributes:
+        message (str): Description of the problem.
+        index (int): Position of the operation in the request, if it concerns one.
+        status (int): HTTP status of the response.
+    """
+    def __init__(self, message, index=None, status=400):
+        super().__init__(message)
+        self.message = message
+        self.index = index
+        self.status = status
+
+class Batch:
+    """
+    The operations of one request, reduced to the changes they make.
+
+    Attributes:
+        deleted_tags (dict): Tag ID -> (operation index, Google course ID).
+        created_tags (list): (operation index, Google course ID, name, color) tuples.
+        item_tags (dict): (tag ID, item ID) -> (operation index, Google course ID, whether tagged).
+        mutes (dict): Item ID -> whether muted.
+    """
+    def __init__(self):
+        self.deleted_tags = {}
+        self.created_tags = []
+        self.item_tags = {}
+        self.mutes = {}
+
+def _field(operation, index, name, max_length=100, default=None):
+    value = operation.get(name, default)
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or not value.strip():
+        raise MutationError(f"Missing '{name}'", index)
+    if len(value.strip()) > max_length:
+        raise MutationError(f"'{name}' is too long", index)
+    return value.strip()
+
+def _tag_id(operation, index):
+    try:
+        return int(_field(operation, index, 'tag_id'))
+    except ValueError:
+        raise MutationError("Invalid 'tag_id'", index)
+
+def parse(operations):
+    """
+    Validates the shape of a request's operations and reduces them to a Batch.
+
+    Args:
+        operations (list): The decoded operations.
+
+    Returns:
+        Batch: The changes to apply.
+
+    Raises:
+        MutationError: If the request or one of its operations is malformed.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise MutationError("'operations' must be a non-empty list")
+    if len(operations) > MAX_OPERATIONS:
+        raise MutationError(f"At most {MAX_OPERATIONS} operations per request")
+    batch = Batch()
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise MutationError('Operation must be an object', index)
+        op = operation.get('op')
+        if op in ('tag', 'untag'):
+            key = (_tag_id(operation, index), _field(operation, index, 'item_id'))
+            batch.item_tags[key] = (index, _field(operation, index, 'course_id'), op == 'tag')
+        elif op in ('mute', 'unmute'):
+            batch.mutes[_field(operation, index, 'item_id')] = op == 'mute'
+        elif op == 'create_tag':
+            batch.created_tags.append((index, _field(operation, index, 'course_id'),
+                                       _field(operation, index, 'name', 50),
+                                       _field(operation, index, 'color', 20, default='blue')))
+        elif op == 'delete_tag':
+            batch.deleted_tags[_tag_id(operation, index)] = (index, _field(operation, index, 'course_id'))
+        else:
+            raise MutationError(f"Unknown operation '{op}'", index)
+    return batch
+
+def owned_tags(user_id, tag_ids):
+    """
+    Looks up which of the given course tags belong to the user.
+
+    Returns:
+        dict: Tag ID -> Google course ID, for the user's tags only.
+    """
+    if not tag_ids:
+        return {}
+    return dict(db.session.execute(
+        select(CourseTag.id, Course.google_course_id).join(Course, CourseTag.course_id == Course.id)
+        .where(Course.user_id == user_id, CourseTag.id.in_(tag_ids))).all())
+
+def _check_tags(user_id, references):
+    """Raises a 404 MutationError unless every (tag ID, operation index, course ID) is the user's tag in that course."""
+    owned = owned_tags(user_id, {tag_id for tag_id, _, _ in references})
+    for tag_id, index, course_id in references:
+        if owned.get(tag_id) != course_id:
+            raise MutationError('Tag not found', index, 404)
+
+def local_courses(user_id, google_course_ids):
+    """
+    Returns the local Course IDs of the given Google courses, creating missing rows in one insert.
+
+    Returns:
+        dict: Google course ID -> local Course ID.
+    """
+    query = select(Course.google_course_id, Course.id).where(
+        Course.user_id == user_id, Course.google_course_id.in_(google_course_ids))
+    ids = dict(db.session.execute(query).all())
+    missing = [course_id for course_id in google_course_ids if course_id not in ids]
+    if missing:
+        db.session.execute(insert(Course), [{'user_id': user_id, 'google_course_id': course_id}
+                                            for course_id in missing])
+        ids = dict(db.session.execute(query).all())
+    return ids
+
+def _delete_tags(user_id, batch, changed_items):
+    _check_tags(user_id, [(tag_id, index, course_id) for tag_id, (index, course_id) in batch.deleted_tags.items()])
+    tag_ids = list(batch.deleted_tags)
+    # Items losing a tag are reported with their remaining tags
+    changed_items.update(db.session.execute(
+        select(ItemTag.google_item_id).where(ItemTag.tag_id.in_(tag_ids))).scalars())
+    db.session.execute(delete(ItemTag).where(ItemTag.tag_id.in_(tag_ids)))
+    db.session.execute(delete(CourseTag).where(CourseTag.id.in_(tag_ids)))
+    return tag_ids
+
+def _create_tags(user_id, batch):
+    courses = local_courses(user_id, list({course_id for _, course_id, _, _ in batch.created_tags}))
+    names = defaultdict(set)
+    for course_id, name in db.session.execute(
+            select(CourseTag.course_id, CourseTag.name).where(CourseTag.course_id.in_(list(courses.values())))):
+        names[course_id].add(name)
+    rows = []
+    for index, course_id, name, color in batch.created_tags:
+        existing = names[courses[course_id]]
+        if name in existing:
+            raise MutationError('Tag already exists.', index, 409)
+        if len(existing) >= MAX_COURSE_TAGS:
+            raise MutationError(f'Limit of {MAX_COURSE_TAGS} tags per class reached.', index)
+        existing.add(name)
+        rows.append({'course_id': courses[course_id], 'name': name, 'color': color})
+    google_ids = {local_id: course_id for course_id, local_id in courses.items()}
+    created = db.session.execute(
+        insert(CourseTag).returning(CourseTag.id, CourseTag.course_id, CourseTag.name, CourseTag.color,
+                                    sort_by_parameter_order=True), rows).all()
+    return [{'id': tag.id, 'course_id': google_ids[tag.course_id], 'name': tag.name, 'color': tag.color}
+            for tag in created]
+
+def _set_item_tags(user_id, batch, changed_items):
+    _check_tags(user_id, [(tag_id, index, course_id)
+                          for (tag_id, _), (index, course_id, _) in batch.item_tags.items()])
+    added = [key for key, (_, _, tagged) in batch.item_tags.items() if tagged]
+    removed = [key for key, (_, _, tagged) in batch.item_tags.items() if not tagged]
+    if added:
+        existing = set(db.session.execute(select(ItemTag.tag_id, ItemTag.google_item_id).where(
+            tuple_(ItemTag.tag_id, ItemTag.google_item_id).in_(added))).tuples())
+        rows = [{'tag_id': tag_id, 'google_item_id': item_id}
+                for tag_id, item_id in added if (tag_id, item_id) not in existing]
+        if rows:
+            db.session.execute(insert(ItemTag), rows)
+    if removed:
+        db.session.execute(delete(ItemTag).where(tuple_(ItemTag.tag_id, ItemTag.google_item_id).in_(removed)))
+    changed_items.update(item_id for _, item_id in batch.item_tags)
+
+def _set_mutes(user_id, batch):
+    muted = [item_id for item_id, mute in batch.mutes.items() if mute]
+    unmuted = [item_id for item_id, mute in batch.mutes.items() if not mute]
+    if muted:
+        existing = set(db.session.execute(select(MutedItem.google_item_id).where(
+            MutedItem.user_id == user_id, MutedItem.google_item_id.in_(muted))).scalars())
+        rows = [{'user_id': user_id, 'google_item_id': item_id} for item_id in muted if item_id not in existing]
+        if rows:
+            db.session.execute(insert(MutedItem), rows)
+    if unmuted:
+        db.session.execute(delete(MutedItem).where(MutedItem.user_id == user_id,
+                                                   MutedItem.google_item_id.in_(unmuted)))
+    # Muted items are left out of the deadline feed, so it has changed
+    coursework_cache.touch(user_id)
+
+def item_tag_ids(user_id, item_ids):
+    """
+    Returns the user's current course tags of the given items.
+
+    Returns:
+        dict: Item ID -> sorted list of tag IDs (empty for untagged items).
+    """
+    tags = {item_id: [] for item_id in item_ids}
+    if item_ids:
+        rows = db.session.execute(
+            select(ItemTag.google_item_id, ItemTag.tag_id)
+            .join(CourseTag, ItemTag.tag_id == CourseTag.id).join(Course, CourseTag.course_id == Course.id)
+            .where(Course.user_id == user_id, ItemTag.google_item_id.in_(list(item_ids)))
+            .order_by(ItemTag.tag_id))
+        for item_id, tag_id in rows:
+            tags[item_id].append(tag_id)
+    return tags
+
+def apply(user_id, batch):
+    """
+    Applies a batch of changes in one transaction.
+
+    Args:
+        user_id (int): The local user ID.
+        batch (Batch): The changes, from parse().
+
+    Returns:
+        dict: The changed state: 'deleted_tags' (tag IDs), 'created_tags' (tags with 'id', 'course_id',
+            'name' and 'color'), 'items' (item ID -> tag IDs, for every item whose tags changed) and
+            'muted' (item ID -> whether muted).
+
+    Raises:
+        MutationError: If an operation cannot be applied; the transaction is rolled back.
+    """
+    try:
+        return _apply(user_id, batch)
+    except IntegrityError:
+        # A concurrent request inserted one of the same rows first; the retry finds it in place
+        pass
+    try:
+        return _apply(user_id, batch)
+    except IntegrityError:
+        raise MutationError('The change conflicts with another one made at the same time. Please try again.',
+                            status=409)
+
+def _apply(user_id, batch):
+    result = {'deleted_tags': [], 'created_tags': [], 'items': {}, 'muted': {}}
+    changed_items = set()
+    try:
+        if batch.deleted_tags:
+            result['deleted_tags'] = _delete_tags(user_id, batch, changed_items)
+        if batch.created_tags:
+            result['created_tags'] = _create_tags(user_id, batch)
+        if batch.item_tags:
+            _set_item_tags(user_id, batch, changed_items)
+        if batch.mutes:
+            _set_mutes(user_id, batch)
+            result['muted'] = dict(batch.mutes)
+        result['items'] = item_tag_ids(user_id, changed_items)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+@app.route('/api/mutations', methods=['POST'])
+@login_required
+def mutations():
+    """
+    Applies a batch of tagging and muting operations.
+
+    Expects a JSON payload with an 'operations' list (see the module docstring).
+
+    Returns:
+        dict: The changed state (see apply()), or {'error': ..., 'operation': index} with a 4xx status.
+    """
+    data = request.get_json(silent=True)
+    try:
+        return apply(current_user.id, parse(data.get('operations') if isinstance(data, dict) else None))
+    except MutationError as e:
+        return {'error': e.message, 'operation': e.index}, e.status
@@ -0,0 +1,307 @@
+"""
+Live dashboard updates over Server-Sent Events.
+Each process keeps one Notifier that fans events out to every open tab of a user. A single poller
+thread per user (started by the first tab, stopped once the last one has been closed for
+NOTIFICATIONS_RESUME_SECONDS) watches the local coursework cache, which the job queue keeps fresh,
+and publishes new-assignment notifications and per-course due/overdue counts. Events carry
+increasing IDs and are buffered until the poller stops, so a browser that reconnects with
+Last-Event-ID receives what it missed.
+
+Every open stream holds one request thread, so each process serves at most NOTIFICATIONS_MAX_STREAMS
+of them; tabs beyond that are told to reconnect later.
+"""
+import json
+import queue
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from datetime import datetime, timedelta
+from flask import Response, abort, request
+from flask_login import current_user, login_required
+from app import app, db, coursework_cache, server, workload
+from app.models import CachedCourseWork, User
+
+Event = namedtuple('Event', 'id type data')
+
+# Events of these types describe current state; the latest one is replayed to new connections
+SNAPSHOT_TYPES = {'courses'}
+
+class Subscription:
+    """
+    One open event stream.
+
+    Attributes:
+        queue (queue.Queue): Events published since the stream subscribed.
+        overflowed (bool): Set when the stream fell too far behind; it should close so the
+            browser reconnects and resumes from the buffer.
+    """
+    def __init__(self, max_queued=100):
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.overflowed = False
+
+class Notifier:
+    """
+    Thread-safe, per-process fan-out of events to a user's open streams.
+
+    Keeps a bounded buffer of recent events per user for Last-Event-ID resume and the latest
+    snapshot event of each type for new connections.
+
+    Attributes:
+        max_streams (int): Open subscriptions allowed at once in this process.
+        resume_seconds (float): How long a user's buffered events outlive their last subscription.
+    """
+    def __init__(self, buffer_size=100, max_streams=10, resume_seconds=120):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+        self.buffers = defaultdict(lambda: deque(maxlen=buffer_size))
+        self.snapshots = defaultdict(dict)
+        self.pollers = {}
+        self.closed_at = {}
+        self.last_id = 0
+        self.streams = 0
+        self.max_streams = max_streams
+        self.resume_seconds = resume_seconds
+
+    def _next_id(self):
+        # Millisecond-based IDs keep increasing across restarts, so a stale Last-Event-ID from a
+        # previous process never hides newer events
+        self.last_id = max(self.last_id + 1, int(time.time() * 1000))
+        return self.last_id
+
+    def publish(self, user_id, event_type, data):
+        """
+        Sends an event to all of a user's open streams and buffers it for resuming clients.
+
+        Args:
+            user_id (int): The local user ID.
+            event_type (str): SSE event name.
+            data: JSON-serializable payload.
+
+        Returns:
+            Event: The published event.
+        """
+        with self.lock:
+            event = Event(self._next_id(), event_type, data)
+            self.buffers[user_id].append(event)
+            if event_type in SNAPSHOT_TYPES:
+                self.snapshots[user_id][event_type] = event
+            for subscription in self.subscribers.get(user_id, ()):
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    subscription.overflowed = True
+        return event
+
+    def subscribe(self, user_id, last_event_id=None):
+        """
+        Opens a subscription for a user's events.
+
+        Args:
+            user_id (int): The local user ID.
+            last_event_id (int): ID of the last event the client received, if resuming.
+
+        Returns:
+            tuple: (Subscription, list of Events to send first), or (None, []) if this process
+                already serves max_streams streams. The backlog and the live queue are taken
+                under one lock, so no event is missed or sent twice.
+        """
+        subscription = Subscription()
+        with self.lock:
+            if self.streams >= self.max_streams:
+                return None, []
+            self.streams += 1
+            self.subscribers[user_id].add(subscription)
+            after = last_event_id or 0
+            backlog = [e for e in self.buffers.get(user_id, ()) if e.id > after] if last_event_id else []
+            for event in self.snapshots.get(user_id, {}).values():
+                if event.id > after and event not in backlog:
+                    backlog.append(event)
+        backlog.sort(key=lambda e: e.id)
+        return subscription, backlog
+
+    def unsubscribe(self, user_id, subscription):
+        """Closes a subscription."""
+        with self.lock:
+            subscribers = self.subscribers.get(user_id)
+            if subscribers is not None and subscription in subscribers:
+                self.streams -= 1
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[user_id]
+                    self.closed_at[user_id] = time.monotonic()
+
+    def ensure_poller(self, user_id):
+        """Starts the user's poller thread unless one is already running in this process."""
+        with self.lock:
+            if user_id in self.pollers:
+                return
+            poller = UserPoller(self, user_id)
+            self.pollers[user_id] = poller
+        poller.start()
+
+    def release_poller(self, poller):
+        """
+        Called by a poller between polls; unregisters it once its user's last stream has been
+        closed for resume_seconds.
+
+        Returns:
+            bool: True if the poller should stop.
+        """
+        with self.lock:
+            if self.subscribers.get(poller.user_id):
+                return False
+            # Keep polling and buffering for a while, so a tab that reconnects resumes without a gap
+            if time.monotonic() - self.closed_at.get(poller.user_id, 0) < self.resume_seconds:
+                return False
+            if self.pollers.get(poller.user_id) is poller:
+                del self.pollers[poller.user_id]
+            # Drop buffered state so idle users do not pin memory
+            self.closed_at.pop(poller.user_id, None)
+            self.buffers.pop(poller.user_id, None)
+            self.snapshots.pop(poller.user_id, None)
+            return True
+
+notifier = Notifier(app.config['NOTIFICATIONS_BUFFER_SIZE'],
+                    app.config['NOTIFICATIONS_MAX_STREAMS'] or max(1, server.thread_count() // 2),
+                    app.config['NOTIFICATIONS_RESUME_SECONDS'])
+
+def recent_assignments(user_id):
+    """
+    Returns the user's cached assignments created in the last 24 hours, as on the dashboard.
+
+    Returns:
+        list: CachedCourseWork rows.
+    """
+    yesterday = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S')
+    return CachedCourseWork.query.filter(
+        CachedCourseWork.user_id == user_id,
+        CachedCourseWork.work_type == 'ASSIGNMENT',
+        CachedCourseWork.creation_time > yesterday
+    ).all()
+
+def course_counts(user_id):
+    """
+    Returns pending-work counts for each of the user's courses.
+
+    Returns:
+        dict: Google course ID -> {'overdue': int, 'due_next_7_days': int}.
+    """
+    courses = workload.compute(workload.load_columns(user_id), datetime.utcnow())['courses']
+    return {c['course_id']: {'overdue': c['overdue'], 'due_next_7_days': c['due_next_7_days']} for c in courses}
+
+class UserPoller(threading.Thread):
+    """
+    Background thread serving all of one user's open streams in this process.
+
+    Each poll queues a coursework cache refresh if the cache is stale, then publishes an
+    'assignment' event for each newly cached assignment and a 'courses' event when the
+    per-course counts change.
+    """
+    def __init__(self, notifier, user_id):
+        super().__init__(daemon=True, name=f'notifications-{user_id}')
+        self.notifier = notifier
+        self.user_id = user_id
+        self.seen = None
+        self.counts = None
+        # Pollers run outside any request, so links are built from the bare URL map
+        self.urls = app.url_map.bind('', script_name=app.config['APPLICATION_ROOT'])
+
+    def run(self):
+        with app.app_context():
+            while True:
+                try:
+                    self.poll()
+                except Exception as e:
+                    app.logger.warning(f"Notification poll for user {self.user_id} failed: {e}")
+                finally:
+                    db.session.remove()
+                time.sleep(app.config['NOTIFICATIONS_POLL_SECONDS'])
+                if self.notifier.release_poller(self):
+                    return
+
+    def poll(self):
+        if db.session.get(User, self.user_id) is None:
+            return
+        coursework_cache.refresh_in_background(self.user_id, app.config['NEW_ASSIGNMENT_REFRESH_MINUTES'])
+
+        recent = recent_assignments(self.user_id)
+        # Assignments cached before the poller started were already shown on the dashboard
+        if self.seen is not None:
+            for work in recent:
+                if work.google_coursework_id not in self.seen:
+                    self.notifier.publish(self.user_id, 'assignment', {
+                        'id': work.google_coursework_id,
+                        'text': f"New Assignment: {work.title} in {work.course_name or 'Class'}",
+                        'url': self.urls.build('course_stream', {'course_id': work.google_course_id}),
+                    })
+        self.seen = {work.google_coursework_id for work in recent}
+
+        counts = course_counts(self.user_id)
+        if counts != self.counts:
+            self.counts = counts
+            self.notifier.publish(self.user_id, 'courses', counts)
+
+def format_event(event):
+    """Serializes an event in the text/event-stream format."""
+    return f'id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data, separators=(",", ":"))}\n\n'
+
+@app.route('/events')
+@login_required
+def event_stream():
+    """
+    Server-Sent Events stream of dashboard updates for the current user.
+
+    Resumes after the event in the Last-Event-ID header (or the lastEventId query parameter),
+    sends a comment as a heartbeat while idle and ends after NOTIFICATIONS_MAX_STREAM_SECONDS,
+    after which the browser reconnects on its own. When this process already serves
+    NOTIFICATIONS_MAX_STREAMS streams, the response only tells the browser to reconnect after a poll
+    interval, freeing the thread at once.
+
+    Returns:
+        Response: A streamed text/event-stream response.
+    """
+    if not app.config['NOTIFICATIONS_ENABLED']:
+        abort(404)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    user_id = current_user.id
+    # Subscribe before making sure a poller runs, so a poller that is just stopping never misses us
+    subscription, backlog = notifier.subscribe(user_id, last_event_id)
+    if subscription is None:
+        # Events are not published more often than the poll interval, so little is lost by waiting one
+        response = Response(f"retry: {int(app.config['NOTIFICATIONS_POLL_SECONDS'] * 1000)}\n\n",
+                            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    notifier.ensure_poller(user_id)
+    heartbeat = app.config['NOTIFICATIONS_HEARTBEAT_SECONDS']
+    max_seconds = app.config['NOTIFICATIONS_MAX_STREAM_SECONDS']
+
+    def generate():
+        try:
+            yield f'retry: {heartbeat * 1000}\n\n'
+            for event in backlog:
+                yield format_event(event)
+            deadline = time.monotonic() + max_seconds
+            while not subscription.overflowed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = subscription.queue.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield format_event(event)
+        finally:
+            notifier.unsubscribe(user_id, subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,209 @@
+"""
+On-demand sampling profiler for individual requests.
+When PROFILER_ENABLED is set, an admin can profile a single request by sending the
+``X-ClassDeck-Profile: 1`` header or the ``?_profile=1`` query flag. The request is sampled
+by a background thread and written as a flame-graph-compatible collapsed stack file
+(``frame;frame;frame count`` per line) to a rotating directory.
+When disabled no hooks or routes are active, so there is no per-request overhead.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import g, request, send_from_directory, abort
+from flask_login import current_user
+from werkzeug.utils import secure_filename
+from app import app
+from app.admin import is_admin, admin_required
+from app.instrumentation import user_hash
+
+ENABLED = bool(app.config.get('PROFILER_ENABLED'))
+
+PROFILE_HEADER = 'X-ClassDeck-Profile'
+PROFILE_QUERY_FLAG = '_profile'
+PROFILE_SUFFIX = '.folded'
+
+class StackSampler:
+    """
+    Statistical profiler that periodically samples the stack of one thread.
+
+    Attributes:
+        thread_id (int): Identifier of the thread being profiled.
+        interval (float): Seconds between samples.
+        samples (collections.Counter): Collapsed stack string -> number of samples.
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='classdeck-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[self.collapse(frame)] += 1
+
+    @staticmethod
+    def collapse(frame):
+        """
+        Converts a frame into a root-first, semicolon separated stack string.
+
+        Args:
+            frame (frame): The innermost frame of the sampled thread.
+
+        Returns:
+            str: The collapsed stack (e.g., 'run.py:<module>;app/routes.py:index').
+        """
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{_short_path(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+def _short_path(filename):
+    """Trims a source path to the part that identifies the module."""
+    for marker in ('site-packages' + os.sep, app.root_path + os.sep):
+        index = filename.find(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return os.path.basename(filename)
+
+def profile_dir():
+    """
+    Returns the directory profiles are written to, creating it if needed.
+
+    Returns:
+        str: Absolute path of PROFILER_DIR.
+    """
+    path = app.config['PROFILER_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def list_profiles():
+    """
+    Lists the stored profiles, newest first.
+
+    Returns:
+        list: Dicts with 'name', 'size' and 'modified' (ISO timestamp) keys.
+    """
+    path = profile_dir()
+    entries = []
+    for name in os.listdir(path):
+        if name.endswith(PROFILE_SUFFIX):
+            stat = os.stat(os.path.join(path, name))
+            entries.append({
+                'name': name,
+                'size': stat.st_size,
+                'modified': datetime.utcfromtimestamp(stat.st_mtime).isoformat() + 'Z'
+            })
+    entries.sort(key=lambda e: e['modified'], reverse=True)
+    return entries
+
+def rotate_profiles():
+    """Deletes the oldest profiles beyond PROFILER_MAX_FILES."""
+    for entry in list_profiles()[app.config['PROFILER_MAX_FILES']:]:
+        try:
+            os.remove(os.path.join(profile_dir(), entry['name']))
+        except OSError:
+            pass
+
+def write_profile(sampler, endpoint, user_id):
+    """
+    Writes a sampler's results as a collapsed stack file and rotates old profiles.
+
+    Args:
+        sampler (StackSampler): The finished sampler.
+        endpoint (str): The Flask endpoint that was profiled.
+        user_id (int): The profiled user's ID.
+
+    Returns:
+        str: The file name of the written profile.
+    """
+    name = secure_filename(
+        f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{endpoint or 'unknown'}-{user_hash(user_id)}"
+    ) + PROFILE_SUFFIX
+    with open(os.path.join(profile_dir(), name), 'w') as f:
+        for stack, count in sampler.samples.most_common():
+            f.write(f'{stack} {count}\n')
+    rotate_profiles()
+    return name
+
+def profiling_requested():
+    """
+    Checks whether the current request asks to be profiled and is allowed to.
+
+    Returns:
+        bool: True if the profile header or query flag is set by an admin.
+    """
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_FLAG)
+    return flag in ('1', 'true') and is_admin(current_user)
+
+def _before_request():
+    if profiling_requested():
+        sampler = StackSampler(threading.get_ident(), app.config['PROFILER_SAMPLE_INTERVAL_MS'] / 1000.0)
+        g._profiler = (sampler, time.perf_counter())
+        sampler.start()
+
+def _after_request(response):
+    profiler = g.pop('_profiler', None)
+    if profiler is None:
+        return response
+    sampler, start = profiler
+    sampler.stop()
+    name = write_profile(sampler, request.endpoint, current_user.id)
+    response.headers[PROFILE_HEADER] = name
+    app.logger.info(f"Profiled {request.endpoint} in {(time.perf_counter() - start) * 1000:.0f}ms "
+                    f"({sum(sampler.samples.values())} samples): {name}")
+    return response
+
+def _teardown_request(exc):
+    # Make sure the sampler thread never outlives a failed request
+    profiler = g.pop('_profiler', None)
+    if profiler is not None:
+        profiler[0].stop()
+
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """
+    Lists the stored request profiles (admin only).
+
+    Returns:
+        dict: JSON object with a 'profiles' list.
+    """
+    if not ENABLED:
+        abort(404)
+    return {'profiles': list_profiles()}
+
+@app.route('/admin/profiles/<name>')
+@admin_required
+def admin_profile(name):
+    """
+    Downloads a stored request profile (admin only).
+
+    Args:
+        name (str): File name from the listing.
+
+    Returns:
+        Response: The collapsed stack file as plain text.
+    """
+    if not ENABLED or not name.endswith(PROFILE_SUFFIX):
+        abort(404)
+    return send_from_directory(profile_dir(), secure_filename(name), mimetype='text/plain')
+
+if ENABLED:
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,297 @@
+"""
+Google API quota budgeting.
+Every outgoing Classroom call is charged against a per-user and a project-wide token bucket.
+Interactive page loads always get through (waiting briefly when buckets are empty), while
+background work such as teacher lookups and new-assignment checks only runs while both
+buckets hold more than a reserve. Background batches are cut into chunks that fit above the
+reserve (see batch_limit()), and a chunk waits briefly for the reserve to refill before the work is
+deferred.
+
+Buckets live in process memory. So that N processes together stay within the project budget, each
+one's project bucket gets 1/N of the configured rate and capacity, where N is QUOTA_PROCESSES or,
+when serving with gunicorn.conf.py, the number of workers (see split()). A busy worker cannot
+borrow the share of an idle one, so a process may be throttled before the project as a whole is.
+Per-user buckets are not split: a user's requests land on any worker, so a 1/N share would throttle
+their work in every process alike.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app import app
+from app.admin import admin_required
+from app.instrumentation import user_hash
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+_priority = ContextVar('classdeck_quota_priority', default=INTERACTIVE)
+
+class QuotaExceeded(Exception):
+    """Raised when background work is refused because a quota bucket is low."""
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Attributes:
+        capacity (float): Maximum number of tokens (burst size).
+        rate (float): Tokens added per second.
+        tokens (float): Current level; may go negative when interactive calls overdraw it.
+    """
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def level(self):
+        """Returns the current number of tokens."""
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def wait_time(self, cost):
+        """Returns how many seconds until ``cost`` tokens are available."""
+        with self.lock:
+            self._refill(time.monotonic())
+            missing = cost - self.tokens
+            return max(0.0, missing / self.rate) if self.rate else float('inf')
+
+    def take(self, cost):
+        """Removes ``cost`` tokens unconditionally (the level may go negative)."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= cost
+
+    def drain(self):
+        """Empties the bucket, e.g. after Google answered with a 429."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0)
+
+class QuotaScheduler:
+    """
+    Charges Google API calls against per-user and project-wide token buckets.
+
+    Attributes:
+        processes (int): Number of processes the configured budgets are split between.
+        project (TokenBucket): The bucket shared by all users.
+        users (dict): User ID -> TokenBucket.
+        stats (dict): Counters for charged, waited, deferred and 429 responses.
+    """
+    def __init__(self, config, processes=1):
+        self.config = config
+        self.lock = threading.Lock()
+        self.stats = {'charged': 0, 'waited': 0, 'deferred': 0, 'rate_limited': 0}
+        self.split(processes)
+
+    def split(self, processes):
+        """
+        Gives this process an equal share of the configured project budget and refills its buckets.
+
+        Args:
+            processes (int): Number of processes sharing the budgets.
+        """
+        with self.lock:
+            self.processes = max(1, processes)
+            self.project = TokenBucket(self.config['QUOTA_PROJECT_BURST'] / self.processes,
+                                       self.config['QUOTA_PROJECT_PER_MINUTE'] / 60.0 / self.processes)
+            self.users = {}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def user_bucket(self, user_id):
+        """Returns (creating if needed) the bucket for a user."""
+        with self.lock:
+            bucket = self.users.get(user_id)
+            if bucket is None:
+                self._prune()
+                bucket = TokenBucket(self.config['QUOTA_USER_BURST'], self.config['QUOTA_USER_PER_MINUTE'] / 60.0)
+                self.users[user_id] = bucket
+            return bucket
+
+    def _prune(self):
+        # Forget buckets that have refilled and been idle, so the map does not grow forever
+        if len(self.users) < 1000:
+            return
+        now = time.monotonic()
+        for user_id, bucket in list(self.users.items()):
+            if now - bucket.updated > 600 and bucket.tokens >= bucket.capacity:
+                del self.users[user_id]
+
+    def _buckets(self, user_id):
+        buckets = [self.project]
+        if user_id is not None:
+            buckets.append(self.user_bucket(user_id))
+        return buckets
+
+    def batch_limit(self):
+        """
+        Returns the most calls one background request may make: what fits above the reserve of a full bucket.
+        """
+        room = min(self.config['QUOTA_USER_BURST'], self.project.capacity) * (1 - self.config['QUOTA_BACKGROUND_RESERVE'])
+        return max(1, int(room))
+
+    def has_budget(self, user_id, cost=1):
+        """
+        Checks whether background work of the given cost may run now.
+
+        Work costing more than batch_limit() is made in chunks that are paced by the refill rate,
+        so only its first chunk has to fit now.
+
+        Args:
+            user_id (int): The user the work is for.
+            cost (int): Number of API calls the work will make.
+
+        Returns:
+            bool: True if both buckets stay above the background reserve after the charge.
+        """
+        cost = min(cost, self.batch_limit())
+        reserve = self.config['QUOTA_BACKGROUND_RESERVE']
+        return all(b.level() - cost >= b.capacity * reserve for b in self._buckets(user_id))
+
+    def _background_wait(self, buckets, cost):
+        # Seconds until every bucket holds the cost above its reserve
+        reserve = self.config['QUOTA_BACKGROUND_RESERVE']
+        return max(b.wait_time(cost + b.capacity * reserve) for b in buckets)
+
+    def charge(self, user_id, cost=1, priority=None):
+        """
+        Charges API calls against the buckets.
+
+        Interactive calls wait up to QUOTA_INTERACTIVE_MAX_WAIT_MS for tokens and then
+        proceed regardless. Background calls wait up to QUOTA_BACKGROUND_MAX_WAIT_MS for a bucket
+        to refill above its reserve and are refused after that.
+
+        Args:
+            user_id (int): The user the calls are made for (None for unattributed calls).
+            cost (int): Number of API calls.
+            priority (str, optional): INTERACTIVE or BACKGROUND; defaults to the current context.
+
+        Raises:
+            QuotaExceeded: If background work would dip into the reserve.
+        """
+        priority = priority or _priority.get()
+        buckets = self._buckets(user_id)
+        if priority == BACKGROUND:
+            wait = self._background_wait(buckets, cost)
+            if wait > 0 and cost <= self.batch_limit() and wait <= self.config['QUOTA_BACKGROUND_MAX_WAIT_MS'] / 1000.0:
+                self._count('waited')
+                time.sleep(wait)
+                wait = self._background_wait(buckets, cost)
+            if wait > 0:
+                self._count('deferred')
+                raise QuotaExceeded(f'Quota reserve reached for {cost} background call(s)')
+        else:
+            wait = min(max(b.wait_time(cost) for b in buckets),
+                       self.config['QUOTA_INTERACTIVE_MAX_WAIT_MS'] / 1000.0)
+            if wait > 0:
+                self._count('waited')
+                time.sleep(wait)
+        for bucket in buckets:
+            bucket.take(cost)
+        self._count('charged', cost)
+
+    def rate_limited(self, user_id):
+        """Records a 429 from Google by draining the affected buckets."""
+        self._count('rate_limited')
+        for bucket in self._buckets(user_id):
+            bucket.drain()
+
+    def metrics(self):
+        """
+        Returns the current bucket levels and counters.
+
+        Returns:
+            dict: JSON-serializable metrics.
+        """
+        with self.lock:
+            users = list(self.users.items())
+            stats = dict(self.stats)
+        return {
+            'processes': self.processes,
+            'project': {'level': round(self.project.level(), 2), 'capacity': self.project.capacity},
+            'users': {user_hash(user_id): round(bucket.level(), 2) for user_id, bucket in users},
+            'user_capacity': self.config['QUOTA_USER_BURST'],
+            'background_batch_limit': self.batch_limit(),
+            'stats': stats
+        }
+
+scheduler = QuotaScheduler(app.config, app.config['QUOTA_PROCESSES'] or 1)
+
+@contextmanager
+def background():
+    """
+    Marks Google calls made inside the block as non-interactive background work.
+
+    Raises:
+        QuotaExceeded: From calls inside the block when a bucket is below its reserve.
+    """
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def charge(user_id, cost=1):
+    """Charges calls against the quota if QUOTA_ENABLED is set."""
+    if app.config['QUOTA_ENABLED']:
+        scheduler.charge(user_id, cost)
+
+def has_budget(user_id, cost=1):
+    """Checks the background reserve; always True when QUOTA_ENABLED is off."""
+    return not app.config['QUOTA_ENABLED'] or scheduler.has_budget(user_id, cost)
+
+def require(user_id, cost):
+    """
+    Refuses background work up front when its calls would not get through the reserve, so no quota
+    is spent on the first calls of work that is then deferred. Interactive work is never refused.
+
+    Args:
+        user_id (int): The user the work is for.
+        cost (int): Number of API calls the work will make.
+
+    Raises:
+        QuotaExceeded: If has_budget() is False for the cost.
+    """
+    if _priority.get() == BACKGROUND and not has_budget(user_id, cost):
+        scheduler._count('deferred')
+        raise QuotaExceeded(f'Quota reserve reached for {cost} background call(s)')
+
+def batch_limit(limit):
+    """
+    Caps the size of a batch request so that background batches can fit above the reserve.
+
+    Args:
+        limit (int): The batch size the caller would use otherwise.
+
+    Returns:
+        int: ``limit``, or less for background work when QUOTA_ENABLED is set.
+    """
+    if not app.config['QUOTA_ENABLED'] or _priority.get() != BACKGROUND:
+        return limit
+    return min(limit, scheduler.batch_limit())
+
+def rate_limited(user_id):
+    """Records a 429 response from Google if QUOTA_ENABLED is set."""
+    if app.config['QUOTA_ENABLED']:
+        scheduler.rate_limited(user_id)
+
+@app.route('/admin/metrics/quota')
+@admin_required
+def quota_metrics():
+    """
+    Exposes quota bucket levels and counters (admin only).
+
+    Returns:
+        dict: JSON metrics from the quota scheduler.
+    """
+    return scheduler.metrics()
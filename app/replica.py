@@ -0,0 +1,171 @@
+"""
+Read-replica routing.
+With DATABASE_REPLICA_URL set, the database session sends the SELECTs that GET and HEAD requests make
+on the user-edited tables (users, course overrides, tags and mutes, see REPLICA_TABLES) to the
+replica and everything else to the primary. Those tables are only written by form posts and logins;
+the caches are read and then upserted within the same GET request, so they are read from the
+primary. A session goes back to the primary for good once it writes, so a request reads its own
+writes; after a request that wrote, the user's next DATABASE_REPLICA_STICKY_SECONDS of requests read
+from the primary too, so the page a form redirects to is not rendered from a replica that has not
+caught up yet. GET views that decide what to write from what they read (logins, the find-or-create
+of course settings) are marked with use_primary(), and reads that must agree with a primary-only
+table (the roster, built from Course rows for a CachedCourseList revision) run in read_primary().
+Work outside a request (jobs, the cron endpoint,
+CLI commands) and SELECT ... FOR UPDATE always use the primary.
+
+The replica is a second Flask-SQLAlchemy bind that no model is mapped to, so ``db.create_all()``
+creates no tables on it. For local testing, point both URLs at SQLite files and copy the primary
+over with ``flask replica-sync`` (optionally every few seconds, to simulate lag), or use two
+Postgres instances with streaming replication.
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import click
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect as sa_inspect
+from app import app
+from app.admin import admin_required
+
+REPLICA = 'replica' # Bind key of the replica engine
+
+# Tables whose SELECTs may be served by the replica
+REPLICA_TABLES = frozenset({'user', 'course', 'user_tag', 'course_tag', 'course_tags_map', 'item_tag', 'muted_item'})
+
+# Flask session key: time until which the user's requests read from the primary
+STICKY_KEY = '_read_primary_until'
+
+_stats = {'replica': 0, 'primary': 0}
+_stats_lock = threading.Lock()
+
+def _count(target):
+    with _stats_lock:
+        _stats[target] += 1
+
+def enabled():
+    """Returns whether a read replica is configured."""
+    return REPLICA in app.config['SQLALCHEMY_BINDS']
+
+class RoutingSession(Session):
+    """
+    Session that reads from the replica where that is safe and from the primary otherwise.
+
+    ``info['wrote']`` is set once the session flushes or executes an INSERT, UPDATE or DELETE; from
+    then on it only uses the primary. ``info['read_primary']`` is set within read_primary().
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and enabled():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+                if has_request_context():
+                    g._database_wrote = True
+            elif getattr(clause, 'is_select', False): # Textual SQL and bare connections use the primary
+                if self._may_read_replica(mapper, clause):
+                    _count('replica')
+                    return self._db.engines[REPLICA]
+                _count('primary')
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _may_read_replica(self, mapper, clause):
+        if mapper is None or self.info.get('wrote') or self.info.get('read_primary'):
+            return False
+        if not has_request_context() or request.method not in ('GET', 'HEAD'):
+            return False
+        if sa_inspect(mapper).local_table.name not in REPLICA_TABLES or getattr(clause, '_for_update_arg', None) is not None:
+            return False
+        if getattr(app.view_functions.get(request.endpoint), 'use_primary', False):
+            return False
+        return session.get(STICKY_KEY, 0) <= time.time()
+
+def use_primary(view):
+    """
+    Decorator that keeps a GET view's reads on the primary, for views that write depending on what
+    they read (a find-or-create would otherwise miss rows the replica has not received yet).
+    """
+    view.use_primary = True
+    return view
+
+@contextmanager
+def read_primary():
+    """
+    Sends the session's reads to the primary within the block, e.g. for rows that must be at least
+    as new as a revision just read from a table the replica does not serve.
+    """
+    from app import db
+    info = db.session.info
+    previous = info.get('read_primary', False)
+    info['read_primary'] = True
+    try:
+        yield
+    finally:
+        info['read_primary'] = previous
+
+@app.after_request
+def stick_to_primary(response):
+    """After a request that wrote, sends the user's reads to the primary for a few seconds."""
+    if g.get('_database_wrote') and enabled() and app.config['DATABASE_REPLICA_STICKY_SECONDS']:
+        session[STICKY_KEY] = time.time() + app.config['DATABASE_REPLICA_STICKY_SECONDS']
+    return response
+
+def replica_lag():
+    """
+    Returns how far the replica's replay is behind, in seconds, or None if that is not known
+    (no replica, or not a Postgres standby).
+    """
+    from app import db
+    engine = db.engines.get(REPLICA)
+    if engine is None or engine.dialect.name != 'postgresql':
+        return None
+    with engine.connect() as conn:
+        lag = conn.exec_driver_sql(
+            'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())').scalar()
+    return float(lag) if lag is not None else None
+
+def copy_sqlite(primary, replica):
+    """
+    Copies a SQLite primary into the replica file, standing in for replication in local tests.
+
+    Args:
+        primary (Engine): The primary engine.
+        replica (Engine): The replica engine.
+    """
+    source = sqlite3.connect(primary.url.database)
+    target = sqlite3.connect(replica.url.database)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+@app.cli.command('replica-sync')
+@click.option('--every', type=float, default=0, help='Keep copying every this many seconds (default: copy once).')
+def replica_sync_command(every):
+    """Copies the primary SQLite database into the SQLite read replica."""
+    from app import db
+    if not enabled():
+        raise click.ClickException('DATABASE_REPLICA_URL is not set.')
+    primary, replica = db.engines[None], db.engines[REPLICA]
+    if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise click.ClickException('Only SQLite databases are copied; replicate other databases with their own tools.')
+    while True:
+        copy_sqlite(primary, replica)
+        click.echo(f"Copied {primary.url.database} to {replica.url.database}")
+        if not every:
+            break
+        time.sleep(every)
+
+@app.route('/admin/metrics/replica')
+@admin_required
+def replica_metrics():
+    """
+    Exposes how many SELECTs were routed to the replica and the primary (admin only).
+
+    Returns:
+        dict: Whether a replica is configured, the per-process routing counters and, for a Postgres
+            standby, its replay lag in seconds.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    return {'enabled': enabled(), 'selects': stats, 'lag_seconds': replica_lag()}
@@ -0,0 +1,316 @@
+"""
+Course roster service.
+Builds each user's merged course view (the Google course list combined with local overrides and
+tags) once, keeps it in a per-process cache and answers "active", "archived", "tagged X" and
+name-prefix queries from indexes instead of re-merging and filtering on every page load.
+
+The Google course list is cached in the database for COURSE_LIST_CACHE_SECONDS. Local edits are
+applied to the cached roster in place; a revision counter in the database tells other processes
+that their copy is out of date, and they rebuild it from the cached list without calling Google.
+When the dashboard's latency budget runs out (or Google fails) while the cached list is being
+refreshed, the older list is used and refreshed by a background job (see app.latency_budget).
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app import app, db, jobs, latency_budget, replica
+from app.models import CachedCourseList, Course, User
+from app.view_models import CourseView
+from app.google_client import get_credentials, build_service
+
+WORD = re.compile(r'\w+')
+
+def store_course_list(user_id, courses):
+    """
+    Caches a user's course list.
+
+    Args:
+        user_id (int): The local user ID.
+        courses (list): Course resources from courses.list.
+    """
+    row = CachedCourseList.query.filter_by(user_id=user_id).first()
+    if row is None:
+        row = CachedCourseList(user_id=user_id, courses=courses, revision=0)
+        db.session.add(row)
+    row.courses = courses
+    row.fetched_at = datetime.utcnow()
+    db.session.commit()
+    return row
+
+def course_list_row(user_id, max_age_seconds):
+    """
+    Returns the user's cached course list row if it is recent enough.
+
+    Args:
+        user_id (int): The local user ID.
+        max_age_seconds (int): Maximum age of the cached list; 0 disables the cache.
+
+    Returns:
+        CachedCourseList: The row, or None if there is no recent list.
+    """
+    if not max_age_seconds:
+        return None
+    row = CachedCourseList.query.filter_by(user_id=user_id).first()
+    if row is None or datetime.utcnow() - row.fetched_at > timedelta(seconds=max_age_seconds):
+        return None
+    return row
+
+def cached_course_list(user_id, max_age_seconds):
+    """
+    Returns the user's cached course list if it is recent enough.
+
+    Returns:
+        list: Course resources, or None if there is no recent list.
+    """
+    row = course_list_row(user_id, max_age_seconds)
+    return row.courses if row is not None else None
+
+class Roster:
+    """
+    One user's merged courses with lookup indexes.
+
+    Attributes:
+        google (dict): Course ID -> Google course resource, kept for in-place updates.
+        position (dict): Course ID -> position in Google's list.
+        courses (dict): Course ID -> CourseView.
+        rank (dict): Course ID -> position in display order.
+        archived (set): IDs of archived courses; every other course is active.
+        tags (dict): Tag name -> set of course IDs.
+        words (list): Sorted (word, course ID) pairs from the lower-cased course names.
+    """
+    def __init__(self, google_courses, local_courses):
+        self.lock = threading.Lock()
+        self.google = {c['id']: c for c in google_courses}
+        self.position = {course_id: i for i, course_id in enumerate(self.google)}
+        self.courses = {}
+        self.archived = set()
+        self.tags = defaultdict(set)
+        self.words = []
+        for course_id, g_course in self.google.items():
+            self._index(CourseView(g_course, local_courses.get(course_id)))
+        self.words.sort()
+        self._rank()
+
+    def _index(self, course):
+        course_id = course.id
+        self.courses[course_id] = course
+        if course.is_archived:
+            self.archived.add(course_id)
+        for tag in course.tags:
+            self.tags[tag].add(course_id)
+        for word in set(WORD.findall((course.name or '').lower())):
+            self.words.append((word, course_id))
+
+    def _unindex(self, course_id):
+        course = self.courses.pop(course_id)
+        self.archived.discard(course_id)
+        for tag in course.tags:
+            self.tags[tag].discard(course_id)
+        self.words = [entry for entry in self.words if entry[1] != course_id]
+
+    def _rank(self):
+        # Google's order breaks ties between equal display orders, as the dashboard always did
+        order = sorted(self.courses, key=lambda course_id: (self.courses[course_id].display_order,
+                                                             self.position[course_id]))
+        self.rank = {course_id: i for i, course_id in enumerate(order)}
+
+    def update(self, local_course):
+        """
+        Re-merges one course after its local overrides changed.
+
+        Args:
+            local_course (Course): The updated local record.
+        """
+        course_id = local_course.google_course_id
+        with self.lock:
+            if course_id not in self.google:
+                return
+            self._unindex(course_id)
+            self._index(CourseView(self.google[course_id], local_course))
+            self.words.sort()
+            self._rank()
+
+    def missing_teachers(self):
+        """
+        Returns [course ID, owner ID] pairs for courses whose teacher name is not known yet.
+        """
+        with self.lock:
+            return [[course_id, course.ownerId] for course_id, course in self.courses.items()
+                    if course.ownerId and not course.teacher_known]
+
+    def _prefix_matches(self, prefix):
+        ids = set()
+        i = bisect_left(self.words, (prefix,))
+        while i < len(self.words) and self.words[i][0].startswith(prefix):
+            ids.add(self.words[i][1])
+            i += 1
+        return ids
+
+    def query(self, archived=False, tags=(), prefix=None):
+        """
+        Returns courses in display order, filtered through the indexes.
+
+        Args:
+            archived (bool): Return archived instead of active courses.
+            tags (iterable): Tag names the courses must all carry.
+            prefix (str): Text whose every word must start a word of the course name.
+
+        Returns:
+            list: CourseViews.
+        """
+        with self.lock:
+            ids = set(self.archived) if archived else self.courses.keys() - self.archived
+            for tag in tags:
+                ids &= self.tags.get(tag, set())
+            for word in WORD.findall((prefix or '').lower()):
+                ids &= self._prefix_matches(word)
+            return [self.courses[course_id] for course_id in sorted(ids, key=self.rank.__getitem__)]
+
+class RosterCache:
+    """
+    Bounded, thread-safe LRU cache of rosters per user.
+
+    Each entry records the course list fetch time and local revision it was built from.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id, fetched_at, revision):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] != fetched_at or entry[1] != revision:
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[2]
+
+    def put(self, user_id, fetched_at, revision, roster):
+        with self.lock:
+            self.entries[user_id] = (fetched_at, revision, roster)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def advance(self, user_id, revision):
+        """
+        Returns the cached roster if it is exactly one revision behind, marking it current;
+        the caller then applies the change to it in place.
+        """
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[1] != revision - 1:
+                return None
+            self.entries[user_id] = (entry[0], revision, entry[2])
+            return entry[2]
+
+cache = RosterCache()
+
+def fetch_course_list(user):
+    """Fetches a user's course list from Google and caches it, returning the CachedCourseList row."""
+    classroom = build_service('classroom', 'v1', get_credentials(user), user.id)
+    results = classroom.courses().list(studentId='me').execute()
+    return store_course_list(user.id, results.get('courses', []))
+
+@jobs.handler('refresh_course_list', max_attempts=3)
+def refresh_course_list(user_id):
+    """
+    Refreshes a user's cached course list after a page had to make do with the stale one.
+
+    Args:
+        user_id (int): The local user ID.
+    """
+    user = db.session.get(User, user_id)
+    if user is not None:
+        fetch_course_list(user)
+
+def get_roster(user, budget=None):
+    """
+    Returns the user's roster, fetching the course list from Google only if the cached one is stale.
+
+    Args:
+        user (User): The user.
+        budget (latency_budget.Budget, optional): The request's latency budget. If the list must be
+            fetched and the call misses the deadline or fails transiently, the stale cached list
+            is used instead (and recorded on the budget) and a refresh is queued.
+
+    Returns:
+        Roster: The merged, indexed courses.
+    """
+    row = course_list_row(user.id, app.config['COURSE_LIST_CACHE_SECONDS'])
+    if row is None:
+        if budget is None:
+            row = fetch_course_list(user)
+        else:
+            stale = CachedCourseList.query.filter_by(user_id=user.id).first()
+            if stale is not None and not latency_budget.usable(stale.fetched_at):
+                stale = None
+            # With a stale list to fall back on, the call gives up at the deadline instead of holding a budget thread
+            classroom = build_service('classroom', 'v1', get_credentials(user), user.id,
+                                      budget.deadline if stale is not None else None)
+            try:
+                results = budget.call(lambda: classroom.courses().list(studentId='me').execute(),
+                                      fallback=stale is not None)
+            except Exception as e:
+                if stale is None or not latency_budget.is_transient(e):
+                    raise
+                budget.fall_back('class list', stale.fetched_at, e)
+                jobs.enqueue('refresh_course_list', {'user_id': user.id}, dedup_key=f'refresh-course-list:{user.id}')
+                row = stale
+            else:
+                row = store_course_list(user.id, results.get('courses', []))
+
+    roster = cache.get(user.id, row.fetched_at, row.revision)
+    if roster is None:
+        # The revision was read from the primary; Course rows from a lagging replica could predate
+        # it, and the roster would then be cached stale under the new revision
+        with replica.read_primary():
+            local_courses = {c.google_course_id: c for c in Course.query.filter_by(user_id=user.id)}
+        roster = Roster(row.courses, local_courses)
+        cache.put(user.id, row.fetched_at, row.revision, roster)
+    return roster
+
+def preload(limit):
+    """
+    Builds the rosters of the most recently fetched course lists into this process's cache, e.g.
+    before a server forks its workers so they all start with them.
+
+    Args:
+        limit (int): Most rosters to build.
+
+    Returns:
+        int: Number of rosters built.
+    """
+    rows = CachedCourseList.query.order_by(CachedCourseList.fetched_at.desc()).limit(min(limit, cache.max_entries)).all()
+    local_courses = defaultdict(dict)
+    if rows:
+        for course in Course.query.filter(Course.user_id.in_([row.user_id for row in rows])):
+            local_courses[course.user_id][course.google_course_id] = course
+    for row in reversed(rows):
+        cache.put(row.user_id, row.fetched_at, row.revision, Roster(row.courses, local_courses[row.user_id]))
+    return len(rows)
+
+def course_changed(user_id, local_course=None):
+    """
+    Records a change to a user's local course overrides or tags.
+
+    If this process holds the user's roster at the previous revision, the changed course is
+    re-merged in place; otherwise (or without ``local_course``) the roster is rebuilt on next use.
+    Commits the session.
+
+    Args:
+        user_id (int): The local user ID.
+        local_course (Course, optional): The course whose overrides changed.
+    """
+    db.session.execute(update(CachedCourseList).where(CachedCourseList.user_id == user_id)
+                       .values(revision=CachedCourseList.revision + 1))
+    db.session.commit()
+    if local_course is None:
+        return
+    revision = db.session.query(CachedCourseList.revision).filter_by(user_id=user_id).scalar()
+    roster = cache.advance(user_id, revision) if revision is not None else None
+    if roster is not None:
+        roster.update(local_course)
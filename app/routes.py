@@ -1,15 +1,17 @@
 import os
 import json
 from datetime import datetime, timedelta
-from flask import render_template, redirect, url_for, session, request, flash
+from flask import render_template, redirect, url_for, session, request, flash, abort
 from flask_login import current_user, login_user, logout_user, login_required
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import google.auth.transport.requests
 from app import app, db, login
-from app.models import User, Course, CourseTag, ItemTag, MutedItem, UserTag
+from app.models import User, Course, CourseTag, ItemTag, MutedItem, UserTag, CalendarSync, CachedCourseWork
+from app.google_client import get_credentials, build_service, build_http, batch_list
+from app import attachments, calendar_sync, coursework_cache, feed, jobs, latency_budget, replica, roster, tasks, warmup
+from app.search import safe_index_items
+from app.view_models import AssignmentView, CourseView, StreamItemView
 
 # Helper for file icons
 def get_file_icon(mime_type, title=None):
@@ -23,28 +25,7 @@ def get_file_icon(mime_type, title=None):
     Returns:
         str: A string containing the CSS classes for the icon (e.g., 'file-pdf text-red-500').
     """
-    if not mime_type:
-        return 'file text-gray-500'
-    
-    mime_type = mime_type.lower()
-    if 'pdf' in mime_type:
-        return 'file-pdf text-red-500'
-    elif 'image' in mime_type:
-        return 'file-image text-purple-500'
-    elif 'video' in mime_type:
-        return 'file-video text-red-600'
-    elif 'audio' in mime_type:
-        return 'file-audio text-yellow-500'
-    elif 'sheet' in mime_type or 'excel' in mime_type or 'spreadsheet' in mime_type:
-        return 'file-excel text-green-500'
-    elif 'presentation' in mime_type or 'powerpoint' in mime_type or 'slides' in mime_type:
-        return 'file-powerpoint text-orange-500'
-    elif 'document' in mime_type or 'word' in mime_type:
-        return 'file-word text-blue-500'
-    elif 'form' in mime_type:
-        return 'file-alt text-purple-600'
-    else:
-        return 'file text-gray-500'
+    return attachments.FILE_ICONS[attachments.mime_category(mime_type)]
 
 app.jinja_env.globals.update(get_file_icon=get_file_icon)
 
@@ -67,89 +48,53 @@ def index():
     """
     Renders the main dashboard (index) page.
     
-    Fetches the user's courses from Google Classroom, merges them with local database overrides,
-    checks for new assignments, and handles display sorting and filtering.
+    Takes the user's merged courses from the roster service, checks for new assignments, and
+    renders only the courses matching the optional query parameters. Google gets the page's
+    latency budget to answer; past it, the last known course list is shown, marked as stale.
+
+    Query Parameters:
+        tag (str): Tag name the courses must carry; may be repeated (all must match).
+        q (str): Course name prefix.
     
     Returns:
         str: Rendered HTML template for the dashboard.
     """
     courses = []
+    user_tags = []
+    selected_tags = request.args.getlist('tag')
+    query = request.args.get('q', '').strip()
+    budget = latency_budget.current('index')
     if current_user.is_authenticated:
-        # Build credentials from stored user data
-        credentials = Credentials(
-            token=current_user.access_token,
-            refresh_token=current_user.refresh_token,
-            token_uri=current_user.token_uri,
-            client_id=current_user.client_id,
-            client_secret=current_user.client_secret,
-            scopes=current_user.scopes.split(',') if current_user.scopes else []
-        )
-
         try:
-            # Get courses
-            classroom_service = build('classroom', 'v1', credentials=credentials)
-            results = classroom_service.courses().list(studentId='me').execute()
-            google_courses = results.get('courses', [])
+            # Get courses, preferring the list prefetched by the login warm-up
+            warmup.wait_for_course_list(current_user.id, budget.remaining(limit=app.config['WARMUP_WAIT_SECONDS']))
+            warming_up = warmup.in_progress(current_user.id)
+            user_roster = roster.get_roster(current_user, budget)
 
-            # Check for new assignments (last 24 hours)
+            # Check for new assignments (last 24 hours) against the local coursework cache. A background
+            # job keeps the cache fresh, so the page never waits on Google for this check.
             try:
-                current_time = datetime.utcnow()
-                yesterday = current_time - timedelta(days=1)
-                
-                # Initialize seen list in session if not present
-                if 'seen_assignments' not in session:
-                    session['seen_assignments'] = []
+                if not warming_up:
+                    coursework_cache.refresh_in_background(current_user.id, app.config['NEW_ASSIGNMENT_REFRESH_MINUTES'])
+                yesterday = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S')
                 
                 # Use a set for faster lookups and to avoid duplicates in session
-                seen_ids = set(session['seen_assignments'])
+                seen_ids = set(session.get('seen_assignments', []))
                 new_seen_ids = set()
-
-                def check_new_assignments_callback(request_id, response, exception):
-                    if exception:
-                        print(f"Error checking assignments for {request_id}: {exception}")
-                    else:
-                        course_work = response.get('courseWork', [])
-                        for work in course_work:
-                            if work.get('workType') == 'ASSIGNMENT':
-                                creation_time_str = work.get('creationTime')
-                                if creation_time_str:
-                                    try:
-                                        creation_time_str = creation_time_str.replace('Z', '')
-                                        if '.' in creation_time_str:
-                                            creation_time_str = creation_time_str.split('.')[0]
-                                        
-                                        creation_dt = datetime.fromisoformat(creation_time_str)
-                                        
-                                        if creation_dt > yesterday:
-                                            work_id = work.get('id')
-                                            # Only notify if we haven't seen this assignment in this session
-                                            if work_id not in seen_ids:
-                                                course_name = "Class"
-                                                for c in google_courses:
-                                                    if c['id'] == request_id:
-                                                        course_name = c.get('name')
-                                                        break
-                                                
-                                                flash({
-                                                    'text': f"New Assignment: {work.get('title')} in {course_name}",
-                                                    'url': url_for('course_stream', course_id=request_id)
-                                                }, 'info')
-                                                
-                                                new_seen_ids.add(work_id)
-                                    except ValueError:
-                                        pass
-
-                batch = classroom_service.new_batch_http_request(callback=check_new_assignments_callback)
-                for course in google_courses:
-                    if course.get('courseState') == 'ACTIVE':
-                        batch.add(classroom_service.courses().courseWork().list(
-                            courseId=course['id'], 
-                            orderBy='updateTime desc', 
-                            pageSize=5
-                        ), request_id=course['id'])
                 
-                if google_courses:
-                    batch.execute()
+                recent_work = CachedCourseWork.query.filter(
+                    CachedCourseWork.user_id == current_user.id,
+                    CachedCourseWork.work_type == 'ASSIGNMENT',
+                    CachedCourseWork.creation_time > yesterday
+                ).all()
+                for work in recent_work:
+                    # Only notify if we haven't seen this assignment in this session
+                    if work.google_coursework_id not in seen_ids:
+                        flash({
+                            'text': f"New Assignment: {work.title} in {work.course_name or 'Class'}",
+                            'url': url_for('course_stream', course_id=work.google_course_id)
+                        }, 'info')
+                        new_seen_ids.add(work.google_coursework_id)
                     
                 # Update session with new seen IDs
                 if new_seen_ids:
@@ -158,93 +103,35 @@ def index():
                     session.modified = True
                     
             except Exception as e:
-                print(f"Error checking new assignments: {e}")
+                app.logger.warning(f"Error checking new assignments: {e}")
             
-            # Merge with local data
-            for g_course in google_courses:
-                local_course = Course.query.filter_by(user_id=current_user.id, google_course_id=g_course['id']).first()
-                
-                # Create a display object (dict)
-                display_course = g_course.copy()
-                display_course['is_archived'] = False
-                
-                # Determine if archived (Google state or Local override)
-                if g_course.get('courseState') == 'ARCHIVED':
-                    display_course['is_archived'] = True
-                
-                if local_course:
-                    if local_course.custom_name:
-                        display_course['name'] = local_course.custom_name
-                    if local_course.custom_section:
-                        display_course['section'] = local_course.custom_section
-                    if local_course.custom_code:
-                        display_course['enrollmentCode'] = local_course.custom_code # Override enrollment code for display
-                    if local_course.is_archived:
-                        display_course['is_archived'] = True
-                    # Add other custom fields if needed for template
-                    display_course['custom_banner'] = local_course.custom_banner
-                    display_course['custom_icon'] = local_course.custom_icon
-                    display_course['custom_teacher_name'] = local_course.custom_teacher_name
-                    display_course['cached_teacher_name'] = local_course.cached_teacher_name
-                    display_course['display_order'] = local_course.display_order
-                    display_course['tags'] = local_course.user_tags
-                else:
-                    display_course['tags'] = []
-                
-                # Fetch teacher name if missing
-                if not display_course.get('custom_teacher_name') and not display_course.get('cached_teacher_name'):
-                    try:
-                        # We need to fetch the teacher profile. 
-                        # Note: This can be slow for many courses. Ideally, do this asynchronously or in batch.
-                        # For now, we'll do it on demand and cache it.
-                        owner_id = g_course.get('ownerId')
-                        if owner_id:
-                            user_profile = classroom_service.userProfiles().get(userId=owner_id).execute()
-                            teacher_name = user_profile.get('name', {}).get('fullName')
-                            
-                            if not local_course:
-                                local_course = Course(user_id=current_user.id, google_course_id=g_course['id'])
-                                db.session.add(local_course)
-                            
-                            local_course.cached_teacher_name = teacher_name
-                            db.session.commit()
-                            display_course['cached_teacher_name'] = teacher_name
-                    except HttpError as e:
-                        if e.resp.status == 403:
-                             # Check for missing scopes
-                            required_scopes = set(app.config['GOOGLE_SCOPES'])
-                            current_scopes = set(current_user.scopes.split(',')) if current_user.scopes else set()
-                            
-                            missing_scopes = required_scopes - current_scopes
-                            if missing_scopes:
-                                print(f"Missing scopes for teacher fetch: {missing_scopes}")
-                                logout_user()
-                                flash('New permissions are required to view teacher names. Please log in again.', 'info')
-                                return redirect(url_for('login'))
-                        print(f"Error fetching teacher for {g_course['id']}: {e}")
-                    except Exception as e:
-                        print(f"Error fetching teacher for {g_course['id']}: {e}")
-
-                # Final Teacher Name Logic
-                display_course['teacher_name'] = display_course.get('custom_teacher_name') or display_course.get('cached_teacher_name') or 'Unknown Teacher'
-
-                if not display_course['is_archived']:
-                    courses.append(display_course)
+            # Only the requested cards are rendered; filtering uses the roster's indexes
+            courses = user_roster.query(tags=selected_tags, prefix=query)
+
+            # Look up missing teacher names in the background; they appear on a later page load
+            # A lookup refused for missing profile scopes asks the user to log in again
+            if current_user.reconsent_required:
+                logout_user()
+                flash('New permissions are required to view teacher names. Please log in again.', 'info')
+                return redirect(url_for('login'))
+            teacher_lookups = user_roster.missing_teachers()
+            if teacher_lookups and not warming_up:
+                jobs.enqueue('teacher_lookup', {'user_id': current_user.id, 'courses': teacher_lookups},
+                             dedup_key=f'teacher-lookup:{current_user.id}')
+            
+            tasks.refresh_token_soon(current_user)
                     
         except Exception as e:
             # Token might be expired and refresh failed, or other API error
             flash(f'Error fetching courses: {str(e)}', 'error')
             # Optionally force re-login if token is invalid
             
-    # Sort courses by display_order
-    courses.sort(key=lambda x: x.get('display_order', 0))
-    
-    # Get user tags for filtering
-    user_tags = []
-    if current_user.is_authenticated:
+        # Get user tags for filtering
         user_tags = UserTag.query.filter_by(user_id=current_user.id).all()
+        budget.finish()
             
-    return render_template('index.html', title='Home', courses=courses, user_tags=user_tags)
+    return render_template('index.html', title='Home', courses=courses, user_tags=user_tags,
+                           selected_tags=selected_tags, query=query, stale_since=budget.stale_since)
 
 @app.route('/archived')
 @login_required
@@ -253,51 +140,21 @@ def archived_courses():
     Renders the archived courses page.
     
     Displays courses that are either archived in Google Classroom or locally archived by the user.
+
+    Query Parameters:
+        q (str): Course name prefix.
     
     Returns:
         str: Rendered HTML template for archived courses.
     """
     courses = []
-    # Build credentials from stored user data
-    credentials = Credentials(
-        token=current_user.access_token,
-        refresh_token=current_user.refresh_token,
-        token_uri=current_user.token_uri,
-        client_id=current_user.client_id,
-        client_secret=current_user.client_secret,
-        scopes=current_user.scopes.split(',') if current_user.scopes else []
-    )
-
+    query = request.args.get('q', '').strip()
     try:
-        # Get courses
-        classroom_service = build('classroom', 'v1', credentials=credentials)
-        results = classroom_service.courses().list(studentId='me').execute()
-        google_courses = results.get('courses', [])
-        
-        # Merge with local data
-        for g_course in google_courses:
-            local_course = Course.query.filter_by(user_id=current_user.id, google_course_id=g_course['id']).first()
-            
-            display_course = g_course.copy()
-            display_course['is_archived'] = False
-            
-            if g_course.get('courseState') == 'ARCHIVED':
-                display_course['is_archived'] = True
-            
-            if local_course:
-                if local_course.custom_name: display_course['name'] = local_course.custom_name
-                if local_course.custom_section: display_course['section'] = local_course.custom_section
-                if local_course.custom_banner: display_course['custom_banner'] = local_course.custom_banner
-                if local_course.is_archived: display_course['is_archived'] = True
-                display_course['teacher_name'] = local_course.custom_teacher_name or local_course.cached_teacher_name
-            
-            if display_course['is_archived']:
-                courses.append(display_course)
-                
+        courses = roster.get_roster(current_user).query(archived=True, prefix=query)
     except Exception as e:
         flash(f'Error fetching archived courses: {str(e)}', 'error')
         
-    return render_template('index.html', title='Archived Classes', courses=courses, is_archived_view=True)
+    return render_template('index.html', title='Archived Classes', courses=courses, is_archived_view=True, query=query)
 
 @app.route('/missing')
 @login_required
@@ -314,115 +171,99 @@ def missing_assignments():
     assignments = []
     
     # Build credentials
-    credentials = Credentials(
-        token=current_user.access_token,
-        refresh_token=current_user.refresh_token,
-        token_uri=current_user.token_uri,
-        client_id=current_user.client_id,
-        client_secret=current_user.client_secret,
-        scopes=current_user.scopes.split(',') if current_user.scopes else []
-    )
+    credentials = get_credentials(current_user)
     
     try:
-        service = build('classroom', 'v1', credentials=credentials)
+        service = build_service('classroom', 'v1', credentials, current_user.id)
         
         # 1. Get all active courses
         results = service.courses().list(studentId='me', courseStates=['ACTIVE']).execute()
         courses = results.get('courses', [])
         
-        if not courses:
-             return render_template('missing_assignments.html', title='Missing Assignments', assignments=[])
-
-        # Prepare data structures for batch results
-        all_course_work = {} # course_id -> [work]
-        all_submissions = {} # course_id -> [submission]
-        
-        # Callbacks
-        def cw_callback(request_id, response, exception):
-            if exception:
-                print(f"Error fetching coursework for {request_id}: {exception}")
-            else:
-                all_course_work[request_id] = response.get('courseWork', [])
-
-        def sub_callback(request_id, response, exception):
-            if exception:
-                print(f"Error fetching submissions for {request_id}: {exception}")
-            else:
-                all_submissions[request_id] = response.get('studentSubmissions', [])
-
-        # 2. Batch fetch CourseWork
-        batch_cw = service.new_batch_http_request(callback=cw_callback)
-        for course in courses:
-            batch_cw.add(service.courses().courseWork().list(courseId=course['id']), request_id=course['id'])
-        batch_cw.execute()
-        
-        # 3. Batch fetch Submissions
-        batch_sub = service.new_batch_http_request(callback=sub_callback)
-        for course in courses:
-            batch_sub.add(service.courses().courseWork().studentSubmissions().list(
-                courseId=course['id'],
-                courseWorkId='-',
-                userId='me',
-                states=['CREATED', 'RECLAIMED_BY_STUDENT']
-            ), request_id=course['id'])
-        batch_sub.execute()
-
-        # 4. Process Data
-        now = datetime.utcnow()
-        
-        # Fetch muted items
-        muted_items = MutedItem.query.filter_by(user_id=current_user.id).all()
-        muted_ids = {item.google_item_id for item in muted_items}
-        
-        for course in courses:
-            c_id = course['id']
-            course_work = all_course_work.get(c_id, [])
-            submissions = all_submissions.get(c_id, [])
-            
-            if not course_work:
-                continue
-                
-            # Map submissions to coursework ID
-            submission_map = {s['courseWorkId']: s for s in submissions}
+        if courses:
+            # 2. Batch fetch CourseWork (following pagination, so the cache sees every item)
+            all_course_work, cw_errors = batch_list(
+                service,
+                lambda course_id, token: service.courses().courseWork().list(courseId=course_id, pageToken=token),
+                [course['id'] for course in courses], 'courseWork'
+            ) # course_id -> [work]
+            for course_id, error in cw_errors.items():
+                app.logger.warning(f"Error fetching coursework for {course_id}: {error}")
             
-            for work in course_work:
-                if work['id'] in submission_map:
-                    # It is not turned in.
-                    assignment = work.copy()
-                    assignment['courseName'] = course['name']
-                    assignment['isMissing'] = False
-                    assignment['isMuted'] = work['id'] in muted_ids
-                    
-                    if 'dueDate' in work:
-                        # Parse due date
-                        due = work['dueDate'] # {year, month, day}
-                        time = work.get('dueTime', {'hours': 23, 'minutes': 59})
-                        
-                        try:
-                            due_dt = datetime(due['year'], due['month'], due['day'], time.get('hours', 0), time.get('minutes', 0))
-                            assignment['dueDate'] = due_dt.strftime('%Y-%m-%d %H:%M')
-                            
-                            if due_dt < now:
-                                assignment['isMissing'] = True
-                        except ValueError:
-                            assignment['dueDate'] = None
-                    else:
-                        assignment['dueDate'] = None
-                        
-                    assignments.append(assignment)
+            # 3. Batch fetch Submissions in every state (for the cache); not-turned-in ones are picked out below
+            all_submissions, _ = coursework_cache.fetch_submissions(service, [course['id'] for course in courses])
+
+            # 4. Process Data
+            assignments = collect_missing_assignments(courses, all_course_work, all_submissions)
 
     except Exception as e:
         flash(f'Error fetching missing assignments: {str(e)}', 'error')
     
-    # Sort: Missing first, then by due date
-    def sort_key(a):
-        is_missing = 0 if a.get('isMissing') else 1
-        due = a.get('dueDate') or '9999-99-99'
-        return (is_missing, due)
+    return render_missing_assignments(assignments)
+
+def collect_missing_assignments(courses, all_course_work, all_submissions):
+    """
+    Picks the not-turned-in coursework out of fetched course data and updates the local caches with it.
+
+    Shared by the synchronous and async views; only the fetching differs between them.
+
+    Args:
+        courses (list): The user's active courses.
+        all_course_work (dict): Course ID -> coursework.
+        all_submissions (dict): Course ID -> the user's submissions in every state.
+
+    Returns:
+        list: AssignmentViews.
+    """
+    assignments = []
+    now = datetime.utcnow()
+    
+    # Fetch muted items
+    muted_items = MutedItem.query.filter_by(user_id=current_user.id).all()
+    muted_ids = {item.google_item_id for item in muted_items}
+    
+    # Local name overrides, so indexed items carry the same course name as the stream view
+    course_names = coursework_cache.display_names(current_user.id, courses)
+    
+    # Keep the local coursework cache (deadline feed, analytics) in sync with what we just fetched
+    coursework_cache.safe_store_coursework(current_user.id, course_names, all_course_work,
+                                           submissions=all_submissions)
+    
+    for course in courses:
+        c_id = course['id']
+        course_work = all_course_work.get(c_id, [])
+        submissions = all_submissions.get(c_id, [])
+        
+        if not course_work:
+            continue
         
-    assignments.sort(key=sort_key)
+        # Keep the search index up to date with the coursework we just fetched
+        for work in course_work:
+            work['type'] = 'assignment'
+        safe_index_items(current_user.id, c_id, course_names[c_id], course_work)
+            
+        # Map not-yet-turned-in submissions to coursework ID
+        submission_map = {s['courseWorkId']: s for s in submissions
+                          if s.get('state') in ('CREATED', 'RECLAIMED_BY_STUDENT')}
+        
+        for work in course_work:
+            if work['id'] in submission_map:
+                # It is not turned in.
+                assignments.append(AssignmentView(work, course['name'], now, muted=work['id'] in muted_ids))
+
+    # Attachments of all the courses are indexed together, with one query and one commit
+    attachments.safe_index_attachments(current_user.id, {c_id: (course_names[c_id], all_course_work[c_id])
+                                                         for c_id in course_names if all_course_work.get(c_id)})
+    return assignments
+
+def render_missing_assignments(assignments):
+    """
+    Sorts assignments (missing first, then by due date) and renders the missing assignments page.
+    """
+    assignments.sort(key=AssignmentView.sort_key)
     
-    return render_template('missing_assignments.html', title='Missing Assignments', assignments=assignments)
+    return render_template('missing_assignments.html', title='Missing Assignments', assignments=assignments,
+                           feed_url=feed.feed_url(current_user.id))
 
 @app.route('/update_course_order', methods=['POST'])
 @login_required
@@ -447,10 +288,12 @@ def update_course_order():
         course.display_order = index
         
     db.session.commit()
+    roster.course_changed(current_user.id)
     return {'status': 'success'}
 
 @app.route('/course/<course_id>/edit', methods=['GET', 'POST'])
 @login_required
+@replica.use_primary
 def edit_course(course_id):
     """
     Handles editing of course settings (name, section, tags, etc.).
@@ -504,13 +347,10 @@ def edit_course(course_id):
                 course.user_tags.append(tag)
         
         db.session.commit()
+        roster.course_changed(current_user.id, course)
         
-        # Cleanup unused tags
-        user_tags = UserTag.query.filter_by(user_id=current_user.id).all()
-        for tag in user_tags:
-            if not tag.courses:
-                db.session.delete(tag)
-        db.session.commit()
+        # Cleanup unused tags (in the background)
+        jobs.enqueue('cleanup_user_tags', {'user_id': current_user.id}, dedup_key=f'cleanup-tags:{current_user.id}')
         
         flash('Course updated successfully!', 'success')
         return redirect(url_for('index'))
@@ -640,6 +480,8 @@ def toggle_mute_assignment(item_id):
         muted = MutedItem(user_id=current_user.id, google_item_id=item_id)
         db.session.add(muted)
         status = 'muted'
+    # Muted items are left out of the deadline feed, so it has changed
+    coursework_cache.touch(current_user.id)
     db.session.commit()
     
     # Return JSON if AJAX, else redirect
@@ -655,7 +497,8 @@ def course_stream(course_id):
     Renders the stream view for a specific course.
     
     Fetches announcements, coursework, and materials from Google Classroom.
-    Merges with local tag data.
+    Merges with local tag data. The four calls run concurrently within the page's latency
+    budget; any that is late or fails transiently is shown from its last known good copy.
     
     Args:
         course_id (str): The Google Course ID.
@@ -663,46 +506,72 @@ def course_stream(course_id):
     Returns:
         str: Rendered HTML template for the course stream.
     """
+    budget = latency_budget.current('course_stream')
+    source = latency_budget.CourseStreamSource(budget, current_user.id, course_id)
+
     # Build credentials
-    credentials = Credentials(
-        token=current_user.access_token,
-        refresh_token=current_user.refresh_token,
-        token_uri=current_user.token_uri,
-        client_id=current_user.client_id,
-        client_secret=current_user.client_secret,
-        scopes=current_user.scopes.split(',') if current_user.scopes else []
-    )
+    credentials = get_credentials(current_user)
     
-    # Force refresh if needed (though google-auth usually handles this)
-    if credentials.expired:
-        request_adapter = google.auth.transport.requests.Request()
-        credentials.refresh(request_adapter)
-        # Update DB with new token
-        current_user.access_token = credentials.token
-        db.session.commit()
+    # Refresh a soon-to-expire token in the background (google-auth still refreshes inline if it has expired)
+    tasks.refresh_token_soon(current_user)
     
-    service = build('classroom', 'v1', credentials=credentials)
+    service = build_service('classroom', 'v1', credentials, current_user.id)
+    # Calls made concurrently each need their own transport (httplib2 is not thread-safe). Calls
+    # with a fallback give up at the deadline, so abandoned ones do not hold the budget's threads
+    user_id = current_user.id
+    available = source.available()
+    http = ((lambda part: build_http(credentials, user_id, budget.deadline if part in available else None))
+            if budget.deadline is not None else (lambda part: None))
     
+    fetches = {
+        'course': lambda: service.courses().get(id=course_id).execute(http=http('course')),
+        # 1. Announcements
+        'announcement': lambda: service.courses().announcements().list(courseId=course_id).execute(http=http('announcement')).get('announcements', []),
+        # 2. CourseWork (Assignments, Questions)
+        'assignment': lambda: service.courses().courseWork().list(courseId=course_id).execute(http=http('assignment')).get('courseWork', []),
+        # 3. CourseWorkMaterials
+        'material': lambda: service.courses().courseWorkMaterials().list(courseId=course_id).execute(http=http('material')).get('courseWorkMaterial', []),
+    }
+    results = budget.gather(fetches, available)
+    listings = [(item_type, results[item_type]) for item_type in ('announcement', 'assignment', 'material')]
+    return render_course_stream(course_id, results['course'], listings, source)
+
+def render_course_stream(course_id, get_course, listings, source=None):
+    """
+    Builds and renders a course stream from Google data, local overrides and tags.
+
+    Shared by the synchronous and async views. The callables either fetch when called or hand
+    back a prefetched result (raising its error), so failures are handled the same either way.
+
+    Args:
+        course_id (str): The Google Course ID.
+        get_course (callable): Returns the course resource.
+        listings (iterable): (item type, callable returning the items) pairs, in fetch order.
+        source (latency_budget.CourseStreamSource, optional): Falls back to the last known good
+            data for calls that were late or failed transiently, and stores fresh data.
+
+    Returns:
+        Response: The rendered stream, or a redirect if the course cannot be loaded.
+    """
+    if source is None:
+        source = latency_budget.CourseStreamSource(latency_budget.current('course_stream'), current_user.id, course_id)
+
     # Fetch Course Details (for banner/name)
     try:
-        google_course = service.courses().get(id=course_id).execute()
+        google_course = source.get('course', get_course)
     except Exception as e:
+        source.finish()
         flash(f'Error fetching course: {str(e)}', 'error')
         return redirect(url_for('index'))
 
     # Apply local overrides
     local_course = Course.query.filter_by(user_id=current_user.id, google_course_id=course_id).first()
-    course = google_course.copy()
+    course = CourseView(google_course, local_course)
     
     tags = []
     item_tags_map = {}
 
     if local_course:
-        if local_course.custom_name: course['name'] = local_course.custom_name
-        if local_course.custom_section: course['section'] = local_course.custom_section
-        if local_course.custom_banner: course['custom_banner'] = local_course.custom_banner
-        if local_course.custom_code: course['enrollmentCode'] = local_course.custom_code
-        
         tags = local_course.tags
         tag_ids = [t.id for t in tags]
         if tag_ids:
@@ -715,29 +584,15 @@ def course_stream(course_id):
                     item_tags_map[a.google_item_id].append(tag_obj)
     
     # Fetch Stream Items
-    stream_items = []
+    google_items = []
+    complete = False
     
-    # Debug: Print current scopes
-    print(f"Current User Scopes: {current_user.scopes}")
-
     try:
-        # 1. Announcements
-        announcements = service.courses().announcements().list(courseId=course_id).execute().get('announcements', [])
-        for a in announcements:
-            a['type'] = 'announcement'
-            stream_items.append(a)
-            
-        # 2. CourseWork (Assignments, Questions)
-        coursework = service.courses().courseWork().list(courseId=course_id).execute().get('courseWork', [])
-        for w in coursework:
-            w['type'] = 'assignment' # or 'question' based on workType
-            stream_items.append(w)
-            
-        # 3. CourseWorkMaterials
-        materials = service.courses().courseWorkMaterials().list(courseId=course_id).execute().get('courseWorkMaterial', [])
-        for m in materials:
-            m['type'] = 'material'
-            stream_items.append(m)
+        for item_type, list_items in listings:
+            for item in source.get(item_type, list_items):
+                item['type'] = item_type # coursework is 'assignment' whatever its workType
+                google_items.append(item)
+        complete = True
             
     except HttpError as e:
         if e.resp.status == 403:
@@ -747,7 +602,8 @@ def course_stream(course_id):
             
             missing_scopes = required_scopes - current_scopes
             if missing_scopes:
-                print(f"Missing scopes: {missing_scopes}")
+                app.logger.info(f"Missing scopes: {missing_scopes}")
+                source.finish()
                 logout_user()
                 flash('New permissions are required. Please log in again to grant them.', 'info')
                 return redirect(url_for('login'))
@@ -755,33 +611,60 @@ def course_stream(course_id):
         flash(f'Error fetching stream: {str(e)}', 'warning')
     except Exception as e:
         flash(f'Error fetching stream: {str(e)}', 'warning')
+    source.finish()
+
+    # Keep the search index up to date with the items we just fetched
+    safe_index_items(current_user.id, course_id, course.name, google_items)
+    attachments.safe_index_attachments(current_user.id, {course_id: (course.name, google_items)}, complete=complete)
 
     # Sort by creation time (newest first)
-    # Note: Different items have different time fields (creationTime, updateTime)
-    def get_sort_time(item):
-        return item.get('creationTime') or item.get('updateTime') or '1970-01-01T00:00:00.000Z'
-        
-    stream_items.sort(key=get_sort_time, reverse=True)
+    stream_items = [StreamItemView(item, item['type']) for item in google_items]
+    stream_items.sort(key=StreamItemView.sort_key, reverse=True)
 
-    return render_template('course_stream.html', course=course, stream_items=stream_items, tags=tags, item_tags_map=item_tags_map)
+    return render_template('course_stream.html', course=course, stream_items=stream_items, tags=tags,
+                           item_tags_map=item_tags_map, stale_since=source.budget.stale_since)
 
 @app.route('/sync_calendar')
 @login_required
 def sync_calendar():
     """
-    Placeholder route for calendar synchronization.
-    
+    Starts an incremental sync of coursework due dates into the user's Google Calendar.
+
+    The sync runs in the background and only sends the event inserts, patches and deletes
+    needed since the last run.
+
     Returns:
-        redirect: Redirects to index with a 'coming soon' message.
+        redirect: Redirects to index with a status message.
     """
-    # Placeholder for calendar sync logic
-    # 1. Fetch assignments from Google Classroom
-    # 2. Check if they exist in Google Calendar
-    # 3. If not, add them
-    
-    flash('Calendar sync feature coming soon!', 'info')
+    if calendar_sync.start_sync(current_user.id):
+        flash('Calendar sync started. Your deadlines will appear in Google Calendar shortly.', 'info')
+    else:
+        flash('A calendar sync is already running.', 'info')
     return redirect(url_for('index'))
 
+@app.route('/sync_calendar/status')
+@login_required
+def sync_calendar_status():
+    """
+    Reports the state of the user's last calendar sync.
+
+    Returns:
+        dict: JSON status with counts of inserted, patched, deleted and failed events.
+    """
+    state = CalendarSync.query.filter_by(user_id=current_user.id).first()
+    if not state:
+        return {'status': 'never'}
+    return {
+        'status': state.status,
+        'started_at': state.started_at.isoformat() + 'Z' if state.started_at else None,
+        'finished_at': state.finished_at.isoformat() + 'Z' if state.finished_at else None,
+        'inserted': state.inserted,
+        'patched': state.patched,
+        'deleted': state.deleted,
+        'failed': state.failed,
+        'last_error': state.last_error
+    }
+
 @app.route('/login')
 def login():
     """
@@ -807,6 +690,7 @@ def login():
     return redirect(authorization_url)
 
 @app.route('/callback')
+@replica.use_primary
 def callback():
     """
     Handles the callback from Google OAuth.
@@ -833,7 +717,7 @@ def callback():
     credentials = flow.credentials
     
     # Get user info
-    service = build('oauth2', 'v2', credentials=credentials)
+    service = build_service('oauth2', 'v2', credentials)
     user_info = service.userinfo().get().execute()
     
     google_id = user_info.get('id')
@@ -852,19 +736,79 @@ def callback():
     user.picture = picture
     user.access_token = credentials.token
     user.refresh_token = credentials.refresh_token
+    user.token_expiry = credentials.expiry
     user.token_uri = credentials.token_uri
     user.client_id = credentials.client_id
     user.client_secret = credentials.client_secret
     user.scopes = ','.join(credentials.scopes) if credentials.scopes else ''
+    user.reconsent_required = False
     
     db.session.add(user)
     db.session.commit()
     
     login_user(user, remember=True)
+    warmup.start(user)
 
     flash('Successfully logged in!', 'success')
     return redirect(url_for('index'))
 
+@app.route('/dev/login')
+@replica.use_primary
+def emulator_login():
+    """
+    Logs in a fake user against the local Classroom API emulator, bypassing Google OAuth.
+
+    Only available when both EMULATOR_LOGIN_ENABLED and GOOGLE_API_ENDPOINT are configured.
+    Used by the load-test harness to drive simulated students through the app.
+
+    Query Parameters:
+        email (str): The fake user's email address.
+
+    Returns:
+        redirect: Redirects to the index page upon success.
+    """
+    endpoint = app.config.get('GOOGLE_API_ENDPOINT')
+    if not app.config.get('EMULATOR_LOGIN_ENABLED') or not endpoint:
+        abort(404)
+
+    email = request.args.get('email')
+    if not email:
+        return 'Missing email', 400
+
+    credentials = Credentials(
+        token=f'emu-token:{email}',
+        refresh_token=f'emu-refresh:{email}',
+        token_uri=endpoint.rstrip('/') + '/token',
+        client_id='emulator',
+        client_secret='emulator',
+        scopes=app.config['GOOGLE_SCOPES']
+    )
+
+    # Resolve the fake profile through the emulator's userinfo endpoint, as callback() does
+    service = build_service('oauth2', 'v2', credentials)
+    user_info = service.userinfo().get().execute()
+
+    user = User.query.filter_by(google_id=user_info.get('id')).first()
+    if not user:
+        user = User(google_id=user_info.get('id'), email=user_info.get('email'))
+
+    user.name = user_info.get('name')
+    user.picture = user_info.get('picture')
+    user.access_token = credentials.token
+    user.refresh_token = credentials.refresh_token
+    user.token_uri = credentials.token_uri
+    user.client_id = credentials.client_id
+    user.client_secret = credentials.client_secret
+    user.scopes = ','.join(credentials.scopes)
+    user.reconsent_required = False
+
+    db.session.add(user)
+    db.session.commit()
+
+    login_user(user, remember=True)
+    warmup.start(user)
+    return redirect(url_for('index'))
+
 @app.route('/logout')
 def logout():
     """
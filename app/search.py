@@ -0,0 +1,323 @@
+"""
+Local full-text search over stream content from all of a user's courses.
+Announcements, coursework and materials are indexed into SearchDocument rows as they are
+fetched from Google, and queries are answered from SQLite FTS5 or Postgres full-text search
+without calling Google.
+"""
+import re
+import time
+from datetime import datetime
+from flask import render_template, request
+from flask_login import current_user, login_required
+from sqlalchemy import text
+from app import app, db
+from app.models import SearchDocument
+
+# Characters used by SQLite's snippet() to mark matched terms
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def attachment_names(item):
+    """
+    Collects the titles of an item's attached Drive files, links, videos and forms.
+
+    Args:
+        item (dict): A Google Classroom stream item.
+
+    Returns:
+        list: Attachment titles.
+    """
+    names = []
+    for material in item.get('materials', []):
+        if 'driveFile' in material:
+            names.append(material['driveFile'].get('driveFile', {}).get('title'))
+        elif 'youtubeVideo' in material:
+            names.append(material['youtubeVideo'].get('title'))
+        elif 'link' in material:
+            names.append(material['link'].get('title') or material['link'].get('url'))
+        elif 'form' in material:
+            names.append(material['form'].get('title'))
+    return [n for n in names if n]
+
+def document_fields(item, course_name):
+    """
+    Extracts the searchable fields of a stream item.
+
+    Args:
+        item (dict): A Google Classroom stream item with a 'type' key.
+        course_name (str): The (display) name of the item's course.
+
+    Returns:
+        dict: Column values for a SearchDocument.
+    """
+    if item.get('type') == 'announcement':
+        text_value = item.get('text') or ''
+        title = text_value.split('\n', 1)[0][:200]
+        body = text_value
+    else:
+        title = item.get('title') or ''
+        body = item.get('description') or ''
+    return {
+        'item_type': item.get('type'),
+        'course_name': course_name,
+        'title': title,
+        'body': body,
+        'attachments': '\n'.join(attachment_names(item)),
+        'url': item.get('alternateLink'),
+        'google_update_time': item.get('updateTime') or item.get('creationTime'),
+    }
+
+def index_items(user_id, course_id, course_name, items):
+    """
+    Incrementally indexes stream items for a user.
+
+    Items whose Google updateTime (and course name) have not changed since they were last
+    indexed are skipped, so re-fetching an unchanged stream costs a single SELECT.
+
+    Args:
+        user_id (int): The local user ID.
+        course_id (str): The Google course ID the items belong to.
+        course_name (str): The (display) name of the course.
+        items (list): Google stream items, each with a 'type' key.
+
+    Returns:
+        int: Number of documents inserted or updated.
+    """
+    items = [i for i in items if i.get('id')]
+    if not items:
+        return 0
+
+    existing = {
+        doc.google_item_id: doc for doc in SearchDocument.query.filter(
+            SearchDocument.user_id == user_id,
+            SearchDocument.google_item_id.in_([i['id'] for i in items])
+        )
+    }
+    changed = 0
+    now = datetime.utcnow()
+    for item in items:
+        fields = document_fields(item, course_name)
+        doc = existing.get(item['id'])
+        if doc is None:
+            doc = SearchDocument(user_id=user_id, google_course_id=course_id, google_item_id=item['id'])
+            db.session.add(doc)
+        elif doc.google_update_time == fields['google_update_time'] and doc.course_name == course_name:
+            continue
+        for key, value in fields.items():
+            setattr(doc, key, value)
+        doc.indexed_at = now
+        changed += 1
+
+    if changed:
+        db.session.commit()
+    return changed
+
+def safe_index_items(user_id, course_id, course_name, items):
+    """
+    Indexes items without ever failing the calling request.
+
+    Returns:
+        int: Number of documents written, or 0 if indexing failed.
+    """
+    try:
+        return index_items(user_id, course_id, course_name, items)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Error indexing items for search in {course_id}: {e}")
+        return 0
+
+def query_terms(query):
+    """
+    Splits a user query into search terms.
+
+    Args:
+        query (str): Raw user input.
+
+    Returns:
+        list: Lower-cased word tokens.
+    """
+    return [t.lower() for t in TOKEN_RE.findall(query or '')][:12]
+
+def _fts5_available():
+    try:
+        db.session.execute(text("SELECT 1 FROM search_document_fts LIMIT 0"))
+        return True
+    except Exception:
+        db.session.rollback()
+        return False
+
+def search(user_id, query, course_id=None, limit=20, offset=0):
+    """
+    Searches a user's indexed stream content.
+
+    Every term must match (prefix matching is used so partial words work). Results are
+    ranked with BM25 on SQLite or ts_rank on Postgres, weighting titles above attachment
+    names above body text. Other databases fall back to an unranked LIKE scan.
+
+    Args:
+        user_id (int): The local user ID.
+        query (str): The search text.
+        course_id (str, optional): Restrict results to one Google course.
+        limit (int): Maximum number of results.
+        offset (int): Number of results to skip.
+
+    Returns:
+        list: Result dicts with document fields, 'snippet' and 'score'.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    dialect = db.engine.dialect.name
+    params = {'user_id': user_id, 'limit': limit, 'offset': offset}
+    course_filter = ''
+    if course_id:
+        course_filter = 'AND d.google_course_id = :course_id'
+        params['course_id'] = course_id
+
+    if dialect == 'sqlite' and _fts5_available():
+        params['match'] = ' '.join(f'"{t}"*' for t in terms)
+        sql = f"""
+            SELECT d.id, bm25(search_document_fts, 10.0, 1.0, 5.0) AS score,
+                   snippet(search_document_fts, -1, '{MATCH_START}', '{MATCH_END}', '...', 16) AS snippet
+            FROM search_document_fts
+            JOIN search_document d ON d.id = search_document_fts.rowid
+            WHERE search_document_fts MATCH :match AND d.user_id = :user_id {course_filter}
+            ORDER BY score
+            LIMIT :limit OFFSET :offset
+        """
+    elif dialect == 'postgresql':
+        params['tsquery'] = ' & '.join(f'{t}:*' for t in terms)
+        sql = f"""
+            SELECT d.id, ts_rank(d.search_vector, q) AS score,
+                   ts_headline('english', coalesce(d.body, '') || ' ' || coalesce(d.attachments, ''), q,
+                               'StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords=24, MinWords=8') AS snippet
+            FROM search_document d, to_tsquery('english', :tsquery) q
+            WHERE d.user_id = :user_id AND d.search_vector @@ q {course_filter}
+            ORDER BY score DESC
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        conditions = []
+        for n, term in enumerate(terms):
+            params[f'term{n}'] = f'%{term}%'
+            conditions.append(f"(lower(d.title) LIKE :term{n} OR lower(d.body) LIKE :term{n} "
+                              f"OR lower(d.attachments) LIKE :term{n})")
+        sql = f"""
+            SELECT d.id, 0 AS score, substr(coalesce(d.body, ''), 1, 160) AS snippet
+            FROM search_document d
+            WHERE d.user_id = :user_id AND {' AND '.join(conditions)} {course_filter}
+            ORDER BY d.google_update_time DESC
+            LIMIT :limit OFFSET :offset
+        """
+
+    rows = db.session.execute(text(sql), params).fetchall()
+    docs = {d.id: d for d in SearchDocument.query.filter(SearchDocument.id.in_([r.id for r in rows]))}
+    results = []
+    for row in rows:
+        doc = docs.get(row.id)
+        if doc:
+            results.append({
+                'id': doc.google_item_id,
+                'course_id': doc.google_course_id,
+                'course_name': doc.course_name,
+                'type': doc.item_type,
+                'title': doc.title,
+                'snippet': row.snippet or '',
+                'url': doc.url,
+                'updated': doc.google_update_time,
+                'score': float(row.score or 0),
+            })
+    return results
+
+def snippet_segments(snippet):
+    """
+    Splits a snippet with match markers into (text, is_match) segments for safe rendering.
+
+    Args:
+        snippet (str): Snippet text containing MATCH_START/MATCH_END markers.
+
+    Returns:
+        list: (str, bool) tuples.
+    """
+    segments = []
+    for n, part in enumerate(re.split(f'[{MATCH_START}{MATCH_END}]', snippet or '')):
+        if part:
+            segments.append((part, n % 2 == 1))
+    return segments
+
+app.jinja_env.globals.update(snippet_segments=snippet_segments)
+
+def indexed_courses(user_id):
+    """
+    Lists the courses that have indexed content, for the course filter.
+
+    Returns:
+        list: (google_course_id, course_name) tuples sorted by name.
+    """
+    rows = db.session.query(SearchDocument.google_course_id, db.func.max(SearchDocument.course_name)) \
+        .filter(SearchDocument.user_id == user_id) \
+        .group_by(SearchDocument.google_course_id).all()
+    return sorted(rows, key=lambda r: (r[1] or '').lower())
+
+def _search_args():
+    query = request.args.get('q', '').strip()
+    course_id = request.args.get('course') or None
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+    return query, course_id, page
+
+@app.route('/search')
+@login_required
+def search_page():
+    """
+    Renders the search page with results from the local index.
+
+    Query Parameters:
+        q (str): The search text.
+        course (str, optional): Google course ID to filter by.
+        page (int, optional): Result page number.
+
+    Returns:
+        str: Rendered HTML template for the search page.
+    """
+    query, course_id, page = _search_args()
+    per_page = app.config['SEARCH_PAGE_SIZE']
+    start = time.perf_counter()
+    results = search(current_user.id, query, course_id, limit=per_page + 1, offset=(page - 1) * per_page)
+    took_ms = (time.perf_counter() - start) * 1000
+    return render_template('search.html', title='Search', query=query, course_id=course_id, page=page,
+                           results=results[:per_page], has_more=len(results) > per_page,
+                           courses=indexed_courses(current_user.id), took_ms=took_ms)
+
+@app.route('/api/search')
+@login_required
+def search_api():
+    """
+    JSON search endpoint backed by the local index.
+
+    Query Parameters:
+        q (str): The search text.
+        course (str, optional): Google course ID to filter by.
+        page (int, optional): Result page number.
+
+    Returns:
+        dict: {'query', 'course', 'page', 'took_ms', 'results'}.
+    """
+    query, course_id, page = _search_args()
+    per_page = app.config['SEARCH_PAGE_SIZE']
+    start = time.perf_counter()
+    results = search(current_user.id, query, course_id, limit=per_page, offset=(page - 1) * per_page)
+    for result in results:
+        result['snippet'] = result['snippet'].replace(MATCH_START, '').replace(MATCH_END, '')
+    return {
+        'query': query,
+        'course': course_id,
+        'page': page,
+        'took_ms': round((time.perf_counter() - start) * 1000, 2),
+        'results': results
+    }
@@ -0,0 +1,94 @@
+"""
+Production serving on gunicorn.
+``gunicorn.conf.py`` at the project root runs the WSGI app on pre-forked gthread workers; ``flask
+serve`` starts gunicorn with it. The app is imported once, in the master process (preload), which
+then warms the caches the workers share (every template compiled, the most recently used rosters
+built) before it binds its socket, so the workers start from copy-on-write copies of them and no
+request is served cold.
+
+Nothing process-bound may cross the fork. The master closes its database connections once warmed
+up and every worker drops the connection pools it inherited (after_fork()); the master starts no
+threads, since threads do not survive a fork.
+
+Each worker runs 1 + SERVE_IO_WAIT_RATIO threads: a request that waits that many units of time on
+Google and the database per unit of CPU time needs that many threads to keep one CPU busy, and
+one worker per CPU keeps the machine busy. SIGHUP replaces the workers gracefully (each finishes
+its requests within SERVE_GRACEFUL_TIMEOUT), as does reaching SERVE_MAX_REQUESTS. Since the code
+is preloaded, HUP does not pick up new code: send USR2 to start a new master running it alongside
+the old one, then QUIT the old master.
+"""
+import math
+import os
+import sys
+import threading
+import click
+from sqlalchemy.exc import SQLAlchemyError
+from app import app, db, roster
+
+CONFIG_FILE = os.path.join(os.path.dirname(app.root_path), 'gunicorn.conf.py')
+
+def cpu_count():
+    """Returns the number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError: # Not available on macOS or Windows
+        return os.cpu_count() or 1
+
+def worker_count():
+    """Returns the number of worker processes: SERVE_WORKERS, or one per CPU."""
+    return app.config['SERVE_WORKERS'] or cpu_count()
+
+def thread_count():
+    """Returns the number of request threads per worker: SERVE_THREADS, or 1 + SERVE_IO_WAIT_RATIO."""
+    return app.config['SERVE_THREADS'] or 1 + math.ceil(app.config['SERVE_IO_WAIT_RATIO'])
+
+def warm_up():
+    """
+    Fills the caches the workers inherit, then closes the database connections it used.
+
+    Returns:
+        dict: Number of templates compiled and rosters built.
+    """
+    templates = 0
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+            templates += 1
+    rosters = 0
+    with app.app_context():
+        try:
+            rosters = roster.preload(app.config['SERVE_WARM_ROSTERS'])
+        except SQLAlchemyError as e:
+            # An uninitialized database is not a reason to refuse to start
+            app.logger.warning(f"Could not preload rosters: {e}")
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    return {'templates': templates, 'rosters': rosters}
+
+def stray_threads():
+    """Returns the names of threads other than the main one, which a fork would leave behind."""
+    return [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()]
+
+def after_fork():
+    """
+    Makes a freshly forked worker safe to use: the connection pools inherited from the master are
+    dropped without closing their connections, which belong to the master.
+    """
+    with app.app_context():
+        for engine in db.engines.values(): # The primary and, if configured, the read replica
+            engine.dispose(close=False)
+
+@app.cli.command('serve')
+@click.option('--bind', help='Address to listen on (default: SERVE_BIND).')
+@click.option('--workers', type=int, help='Worker processes (default: SERVE_WORKERS, or one per CPU).')
+@click.option('--threads', type=int, help='Threads per worker (default: SERVE_THREADS, or 1 + SERVE_IO_WAIT_RATIO).')
+def serve_command(bind, workers, threads):
+    """Runs ClassDeck on gunicorn with the bundled production configuration."""
+    argv = [sys.executable, '-m', 'gunicorn', '--config', CONFIG_FILE,
+            '--chdir', os.path.dirname(CONFIG_FILE)]
+    for option, value in (('--bind', bind), ('--workers', workers), ('--threads', threads)):
+        if value:
+            argv += [option, str(value)]
+    argv.append('run:app')
+    os.execv(sys.executable, argv)
@@ -0,0 +1,238 @@
+"""
+Request coalescing ("single-flight") for identical in-flight Google calls.
+When several requests of one user make the same GET call at the same time (several course tabs
+opened at once, or the dashboard and the missing assignments page loading together), only the
+first makes the call; the others wait for it and share its response.
+
+Within a process, flights are tracked in memory. With SINGLE_FLIGHT_SHARED set, calls are also
+coalesced across processes through the FetchLock table: the process whose row insert succeeds
+makes the call and writes the response into the row, and other processes poll for it.
+Any response is shared, error statuses included; if the call raises (or a waiter gives up
+waiting), the waiters make their own call.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+import httplib2
+from flask import has_app_context
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app import app, db
+from app.admin import admin_required
+from app.instrumentation import timed
+from app.models import FetchLock
+
+class Flight:
+    """
+    One in-flight call within this process.
+
+    Attributes:
+        done (threading.Event): Set when the call has finished.
+        result: The call's result, if it succeeded.
+        ok (bool): Whether the call succeeded.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.ok = False
+
+class SingleFlight:
+    """
+    Thread-safe table of in-flight calls keyed by (user, request).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.stats = defaultdict(int)
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def do(self, key, fn, wait_seconds, label=None):
+        """
+        Runs ``fn`` unless an identical call is already in flight, in which case waits for its result.
+
+        Args:
+            key (str): Identifies the call (user and request).
+            fn (callable): Makes the call.
+            wait_seconds (float): Longest a waiter waits before making the call itself.
+            label (str, optional): Description of the call for timing instrumentation.
+
+        Returns:
+            The result of ``fn`` (or of the identical call that was already in flight).
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            with timed('google-wait', label):
+                finished = flight.done.wait(wait_seconds)
+            if finished and flight.ok:
+                self._count('coalesced')
+                return flight.result
+            self._count('fallback')
+            return fn()
+
+        self._count('calls')
+        try:
+            flight.result = fn()
+            flight.ok = True
+            return flight.result
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def metrics(self):
+        with self.lock:
+            return {'in_flight': len(self.flights), 'stats': dict(self.stats)}
+
+flights = SingleFlight()
+
+def _acquire(digest, holder, lock_seconds):
+    """
+    Tries to take the lock row for a call.
+
+    Returns:
+        str: None if this flight now holds the lock, otherwise the current holder's ID.
+    """
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        # Abandoned flights and expired responses go; a finished flight's row is never taken over as a cache
+        conn.execute(delete(FetchLock).where(or_(
+            FetchLock.expires_at < now,
+            (FetchLock.key == digest) & FetchLock.status.isnot(None))))
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(FetchLock.__table__.insert().values(
+                key=digest, holder=holder, expires_at=now + timedelta(seconds=lock_seconds)))
+        return None
+    except IntegrityError:
+        with db.engine.connect() as conn:
+            current = conn.execute(select(FetchLock.holder).where(FetchLock.key == digest)).scalar()
+        return current or ''
+
+def _publish(digest, holder, result):
+    resp, content = result
+    with db.engine.begin() as conn:
+        conn.execute(update(FetchLock).where(FetchLock.key == digest, FetchLock.holder == holder).values(
+            status=resp.status, headers=json.dumps(dict(resp)), content=content,
+            expires_at=datetime.utcnow() + timedelta(seconds=app.config['SINGLE_FLIGHT_RESULT_SECONDS'])))
+
+def _release(digest, holder):
+    with db.engine.begin() as conn:
+        conn.execute(delete(FetchLock).where(FetchLock.key == digest, FetchLock.holder == holder))
+
+def _await(digest, holder, deadline):
+    """
+    Polls the lock row until the holder publishes its response.
+
+    Returns:
+        tuple: (resp, content), or None if the flight ended without a response, was replaced, or
+            the deadline passed.
+    """
+    poll = app.config['SINGLE_FLIGHT_POLL_MS'] / 1000.0
+    while time.monotonic() < deadline:
+        time.sleep(poll)
+        with db.engine.connect() as conn:
+            row = conn.execute(select(FetchLock.holder, FetchLock.expires_at, FetchLock.status,
+                                      FetchLock.headers, FetchLock.content)
+                               .where(FetchLock.key == digest)).first()
+        if row is None or row.holder != holder or row.expires_at < datetime.utcnow():
+            return None
+        if row.status is not None:
+            return httplib2.Response(json.loads(row.headers)), row.content
+    return None
+
+def shared_do(key, fn, wait_seconds, label=None):
+    """
+    Runs an HTTP call through the cross-process lock table.
+
+    Args:
+        key (str): Identifies the call (user and request).
+        fn (callable): Makes the call and returns (httplib2.Response, content).
+        wait_seconds (float): Longest this process waits for another one's call.
+        label (str, optional): Description of the call for timing instrumentation.
+
+    Returns:
+        tuple: (httplib2.Response, content).
+    """
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    holder = uuid.uuid4().hex
+    deadline = time.monotonic() + wait_seconds
+    try:
+        while time.monotonic() < deadline:
+            current = _acquire(digest, holder, app.config['SINGLE_FLIGHT_LOCK_SECONDS'])
+            if current is None:
+                break
+            with timed('google-wait', label):
+                result = _await(digest, current, deadline)
+            if result is not None:
+                flights._count('shared_coalesced')
+                return result
+        else:
+            flights._count('fallback')
+            return fn()
+    except SQLAlchemyError as e:
+        app.logger.warning(f"Single-flight lock table unavailable, calling directly: {e}")
+        flights._count('lock_errors')
+        return fn()
+
+    try:
+        result = fn()
+    except Exception:
+        try:
+            _release(digest, holder)
+        except SQLAlchemyError:
+            pass # The row expires after SINGLE_FLIGHT_LOCK_SECONDS
+        raise
+    try:
+        _publish(digest, holder, result)
+    except SQLAlchemyError as e:
+        app.logger.warning(f"Could not publish coalesced response: {e}")
+    return result
+
+def do(user_id, uri, fn, label=None, deadline=None):
+    """
+    Makes a user's GET call, sharing it with identical calls in flight at the same time.
+
+    Args:
+        user_id (int): The local user the call is made for.
+        uri (str): The full request URL.
+        fn (callable): Makes the call and returns (httplib2.Response, content).
+        label (str, optional): Description of the call for timing instrumentation.
+        deadline (float, optional): time.monotonic() by which the caller needs the response; a
+            waiter gives up on another request's call then, even before GOOGLE_HTTP_TIMEOUT.
+
+    Returns:
+        tuple: (httplib2.Response, content).
+    """
+    key = f'{user_id} {uri}'
+
+    def wait_seconds():
+        # Re-read when the cross-process wait starts, after any wait for this process's flight
+        if deadline is None:
+            return app.config['GOOGLE_HTTP_TIMEOUT']
+        return max(0.0, min(app.config['GOOGLE_HTTP_TIMEOUT'], deadline - time.monotonic()))
+
+    if app.config['SINGLE_FLIGHT_SHARED'] and has_app_context():
+        return flights.do(key, lambda: shared_do(key, fn, wait_seconds(), label), wait_seconds(), label)
+    return flights.do(key, fn, wait_seconds(), label)
+
+@app.route('/admin/metrics/singleflight')
+@admin_required
+def singleflight_metrics():
+    """
+    Exposes request coalescing counters (admin only).
+
+    Returns:
+        dict: JSON metrics.
+    """
+    return flights.metrics()
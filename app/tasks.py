@@ -0,0 +1,109 @@
+"""
+Background jobs offloaded from request handlers: teacher name lookups, OAuth token refresh and
+cleanup of unused tags. See app.jobs for how jobs are queued and run.
+"""
+from datetime import datetime, timedelta
+import google.auth.transport.requests
+from googleapiclient.errors import HttpError
+from app import app, db, jobs, quota, roster
+from app.models import User, Course, UserTag
+from app.google_client import get_credentials, build_service
+
+# Google allows at most 50 calls per batch request
+TEACHER_BATCH_LIMIT = 50
+
+@jobs.handler('teacher_lookup')
+def lookup_teachers(user_id, courses, deadline=None):
+    """
+    Fetches and caches the teacher (owner) names of a user's courses with batched profile lookups.
+
+    Args:
+        user_id (int): The local user ID.
+        courses (list): [course_id, owner_id] pairs whose teacher name is unknown.
+        deadline (float, optional): time.monotonic() by which the lookups must be done; lookups
+            past it raise TimeoutError.
+    """
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    quota.require(user_id, len(courses))
+    service = build_service('classroom', 'v1', get_credentials(user), user_id, deadline)
+    names = {}
+    forbidden = []
+
+    def callback(request_id, response, exception):
+        if exception:
+            if isinstance(exception, HttpError) and exception.resp.status == 403:
+                forbidden.append(request_id)
+            else:
+                app.logger.warning(f"Error fetching teacher for {request_id}: {exception}")
+        else:
+            names[request_id] = response.get('name', {}).get('fullName')
+
+    limit = quota.batch_limit(TEACHER_BATCH_LIMIT)
+    for start in range(0, len(courses), limit):
+        batch = service.new_batch_http_request(callback=callback)
+        for course_id, owner_id in courses[start:start + limit]:
+            batch.add(service.userProfiles().get(userId=owner_id), request_id=course_id)
+        batch.execute()
+
+    local_courses = {c.google_course_id: c for c in Course.query.filter(
+        Course.user_id == user_id, Course.google_course_id.in_(list(names)))}
+    for course_id, teacher_name in names.items():
+        local_course = local_courses.get(course_id)
+        if local_course is None:
+            local_course = Course(user_id=user_id, google_course_id=course_id)
+            db.session.add(local_course)
+        local_course.cached_teacher_name = teacher_name
+    # Teacher profiles need the profile scopes; users who logged in before they were added must log in again
+    if forbidden:
+        missing_scopes = set(app.config['GOOGLE_SCOPES']) - set(user.scopes.split(',') if user.scopes else [])
+        app.logger.info(f"Teacher lookup for {len(forbidden)} courses forbidden; missing scopes: {missing_scopes}")
+        if missing_scopes:
+            user.reconsent_required = True
+    db.session.commit()
+    if names:
+        roster.course_changed(user_id)
+
+@jobs.handler('cleanup_user_tags')
+def cleanup_user_tags(user_id):
+    """
+    Deletes a user's class tags that are no longer attached to any course.
+
+    Args:
+        user_id (int): The local user ID.
+    """
+    unused = UserTag.query.filter(UserTag.user_id == user_id, ~UserTag.courses.any()).all()
+    for tag in unused:
+        db.session.delete(tag)
+    db.session.commit()
+
+@jobs.handler('refresh_token')
+def refresh_token(user_id):
+    """
+    Refreshes a user's OAuth access token if it expires soon and stores the new token.
+
+    Args:
+        user_id (int): The local user ID.
+    """
+    user = db.session.get(User, user_id)
+    if user is None or not user.refresh_token:
+        return
+    if user.token_expiry and user.token_expiry - datetime.utcnow() > timedelta(minutes=10):
+        return
+    credentials = get_credentials(user)
+    credentials.refresh(google.auth.transport.requests.Request())
+    user.access_token = credentials.token
+    user.token_expiry = credentials.expiry
+    db.session.commit()
+
+def refresh_token_soon(user):
+    """
+    Queues a background token refresh if the user's access token expires within 10 minutes,
+    so later requests do not each have to refresh it inline.
+
+    Args:
+        user (User): The signed-in user.
+    """
+    if user.refresh_token and user.token_expiry and user.token_expiry - datetime.utcnow() < timedelta(minutes=10):
+        jobs.enqueue('refresh_token', {'user_id': user.id}, dedup_key=f'refresh-token:{user.id}')
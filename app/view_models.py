@@ -0,0 +1,206 @@
+"""
+Compact view models for the pages built from Google data.
+Google's course, stream item and coursework resources carry every field the API returns; the
+dashboard, course stream and missing assignments pages use a handful of them. Each page turns the
+resources it fetched into these ``__slots__`` objects, which hold only what the templates read,
+with timestamps and due dates parsed once so that sorting compares datetimes instead of strings.
+The raw resources are never copied; they are dropped (or stay in the caches they came from) once
+the view models are built.
+
+Fields passed through from Google keep Google's names, so templates read ``course.alternateLink``
+as before; fields computed here are snake_case.
+"""
+from datetime import datetime
+
+def parse_timestamp(value):
+    """
+    Parses a Google timestamp such as '2024-01-31T12:00:00.123Z'.
+
+    Returns:
+        datetime: The naive UTC time, or None if the value is missing or malformed.
+    """
+    if not value:
+        return None
+    seconds, _, fraction = value.rstrip('Z').partition('.')
+    try:
+        parsed = datetime.strptime(seconds, '%Y-%m-%dT%H:%M:%S')
+        return parsed.replace(microsecond=int(fraction[:6].ljust(6, '0'))) if fraction.isdigit() else parsed
+    except ValueError:
+        return None
+
+def due_datetime(work):
+    """
+    Returns a coursework item's due date and time, or None if it has no (valid) due date.
+
+    An item due on a day without a time is due at 23:59, as Classroom shows it.
+    """
+    due = work.get('dueDate')
+    if not due:
+        return None
+    time = work.get('dueTime', {'hours': 23, 'minutes': 59})
+    try:
+        return datetime(due['year'], due['month'], due['day'], time.get('hours', 0), time.get('minutes', 0))
+    except (KeyError, ValueError):
+        return None
+
+class CourseView:
+    """
+    A course as shown on the dashboard and at the top of its stream, with local overrides applied.
+
+    Attributes:
+        id, name, section, enrollmentCode, alternateLink, ownerId, updateTime (str): From Google
+            (name, section and enrollmentCode possibly overridden locally).
+        is_archived (bool): Archived in Google or locally.
+        teacher_name (str): Display name of the teacher ('Unknown Teacher' until looked up).
+        teacher_known (bool): Whether the teacher's name has been set or looked up.
+        display_order (int): Position chosen by drag and drop.
+        revision (int): Local revision, part of the card's fragment cache key.
+        tags (tuple): Names of the user's tags on the course.
+    """
+    __slots__ = ('id', 'name', 'section', 'enrollmentCode', 'alternateLink', 'ownerId', 'updateTime',
+                 'is_archived', 'teacher_name', 'teacher_known', 'display_order', 'revision', 'tags')
+
+    def __init__(self, g_course, local_course=None):
+        """
+        Args:
+            g_course (dict): The course resource from Google.
+            local_course (Course): The local record, or None.
+        """
+        self.id = g_course['id']
+        self.name = g_course.get('name')
+        self.section = g_course.get('section')
+        self.enrollmentCode = g_course.get('enrollmentCode')
+        self.alternateLink = g_course.get('alternateLink')
+        self.ownerId = g_course.get('ownerId')
+        self.updateTime = g_course.get('updateTime')
+        self.is_archived = g_course.get('courseState') == 'ARCHIVED'
+        self.display_order = 0
+        self.revision = 0
+        self.tags = ()
+        teacher_name = None
+        if local_course:
+            if local_course.custom_name:
+                self.name = local_course.custom_name
+            if local_course.custom_section:
+                self.section = local_course.custom_section
+            if local_course.custom_code:
+                self.enrollmentCode = local_course.custom_code # Override enrollment code for display
+            if local_course.is_archived:
+                self.is_archived = True
+            self.display_order = local_course.display_order or 0
+            self.revision = local_course.revision or 0
+            self.tags = tuple(tag.name for tag in local_course.user_tags)
+            teacher_name = local_course.custom_teacher_name or local_course.cached_teacher_name
+        self.teacher_known = bool(teacher_name)
+        self.teacher_name = teacher_name or 'Unknown Teacher'
+
+class MaterialView:
+    """
+    A Drive file, YouTube video or link attached to a stream item.
+
+    Attributes:
+        kind (str): 'drive', 'youtube' or 'link'.
+        title (str): Title of the file, video or page.
+        url (str): Where it opens.
+        mime_type (str): MIME type of a Drive file, else None.
+        thumbnail_url (str): Thumbnail of a YouTube video, else None.
+    """
+    __slots__ = ('kind', 'title', 'url', 'mime_type', 'thumbnail_url')
+
+    def __init__(self, kind, title, url, mime_type=None, thumbnail_url=None):
+        self.kind = kind
+        self.title = title
+        self.url = url
+        self.mime_type = mime_type
+        self.thumbnail_url = thumbnail_url
+
+    @classmethod
+    def from_google(cls, material):
+        """
+        Returns the view of a Classroom material, or None for kinds the stream does not show (forms).
+        """
+        if 'driveFile' in material:
+            drive_file = material['driveFile'].get('driveFile', {})
+            return cls('drive', drive_file.get('title'), drive_file.get('alternateLink'),
+                       mime_type=drive_file.get('mimeType'))
+        if 'youtubeVideo' in material:
+            video = material['youtubeVideo']
+            return cls('youtube', video.get('title'), video.get('alternateLink'),
+                       thumbnail_url=video.get('thumbnailUrl'))
+        if 'link' in material:
+            link = material['link']
+            return cls('link', link.get('title'), link.get('url'))
+        return None
+
+class StreamItemView:
+    """
+    An announcement, coursework item or material in a course stream.
+
+    Attributes:
+        id, title, text, description, alternateLink, updateTime (str): From Google.
+        type (str): 'announcement', 'assignment' or 'material'.
+        created (datetime): Creation time (update time if Google gave none), or None.
+        materials (tuple): MaterialViews of the attachments.
+    """
+    __slots__ = ('id', 'type', 'title', 'text', 'description', 'alternateLink', 'updateTime', 'created',
+                 'materials')
+
+    def __init__(self, item, item_type):
+        """
+        Args:
+            item (dict): The resource from Google.
+            item_type (str): 'announcement', 'assignment' (whatever its workType) or 'material'.
+        """
+        self.id = item['id']
+        self.type = item_type
+        self.title = item.get('title')
+        self.text = item.get('text')
+        self.description = item.get('description')
+        self.alternateLink = item.get('alternateLink')
+        self.updateTime = item.get('updateTime')
+        self.created = parse_timestamp(item.get('creationTime') or item.get('updateTime'))
+        materials = (MaterialView.from_google(material) for material in item.get('materials', ()))
+        self.materials = tuple(material for material in materials if material is not None)
+
+    def sort_key(self):
+        """Sorts items by creation time; items without one sort as the oldest."""
+        return self.created or datetime.min
+
+class AssignmentView:
+    """
+    A coursework item the user has not turned in, as listed on the missing assignments page.
+
+    Attributes:
+        id, title, description, alternateLink (str): From Google.
+        courseName (str): Display name of the item's course.
+        due (datetime): Due date and time, or None.
+        isMissing (bool): Whether it is past due.
+        isMuted (bool): Whether the user hid it.
+    """
+    __slots__ = ('id', 'title', 'description', 'alternateLink', 'courseName', 'due', 'isMissing', 'isMuted')
+
+    def __init__(self, work, course_name, now, muted=False):
+        """
+        Args:
+            work (dict): The coursework resource from Google.
+            course_name (str): Display name of its course.
+            now (datetime): Current UTC time, against which it is missing or not.
+            muted (bool): Whether the user hid it.
+        """
+        self.id = work['id']
+        self.title = work.get('title')
+        self.description = work.get('description')
+        self.alternateLink = work.get('alternateLink')
+        self.courseName = course_name
+        self.due = due_datetime(work)
+        self.isMissing = self.due is not None and self.due < now
+        self.isMuted = muted
+
+    @property
+    def dueDate(self):
+        """str: The due date as 'YYYY-MM-DD HH:MM', or None."""
+        return self.due.strftime('%Y-%m-%d %H:%M') if self.due else None
+
+    def sort_key(self):
+        """Sorts missing items first, then by due date; items without one come last."""
+        return (not self.isMissing, self.due or datetime.max)
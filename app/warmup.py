@@ -0,0 +1,117 @@
+"""
+Cache warm-up after login.
+Logging in queues a job that prefetches, in order, the user's course list, missing teacher names
+and their coursework and submission states into the local caches, so the first dashboard render
+finds warm data instead of fanning out to Google. The job stops once its time budget is spent, also
+in the middle of a stage, and is not queued again while a recent warm-up is pending or finished.
+"""
+import threading
+import time
+from app import app, db, coursework_cache, jobs, roster, tasks
+from app.models import Course, User
+from app.quota import QuotaExceeded
+from app.google_client import get_credentials, build_service
+
+# Per-process signals set once a warm-up has stored the course list and teacher names, keyed by user ID
+_course_list_ready = {}
+_ready_lock = threading.Lock()
+
+def wait_for_course_list(user_id, timeout):
+    """
+    Waits briefly for a warm-up running in this process to store the user's course list and teacher names.
+
+    Returns immediately if no warm-up for the user is pending here. If the wait times out the
+    signal is dropped, so later renders do not wait again.
+
+    Args:
+        user_id (int): The local user ID.
+        timeout (float): Longest wait in seconds.
+    """
+    with _ready_lock:
+        event = _course_list_ready.get(user_id)
+    if event is not None and not event.wait(timeout):
+        with _ready_lock:
+            if _course_list_ready.get(user_id) is event:
+                del _course_list_ready[user_id]
+
+@jobs.handler('warmup', max_attempts=1)
+def warm_up(user_id):
+    """
+    Prefetches a user's course list, teacher names, coursework and submissions into the local caches.
+
+    Stages run in the order the dashboard needs them. Their Google calls share a deadline
+    WARMUP_TIME_BUDGET_SECONDS away; once it has passed, the stage running is cut short and the
+    remaining stages are left to the usual on-demand refreshes. The same happens when the quota
+    reserve refuses a stage: the stages done are kept and the job is not retried, since a later run
+    would come too late for the first dashboard render.
+
+    Args:
+        user_id (int): The local user ID.
+    """
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    deadline = time.monotonic() + app.config['WARMUP_TIME_BUDGET_SECONDS']
+    stage = 'the course list'
+    try:
+        classroom = build_service('classroom', 'v1', get_credentials(user), user_id, deadline)
+        courses = classroom.courses().list(studentId='me').execute().get('courses', [])
+        roster.store_course_list(user_id, courses)
+
+        stage = 'teacher names'
+        local_courses = {c.google_course_id: c for c in Course.query.filter_by(user_id=user_id)}
+        lookups = []
+        for course in courses:
+            local_course = local_courses.get(course['id'])
+            if course.get('ownerId') and not (local_course and (local_course.custom_teacher_name or local_course.cached_teacher_name)):
+                lookups.append([course['id'], course['ownerId']])
+        if lookups:
+            tasks.lookup_teachers(user_id, lookups, deadline)
+    except TimeoutError:
+        app.logger.info(f"Warm-up for user {user_id} stopped during {stage}: time budget spent")
+        return
+    except QuotaExceeded as e:
+        app.logger.info(f"Warm-up for user {user_id} stopped during {stage}: {e}")
+        return
+    finally:
+        # Everything the dashboard renders is in place; let a waiting render go ahead
+        with _ready_lock:
+            ready = _course_list_ready.pop(user_id, None)
+        if ready is not None:
+            ready.set()
+
+    try:
+        coursework_cache.refresh(user, deadline)
+    except TimeoutError:
+        app.logger.info(f"Warm-up for user {user_id} stopped during coursework: time budget spent")
+    except QuotaExceeded as e:
+        app.logger.info(f"Warm-up for user {user_id} stopped during coursework: {e}")
+
+def in_progress(user_id):
+    """
+    Returns whether a warm-up for the user is queued or running, so callers can leave the
+    prefetching to it instead of queuing the same work again.
+    """
+    return jobs.is_pending(f'warmup:{user_id}')
+
+def start(user):
+    """
+    Queues a warm-up for a user who just logged in.
+
+    Repeated logins do not queue more work: nothing is queued while a warm-up is pending or if the
+    course list was fetched within the last WARMUP_MIN_INTERVAL_SECONDS.
+
+    Args:
+        user (User): The user who logged in.
+    """
+    if not app.config['WARMUP_ENABLED']:
+        return
+    if roster.cached_course_list(user.id, app.config['WARMUP_MIN_INTERVAL_SECONDS']) is not None:
+        return
+    if in_progress(user.id):
+        return
+    if app.config['JOBS_RUN_IN_PROCESS']:
+        # Set up the signal before the job can run, so the dashboard knows to wait for it
+        with _ready_lock:
+            _course_list_ready.setdefault(user.id, threading.Event())
+    jobs.enqueue('warmup', {'user_id': user.id}, dedup_key=f'warmup:{user.id}')
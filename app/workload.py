@@ -0,0 +1,260 @@
+"""
+Workload analytics over a user's cached coursework and submissions.
+Due dates, submission states and turn-in times are loaded into columnar NumPy arrays and all
+histograms and per-course aggregates are computed with vectorized operations, so the view stays
+fast for users with hundreds of courses' worth of history. Results are cached per user in
+process memory until the underlying cache rows change or WORKLOAD_CACHE_SECONDS pass.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from flask import render_template
+from flask_login import current_user, login_required
+from sqlalchemy import and_, func
+from app import app, db, coursework_cache
+from app.models import CachedCourseWork, CachedSubmission, MutedItem
+
+# Submission states, encoded as small integers in the state column (-1 = no cached submission)
+STATE_CODES = {'NEW': 0, 'CREATED': 1, 'TURNED_IN': 2, 'RETURNED': 3, 'RECLAIMED_BY_STUDENT': 4}
+PENDING_CODES = [STATE_CODES['NEW'], STATE_CODES['CREATED'], STATE_CODES['RECLAIMED_BY_STUDENT']]
+
+DAYS_BACK = 14
+DAYS_AHEAD = 28
+WEEKS_BACK = 8
+WEEKS_AHEAD = 8
+
+# Turn-in time relative to the due date, in hours (negative = early)
+LATENCY_BINS = [-np.inf, -72, -24, -6, 0, 6, 24, 72, np.inf]
+LATENCY_LABELS = ['>3d early', '1-3d early', '6-24h early', '<6h early', '<6h late', '6-24h late', '1-3d late', '>3d late']
+
+# Items with a due date but no due time are treated as due at the end of the day, as in Missing Assignments
+DEFAULT_DUE_TIME = '23:59'
+
+def load_columns(user_id):
+    """
+    Loads a user's cached coursework and submissions into columnar arrays.
+
+    Args:
+        user_id (int): The local user ID.
+
+    Returns:
+        dict: 'course_ids' and 'course_names' (one entry per course), and per-item arrays
+            'course' (int index into course_ids), 'due' and 'turned_in' (datetime64[m], NaT if unknown),
+            'state' (int8 code), 'late' (bool) and 'muted' (bool).
+    """
+    rows = db.session.query(
+        CachedCourseWork.google_course_id, CachedCourseWork.course_name, CachedCourseWork.google_coursework_id,
+        CachedCourseWork.due_date, CachedCourseWork.due_time,
+        CachedSubmission.state, CachedSubmission.late, CachedSubmission.turned_in_at
+    ).outerjoin(CachedSubmission, and_(
+        CachedSubmission.user_id == CachedCourseWork.user_id,
+        CachedSubmission.google_coursework_id == CachedCourseWork.google_coursework_id
+    )).filter(CachedCourseWork.user_id == user_id).all()
+
+    if not rows:
+        empty_time = np.array([], dtype='datetime64[m]')
+        return {'course_ids': [], 'course_names': [], 'course': np.array([], dtype=np.int64),
+                'due': empty_time, 'turned_in': empty_time, 'state': np.array([], dtype=np.int8),
+                'late': np.array([], dtype=bool), 'muted': np.array([], dtype=bool)}
+
+    course_ids, names, cw_ids, due_dates, due_times, states, lates, turned_in = zip(*rows)
+    course_ids, first, course_index = np.unique(np.array(course_ids), return_index=True, return_inverse=True)
+    muted_ids = [m.google_item_id for m in MutedItem.query.filter_by(user_id=user_id)]
+
+    return {
+        'course_ids': course_ids.tolist(),
+        'course_names': [names[i] or course_ids[n] for n, i in enumerate(first)],
+        'course': course_index.reshape(-1),
+        'due': np.array([f'{d}T{t or DEFAULT_DUE_TIME}' if d else 'NaT' for d, t in zip(due_dates, due_times)],
+                        dtype='datetime64[m]'),
+        'turned_in': np.array([t[:16] if t else 'NaT' for t in turned_in], dtype='datetime64[m]'),
+        'state': np.array([STATE_CODES.get(s, -1) for s in states], dtype=np.int8),
+        'late': np.array([bool(l) for l in lates], dtype=bool),
+        'muted': np.isin(np.array(cw_ids), muted_ids),
+    }
+
+def _week_start(days):
+    """Returns the Monday (as days since the epoch) of the week containing each day."""
+    # 1970-01-01 was a Thursday
+    return days - (days + 3) % 7
+
+def compute(columns, now):
+    """
+    Computes workload histograms and per-course aggregates from columnar data.
+
+    Args:
+        columns (dict): Arrays from load_columns().
+        now (datetime): The current UTC time.
+
+    Returns:
+        dict: JSON-serializable analytics with 'summary', 'daily', 'weekly', 'courses' and 'latency'.
+    """
+    now_m = np.datetime64(now.replace(second=0, microsecond=0), 'm')
+    today = now_m.astype('datetime64[D]')
+    due, state, course = columns['due'], columns['state'], columns['course']
+    n_courses = len(columns['course_ids'])
+
+    has_due = ~np.isnat(due)
+    pending = np.isin(state, PENDING_CODES) & ~columns['muted']
+    due_day = due.astype('datetime64[D]').astype(np.int64)
+    today_day = today.astype(np.int64)
+
+    # Items due per day around today
+    day_offset = due_day - (today_day - DAYS_BACK)
+    in_window = has_due & (day_offset >= 0) & (day_offset < DAYS_BACK + DAYS_AHEAD)
+    days_total = np.bincount(day_offset[in_window], minlength=DAYS_BACK + DAYS_AHEAD)
+    days_pending = np.bincount(day_offset[in_window & pending], minlength=DAYS_BACK + DAYS_AHEAD)
+    first_day = today - DAYS_BACK
+
+    # Items due per (Monday-based) week around this week
+    this_week = _week_start(today_day)
+    week_offset = (_week_start(due_day) - (this_week - 7 * WEEKS_BACK)) // 7
+    in_weeks = has_due & (week_offset >= 0) & (week_offset < WEEKS_BACK + WEEKS_AHEAD)
+    weeks_total = np.bincount(week_offset[in_weeks], minlength=WEEKS_BACK + WEEKS_AHEAD)
+    weeks_pending = np.bincount(week_offset[in_weeks & pending], minlength=WEEKS_BACK + WEEKS_AHEAD)
+    first_week = np.datetime64(int(this_week - 7 * WEEKS_BACK), 'D')
+
+    # Per-course aggregates
+    overdue = has_due & pending & (due < now_m)
+    due_soon = has_due & pending & (due >= now_m) & (due < now_m + np.timedelta64(7, 'D'))
+    turned_in = has_due & ~np.isnat(columns['turned_in'])
+    latency = (columns['turned_in'][turned_in] - due[turned_in]).astype(np.float64) / 60.0
+    # Google's late flag also covers turn-ins after a due date that was later moved earlier
+    late = columns['late'][turned_in] | (latency > 0)
+
+    per_course_total = np.bincount(course, minlength=n_courses)
+    per_course_overdue = np.bincount(course[overdue], minlength=n_courses)
+    per_course_soon = np.bincount(course[due_soon], minlength=n_courses)
+    per_course_turned_in = np.bincount(course[turned_in], minlength=n_courses)
+    per_course_late = np.bincount(course[turned_in], weights=late, minlength=n_courses)
+    per_course_latency = np.bincount(course[turned_in], weights=latency, minlength=n_courses)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        late_rate = per_course_late / per_course_turned_in
+        mean_latency = per_course_latency / per_course_turned_in
+
+    courses = [{
+        'course_id': course_id,
+        'course_name': columns['course_names'][i],
+        'total': int(per_course_total[i]),
+        'overdue': int(per_course_overdue[i]),
+        'due_next_7_days': int(per_course_soon[i]),
+        'turned_in': int(per_course_turned_in[i]),
+        'late_rate': None if np.isnan(late_rate[i]) else round(float(late_rate[i]), 3),
+        'mean_latency_hours': None if np.isnan(mean_latency[i]) else round(float(mean_latency[i]), 1),
+    } for i, course_id in enumerate(columns['course_ids'])]
+    courses.sort(key=lambda c: (-c['overdue'], -c['due_next_7_days'], (c['course_name'] or '').lower()))
+
+    counts, _ = np.histogram(latency, bins=LATENCY_BINS)
+    percentiles = np.percentile(latency, [10, 50, 90]).round(1).tolist() if latency.size else [None] * 3
+
+    return {
+        'generated_at': now.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'summary': {
+            'items': int(due.size),
+            'with_due_date': int(has_due.sum()),
+            'overdue': int(overdue.sum()),
+            'due_next_7_days': int(due_soon.sum()),
+            'turned_in': int(turned_in.sum()),
+            'late_turn_ins': int(late.sum()),
+        },
+        'daily': [{'date': str(first_day + i), 'total': int(t), 'pending': int(p)}
+                  for i, (t, p) in enumerate(zip(days_total, days_pending))],
+        'weekly': [{'week_start': str(first_week + 7 * i), 'total': int(t), 'pending': int(p)}
+                   for i, (t, p) in enumerate(zip(weeks_total, weeks_pending))],
+        'courses': courses,
+        'latency': {
+            'bins': [{'label': label, 'count': int(c)} for label, c in zip(LATENCY_LABELS, counts)],
+            'p10_hours': percentiles[0],
+            'p50_hours': percentiles[1],
+            'p90_hours': percentiles[2],
+        },
+    }
+
+class WorkloadCache:
+    """
+    Bounded, thread-safe LRU cache of computed analytics per user.
+
+    Entries are keyed by user and tagged with a data version; an entry is reused only while the
+    version matches and it is younger than the configured TTL.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id, version, ttl):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] != version or time.monotonic() - entry[1] > ttl:
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[2]
+
+    def put(self, user_id, version, result):
+        with self.lock:
+            self.entries[user_id] = (version, time.monotonic(), result)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+cache = WorkloadCache()
+
+def data_version(user_id):
+    """
+    Returns a cheap fingerprint of the rows the analytics are computed from.
+
+    Returns:
+        tuple: Row counts and latest write times of the cached coursework, submissions and muted items.
+    """
+    version = []
+    for model, column in ((CachedCourseWork, CachedCourseWork.cached_at),
+                          (CachedSubmission, CachedSubmission.cached_at),
+                          (MutedItem, MutedItem.id)):
+        count, latest = db.session.query(func.count(model.id), func.max(column)).filter(model.user_id == user_id).one()
+        version.append((count, str(latest)))
+    return tuple(version)
+
+def workload(user_id):
+    """
+    Returns the analytics for a user, reusing cached results. A stale coursework cache is refreshed
+    by a background job; until it finishes, the analytics are computed from the cached rows.
+
+    Args:
+        user_id (int): The local user ID.
+
+    Returns:
+        dict: Analytics as returned by compute().
+    """
+    coursework_cache.refresh_in_background(user_id, app.config['WORKLOAD_REFRESH_MINUTES'])
+    version = data_version(user_id)
+    result = cache.get(user_id, version, app.config['WORKLOAD_CACHE_SECONDS'])
+    if result is None:
+        result = compute(load_columns(user_id), datetime.utcnow())
+        cache.put(user_id, version, result)
+    return result
+
+@app.route('/workload')
+@login_required
+def workload_page():
+    """
+    Renders the workload page: items due per day and week, per-course load and turn-in timing.
+
+    Returns:
+        str: Rendered HTML template for the workload page.
+    """
+    return render_template('workload.html', title='Workload', data=workload(current_user.id))
+
+@app.route('/api/workload')
+@login_required
+def workload_api():
+    """
+    JSON workload analytics for the current user.
+
+    Returns:
+        Response: The analytics from compute(), cacheable privately for a short time.
+    """
+    response = app.json.response(workload(current_user.id))
+    response.headers['Cache-Control'] = f"private, max-age={min(app.config['WORKLOAD_CACHE_SECONDS'], 60)}"
+    return response
@@ -0,0 +1,18 @@
+"""
+ASGI entry point for the async serving mode.
+Enables the async views (ASYNC_VIEWS) and exposes the Flask app to an ASGI server, e.g.::
+
+    uvicorn asgi:app --port 5000
+
+Flask itself stays a WSGI application: requests are run on a pool of ASGI_THREADS threads, and
+the Google-heavy views make their calls concurrently on an event loop within each request.
+The synchronous mode (``flask run`` or a WSGI server pointed at run:app) is unchanged.
+"""
+import os
+
+os.environ.setdefault('ASYNC_VIEWS', '1')
+
+from a2wsgi import WSGIMiddleware
+from app import app as flask_app
+
+app = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_THREADS'])
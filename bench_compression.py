@@ -0,0 +1,160 @@
+"""
+Measures what response compression and HTML minification save, and what they cost, per page type.
+
+The script starts the Classroom API emulator, renders each page type once with HTML_MINIFY off and
+once with it on (through the Flask test client, against a fresh SQLite database), and then
+compresses every body with each gzip level and brotli quality given. For each combination it
+reports the bytes sent and the CPU time compression takes (median of ``--repeat`` runs, measured
+with ``time.process_time``). Streamed pages are also compressed chunk by chunk, as the
+COMPRESSION_STREAMING mode does, flushing every ``--flush-bytes`` (0: every chunk), to show
+what incremental compression costs compared with compressing the whole body.
+
+Usage:
+    python bench_compression.py --courses 12 --announcements 40 --coursework 40 --gzip 1 6 9 --brotli 1 5 11
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+
+def wait_for(url, timeout=30):
+    """Polls a URL until it answers or ``timeout`` seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+def fetch_pages(app, client):
+    """
+    Renders every page type with the current settings.
+
+    Returns:
+        dict: Page type -> (list of body chunks, whether the response is streamed).
+    """
+    client.get('/dev/login?email=bench@example.com')
+    dashboard = client.get('/').get_data(as_text=True)
+    course_id = re.search(r'/course/([^/"]+)', dashboard).group(1)
+    missing = client.get('/missing').get_data(as_text=True)
+    feed_path = re.search(r'/feed/[^/"]+\.ics', missing).group(0)
+    pages = {}
+    for name, path in (('dashboard', '/'), ('missing', '/missing'), ('course_stream', f'/course/{course_id}'),
+                       ('feed', feed_path), ('export', '/export.ndjson')):
+        response = client.get(path, headers={'Accept-Encoding': 'identity'}, buffered=False)
+        chunks = [chunk for chunk in response.response if chunk]
+        streamed = response.is_streamed
+        response.close()
+        pages[name] = ([c if isinstance(c, bytes) else c.encode() for c in chunks], streamed)
+    return pages
+
+def cpu_ms(func, repeat):
+    """Returns the median CPU time of ``func`` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        func()
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples)
+
+def measure(app, chunks, streamed, codecs, repeat, flush_bytes):
+    """
+    Compresses one body with every codec.
+
+    Returns:
+        dict: Codec label -> {'bytes', 'cpu_ms'} (plus 'stream_bytes'/'stream_cpu_ms' for streamed bodies).
+    """
+    from app import compression
+    body = b''.join(chunks)
+    results = {}
+    for encoding, level in codecs:
+        key = 'COMPRESSION_BROTLI_QUALITY' if encoding == 'br' else 'COMPRESSION_GZIP_LEVEL'
+        app.config[key] = level
+        result = {
+            'bytes': len(compression.compress(body, encoding)),
+            'cpu_ms': round(cpu_ms(lambda: compression.compress(body, encoding), repeat), 2),
+        }
+        if streamed:
+            stream = lambda: b''.join(compression.compress_stream(chunks, encoding, flush_bytes))
+            result['stream_bytes'] = len(stream())
+            result['stream_cpu_ms'] = round(cpu_ms(stream, repeat), 2)
+        results[f'{encoding}-{level}'] = result
+    return results
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Measure compression and minification savings per page type.')
+    parser.add_argument('--courses', type=int, default=8)
+    parser.add_argument('--announcements', type=int, default=10, help='Announcements per course.')
+    parser.add_argument('--coursework', type=int, default=20, help='Coursework items per course.')
+    parser.add_argument('--materials', type=int, default=5, help='Materials per course.')
+    parser.add_argument('--gzip', nargs='+', type=int, default=[1, 6, 9], help='gzip levels to measure.')
+    parser.add_argument('--brotli', nargs='+', type=int, default=[1, 5, 11], help='brotli qualities to measure.')
+    parser.add_argument('--repeat', type=int, default=5, help='Compressions per measurement.')
+    parser.add_argument('--flush-bytes', type=int, default=16384, help='Stream flush interval to measure.')
+    parser.add_argument('--emulator-port', type=int, default=8081)
+    parser.add_argument('--json', dest='json_out', help='Write the results as JSON to this file.')
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    workdir = tempfile.mkdtemp(prefix='classdeck-bench-')
+    os.environ.update(DATABASE_URL=f'sqlite:///{os.path.join(workdir, "bench.db")}',
+                      GOOGLE_API_ENDPOINT=f'http://127.0.0.1:{args.emulator_port}',
+                      EMULATOR_LOGIN_ENABLED='1', JOBS_RUN_IN_PROCESS='0', QUOTA_ENABLED='0')
+    emulator = subprocess.Popen([sys.executable, 'emulator.py', '--port', str(args.emulator_port),
+                                 '--courses', str(args.courses), '--announcements', str(args.announcements),
+                                 '--coursework', str(args.coursework), '--materials', str(args.materials)],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(f'http://127.0.0.1:{args.emulator_port}/')
+        from app import app, db, compression, fragment_cache
+        with app.app_context():
+            db.create_all()
+        codecs = [('gzip', level) for level in args.gzip]
+        if compression.brotli is not None:
+            codecs += [('br', quality) for quality in args.brotli]
+        else:
+            print('brotli is not installed; measuring gzip only\n')
+
+        results = {}
+        for minify in (False, True):
+            # Templates are minified when compiled, so drop the compiled and cached ones
+            app.config['HTML_MINIFY'] = minify
+            app.jinja_env.cache.clear()
+            fragment_cache.cache.entries.clear()
+            with app.test_client() as client:
+                pages = fetch_pages(app, client)
+            for name, (chunks, streamed) in pages.items():
+                results.setdefault(name, {})['minified' if minify else 'raw'] = {
+                    'bytes': sum(len(chunk) for chunk in chunks),
+                    'chunks': len(chunks),
+                    'codecs': measure(app, chunks, streamed, codecs, args.repeat, args.flush_bytes),
+                }
+    finally:
+        emulator.terminate()
+        emulator.wait()
+
+    print(f"{'page':<15}{'html':<10}{'codec':<9}{'bytes':>10}{'saved':>8}{'cpu ms':>9}{'stream bytes':>14}{'stream ms':>11}")
+    for name, variants in results.items():
+        raw_bytes = variants['raw']['bytes']
+        for variant, data in variants.items():
+            print(f"{name:<15}{variant:<10}{'none':<9}{data['bytes']:>10}{1 - data['bytes'] / raw_bytes:>8.1%}")
+            for codec, result in data['codecs'].items():
+                stream = (f"{result['stream_bytes']:>14}{result['stream_cpu_ms']:>11.2f}"
+                          if 'stream_bytes' in result else '')
+                print(f"{'':<15}{'':<10}{codec:<9}{result['bytes']:>10}{1 - result['bytes'] / raw_bytes:>8.1%}"
+                      f"{result['cpu_ms']:>9.2f}{stream}")
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
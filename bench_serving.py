@@ -0,0 +1,150 @@
+"""
+Compares how many concurrent users one ClassDeck process sustains in the synchronous (WSGI) and
+async (ASGI) serving modes.
+
+For each mode the script starts the Classroom API emulator and a single server process on a fresh
+SQLite database, then ramps up the number of simulated students with loadtest.py. A step is
+sustained when no request fails and the p95 latency of every route stays under ``--slo-p95-ms``.
+
+    sync:  gunicorn --workers 1 --threads N run:app   (gthread worker)
+    async: uvicorn asgi:app                            (ASGI_THREADS=N)
+
+Usage:
+    python bench_serving.py --threads 8 --users 8 16 32 64 --latency-ms 150 --duration 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+import loadtest
+
+ROUTES = ['/', '/missing', '/course/<id>']
+
+def wait_for(url, timeout=30):
+    """Polls a URL until it answers or ``timeout`` seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+def server_command(mode, port, threads):
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '--workers', '1', '--worker-class', 'gthread',
+                '--threads', str(threads), '--bind', f'127.0.0.1:{port}', 'run:app']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+
+def start_server(mode, args, workdir):
+    """
+    Creates a fresh database and starts one server process for the given mode.
+
+    Returns:
+        subprocess.Popen: The server process.
+    """
+    env = dict(os.environ,
+               DATABASE_URL=f'sqlite:///{os.path.join(workdir, mode + ".db")}',
+               GOOGLE_API_ENDPOINT=f'http://127.0.0.1:{args.emulator_port}',
+               EMULATOR_LOGIN_ENABLED='1',
+               ASGI_THREADS=str(args.threads),
+               ASYNC_VIEWS='1' if mode == 'async' else '0')
+    subprocess.run([sys.executable, '-c', 'from app import app, db\nwith app.app_context(): db.create_all()'],
+                   env=env, check=True)
+    log = open(os.path.join(workdir, f'{mode}.log'), 'w')
+    process = subprocess.Popen(server_command(mode, args.port, args.threads), env=env, stdout=log, stderr=log)
+    wait_for(f'http://127.0.0.1:{args.port}/login')
+    return process
+
+def run_step(args, users):
+    """
+    Runs one load step.
+
+    Returns:
+        dict: Summary with throughput, worst p95 and error count over the measured routes.
+    """
+    load_args = loadtest.build_parser().parse_args([
+        '--base-url', f'http://127.0.0.1:{args.port}', '--users', str(users), '--threads', str(users),
+        '--duration', str(args.duration), '--think-ms', str(args.think_ms), '--timeout', str(args.timeout),
+        '--routes', *ROUTES,
+    ])
+    report, elapsed = loadtest.run(load_args)
+    measured = {route: r for route, r in report.items() if route != '/dev/login'}
+    requests_total = sum(r['requests'] for r in measured.values())
+    errors = sum(sum(r['errors'].values()) for r in report.values())
+    worst_p95 = max((r['p95_ms'] for r in measured.values()), default=0.0)
+    return {
+        'users': users,
+        'throughput_rps': round(requests_total / elapsed, 1) if elapsed else 0.0,
+        'worst_p95_ms': worst_p95,
+        'errors': errors,
+        'sustained': errors == 0 and worst_p95 <= args.slo_p95_ms,
+        'routes': measured,
+    }
+
+def bench_mode(mode, args, workdir):
+    """Ramps the load against one serving mode and returns the step results."""
+    server = start_server(mode, args, workdir)
+    steps = []
+    try:
+        for users in args.users:
+            step = run_step(args, users)
+            steps.append(step)
+            print(f"{mode:<6}{users:>7}{step['throughput_rps']:>10.1f}{step['worst_p95_ms']:>12.1f}"
+                  f"{step['errors']:>8}  {'yes' if step['sustained'] else 'no'}", flush=True)
+            if not step['sustained'] and not args.keep_going:
+                break
+    finally:
+        server.terminate()
+        server.wait()
+    return steps
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Compare sync and async serving capacity of one process.')
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'])
+    parser.add_argument('--users', nargs='+', type=int, default=[8, 16, 32, 64],
+                        help='Concurrent simulated students per step.')
+    parser.add_argument('--threads', type=int, default=8, help='Request threads of the server process.')
+    parser.add_argument('--latency-ms', type=float, default=150, help='Emulated Google API latency.')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per step.')
+    parser.add_argument('--think-ms', type=float, default=4000.0, help='Max random pause between requests.')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds.')
+    parser.add_argument('--slo-p95-ms', type=float, default=1500.0, help='p95 latency a step must stay under.')
+    parser.add_argument('--keep-going', action='store_true', help='Run every step even after one fails.')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--emulator-port', type=int, default=8081)
+    parser.add_argument('--json', dest='json_out', help='Write the results as JSON to this file.')
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    workdir = tempfile.mkdtemp(prefix='classdeck-bench-')
+    emulator = subprocess.Popen([sys.executable, 'emulator.py', '--port', str(args.emulator_port),
+                                 '--latency-ms', str(args.latency_ms)],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {}
+    try:
+        wait_for(f'http://127.0.0.1:{args.emulator_port}/')
+        print(f"{'mode':<6}{'users':>7}{'req/s':>10}{'p95 ms':>12}{'errors':>8}  sustained")
+        for mode in args.modes:
+            results[mode] = bench_mode(mode, args, workdir)
+    finally:
+        emulator.terminate()
+        emulator.wait()
+
+    print()
+    for mode, steps in results.items():
+        sustained = [step['users'] for step in steps if step['sustained']]
+        print(f"{mode}: sustains {max(sustained) if sustained else 0} concurrent users "
+              f"(p95 <= {args.slo_p95_ms:.0f} ms, no errors, {args.threads} threads)")
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,9 +13,121 @@ class Config:
         SECRET_KEY (str): Secret key for session management and encryption.
         SQLALCHEMY_DATABASE_URI (str): Database connection URI.
         SQLALCHEMY_TRACK_MODIFICATIONS (bool): Disable SQLAlchemy modification tracking.
+        SQLALCHEMY_BINDS (dict): Holds the read replica's URI (DATABASE_REPLICA_URL) under 'replica',
+            if one is configured.
+        DATABASE_REPLICA_STICKY_SECONDS (float): How long a user's reads stay on the primary after
+            a request of theirs wrote (0: only for the rest of that request).
         OAUTHLIB_INSECURE_TRANSPORT (str): Allow OAuth over HTTP (dev only).
         GOOGLE_CLIENT_SECRETS_FILE (str): Path to the Google OAuth client secrets file.
         GOOGLE_SCOPES (list): List of required Google API scopes.
+        GOOGLE_API_ENDPOINT (str): Base URL of a local Classroom API emulator (testing only).
+        GOOGLE_HTTP_TIMEOUT (float): Timeout in seconds for Google API HTTP requests.
+        EMULATOR_LOGIN_ENABLED (bool): Allow logging in fake users against the emulator.
+        INSTRUMENTATION_ENABLED (bool): Enable per-request timing instrumentation.
+        INSTRUMENTATION_SERVER_TIMING (bool): Emit the timing breakdown as a Server-Timing header.
+        INSTRUMENTATION_LOG (bool): Emit one structured JSON log line per request.
+        INSTRUMENTATION_SLOW_CALL_MS (float): Threshold for flagging an individual call as slow.
+        INSTRUMENTATION_SLOW_REQUEST_MS (float): Threshold for flagging a whole request as slow.
+        ADMIN_EMAILS (set): Lower-cased email addresses of administrators.
+        PROFILER_ENABLED (bool): Allow admins to profile individual requests on demand.
+        PROFILER_SAMPLE_INTERVAL_MS (float): Interval between stack samples while profiling.
+        PROFILER_DIR (str): Directory profiles are written to.
+        PROFILER_MAX_FILES (int): Number of profiles kept before the oldest are deleted.
+        QUOTA_ENABLED (bool): Charge Classroom calls against per-user and project token buckets.
+        QUOTA_PROJECT_PER_MINUTE (float): Project-wide refill rate (calls per minute, all processes together).
+        QUOTA_PROJECT_BURST (float): Project-wide bucket capacity.
+        QUOTA_USER_PER_MINUTE (float): Per-user refill rate (calls per minute).
+        QUOTA_USER_BURST (float): Per-user bucket capacity.
+        QUOTA_PROCESSES (int): Number of processes the project budget is split between, each getting an
+            equal share (0: the gunicorn workers when served with gunicorn.conf.py, otherwise 1). Count
+            dedicated ``flask worker`` processes in too. Per-user budgets are not split.
+        QUOTA_BACKGROUND_RESERVE (float): Fraction of each bucket reserved for interactive requests.
+        QUOTA_INTERACTIVE_MAX_WAIT_MS (float): Longest an interactive call waits for tokens.
+        QUOTA_BACKGROUND_MAX_WAIT_MS (float): Longest a background call waits for a bucket to refill
+            above its reserve before the work is deferred.
+        SEARCH_PAGE_SIZE (int): Number of search results per page.
+        FILES_PAGE_SIZE (int): Number of attachments per page of the Files view.
+        CALENDAR_SYNC_CALENDAR_ID (str): Calendar that coursework due dates are synced into.
+        ICS_FEED_REFRESH_MINUTES (int): Age after which a feed request queues a background refresh
+            of cached coursework from Google (0 serves the cache only).
+        WORKLOAD_REFRESH_MINUTES (int): Age after which the workload view queues a background refresh
+            of cached coursework and submissions from Google (0 serves the cache only).
+        WORKLOAD_CACHE_SECONDS (int): How long computed workload analytics are reused.
+        NEW_ASSIGNMENT_REFRESH_MINUTES (int): Age after which the dashboard queues a coursework
+            refresh for the new-assignment check.
+        NOTIFICATIONS_ENABLED (bool): Push live dashboard updates to open tabs over Server-Sent Events.
+        NOTIFICATIONS_POLL_SECONDS (float): Interval at which each user's poller checks for updates.
+        NOTIFICATIONS_HEARTBEAT_SECONDS (int): Idle time after which a stream sends a heartbeat.
+        NOTIFICATIONS_MAX_STREAM_SECONDS (int): Lifetime of one stream before the browser reconnects.
+        NOTIFICATIONS_BUFFER_SIZE (int): Recent events kept per user for Last-Event-ID resume.
+        NOTIFICATIONS_RESUME_SECONDS (int): How long a user's poller keeps running and buffering
+            events after their last stream closed, so a reconnecting tab receives what it missed.
+        NOTIFICATIONS_MAX_STREAMS (int): Open streams per process (0: half of the request threads
+            per worker). Each open stream holds a request thread; further tabs are told to retry later.
+        EXPORT_CHUNK_BYTES (int): Approximate size of each chunk written by the streaming export.
+        ASYNC_VIEWS (bool): Serve the dashboard, missing assignments and course stream views with
+            async variants that make their Google calls concurrently (set by asgi.py).
+        ASYNC_GOOGLE_MAX_CONNECTIONS (int): Connections one async view may open to Google at once.
+        ASGI_THREADS (int): Threads the ASGI entry point runs the Flask app on.
+        SERVE_BIND (str): Address the production server listens on (defaults to $PORT or 8000).
+        SERVE_WORKERS (int): Worker processes (0: one per CPU).
+        SERVE_THREADS (int): Request threads per worker (0: derived from SERVE_IO_WAIT_RATIO).
+        SERVE_IO_WAIT_RATIO (float): Time a typical request waits on Google and the database per
+            unit of CPU time; each worker runs 1 + this many threads to keep its CPU busy.
+        SERVE_TIMEOUT (int): Seconds a silent worker is given before it is restarted.
+        SERVE_GRACEFUL_TIMEOUT (int): Seconds workers get to finish their requests on reload or shutdown.
+        SERVE_MAX_REQUESTS (int): Requests after which a worker is gracefully replaced (0: never).
+        SERVE_WARM_ROSTERS (int): Most recently used rosters built before the workers are forked.
+        SINGLE_FLIGHT_ENABLED (bool): Let identical Google GET calls in flight for the same user
+            share one response.
+        SINGLE_FLIGHT_SHARED (bool): Also coalesce calls across processes through the FetchLock table.
+        SINGLE_FLIGHT_LOCK_SECONDS (float): Time after which an unfinished cross-process call is
+            considered abandoned.
+        SINGLE_FLIGHT_RESULT_SECONDS (float): How long a published response stays readable for
+            processes that were waiting on it.
+        SINGLE_FLIGHT_POLL_MS (float): Interval at which waiting processes check the lock table.
+        FRAGMENT_CACHE_ENABLED (bool): Cache rendered course cards and stream items.
+        FRAGMENT_CACHE_MAX_ENTRIES (int): Fragments kept in each process's LRU.
+        FRAGMENT_CACHE_SHARED (bool): Also keep fragments in the CachedFragment table, shared by
+            all processes.
+        FRAGMENT_CACHE_SHARED_TTL_SECONDS (int): How long fragments are kept in the shared store.
+        COMPRESSION_ENABLED (bool): Compress responses with brotli or gzip, as the client accepts.
+        COMPRESSION_MIMETYPES (set): Response types that are compressed.
+        COMPRESSION_MIN_BYTES (int): Buffered responses smaller than this are sent uncompressed.
+        COMPRESSION_GZIP_LEVEL (int): gzip level (1-9).
+        COMPRESSION_BROTLI_QUALITY (int): brotli quality (0-11).
+        COMPRESSION_STREAMING (bool): Also compress streamed responses, incrementally.
+        COMPRESSION_STREAM_FLUSH_BYTES (int): Bytes of a streamed body collected before they are
+            compressed and sent (0 sends every chunk as it comes).
+        HTML_MINIFY (bool): Collapse the indentation of HTML templates when they are compiled.
+        WARMUP_ENABLED (bool): Prefetch a user's courses, teacher names and coursework after login.
+        WARMUP_TIME_BUDGET_SECONDS (float): Longest a warm-up may run; Google calls past it are cut short.
+        WARMUP_MIN_INTERVAL_SECONDS (int): Logins within this long of the last course list fetch
+            do not start another warm-up.
+        WARMUP_WAIT_SECONDS (float): Longest the first dashboard render waits for a running warm-up.
+        COURSE_LIST_CACHE_SECONDS (int): How long the dashboard reuses a cached course list
+            (0 always fetches it from Google).
+        LATENCY_BUDGET_MS (dict): Route -> milliseconds it waits for Google before serving the last
+            known good data instead (0: no deadline).
+        LATENCY_BUDGET_THREADS (int): Threads making the Google calls of pages with a latency budget.
+        STALE_MAX_AGE_HOURS (int): Last known good data older than this is neither served nor kept.
+        JOBS_RUN_IN_PROCESS (bool): Drain the job queue in a background thread of the web process.
+        JOBS_IN_PROCESS_THREADS (int): Jobs run concurrently by the in-process drain thread.
+        JOBS_WORKER_THREADS (int): Jobs run concurrently by ``flask worker`` and the cron endpoint.
+        JOBS_LEASE_SECONDS (int): How long a worker holds a job before others may take it over.
+        JOBS_MAX_ATTEMPTS (int): Default number of attempts before a job is marked as failed.
+        JOBS_RETRY_BASE_SECONDS (float): Delay before the first retry; doubles with each attempt.
+        JOBS_RETRY_MAX_SECONDS (float): Longest delay between retries.
+        JOBS_QUOTA_RETRY_SECONDS (float): Delay before retrying a job deferred by the quota budget.
+        JOBS_MAX_DEFERRALS (int): Quota deferrals after which a job is marked as failed.
+        JOBS_RETENTION_HOURS (int): How long finished jobs are kept.
+        JOBS_CRON_TIME_BUDGET (float): Seconds the cron endpoint spends running jobs.
+        CRON_SECRET (str): Bearer token required by the cron endpoint (unset disables it).
+        GC_INTERVAL_HOURS (int): How often each user's local rows are reconciled against Google.
+        GC_USERS_PER_RUN (int): Users queued for collection per cron run.
+        GC_BATCH_SIZE (int): Rows deleted per transaction.
+        GC_BATCH_PAUSE_MS (float): Pause between delete transactions.
+        GC_MUTE_RETENTION_DAYS (int): Days after turning an assignment in that its mute is dropped.
     """
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     
@@ -32,6 +145,13 @@ class Config:
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Read replica for the SELECTs of GET requests (see app.replica)
+    replica_uri = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_uri and replica_uri.startswith('postgres://'):
+        replica_uri = replica_uri.replace('postgres://', 'postgresql://', 1)
+    SQLALCHEMY_BINDS = {'replica': replica_uri} if replica_uri else {}
+    DATABASE_REPLICA_STICKY_SECONDS = float(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS') or 5)
+
     # OAuth 2.0 settings
     # Only allow insecure transport if explicitly set (local dev)
     OAUTHLIB_INSECURE_TRANSPORT = os.environ.get('OAUTHLIB_INSECURE_TRANSPORT')
@@ -66,3 +186,144 @@ class Config:
         'https://www.googleapis.com/auth/calendar',
         'openid'
     ]
+
+    # Local Classroom API emulator (load testing only)
+    # When set, all Google API traffic is sent to this URL instead of Google.
+    GOOGLE_API_ENDPOINT = os.environ.get('GOOGLE_API_ENDPOINT')
+    GOOGLE_HTTP_TIMEOUT = float(os.environ.get('GOOGLE_HTTP_TIMEOUT') or 30)
+    # The fake-user login bypass is only honoured together with GOOGLE_API_ENDPOINT
+    EMULATOR_LOGIN_ENABLED = os.environ.get('EMULATOR_LOGIN_ENABLED') == '1'
+
+    # Request timing instrumentation (Server-Timing header and JSON request logs)
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED') == '1'
+    INSTRUMENTATION_SERVER_TIMING = os.environ.get('INSTRUMENTATION_SERVER_TIMING', '1') == '1'
+    INSTRUMENTATION_LOG = os.environ.get('INSTRUMENTATION_LOG', '1') == '1'
+    INSTRUMENTATION_SLOW_CALL_MS = float(os.environ.get('INSTRUMENTATION_SLOW_CALL_MS') or 500)
+    INSTRUMENTATION_SLOW_REQUEST_MS = float(os.environ.get('INSTRUMENTATION_SLOW_REQUEST_MS') or 2000)
+
+    # Administrators (comma-separated emails)
+    ADMIN_EMAILS = {e.strip().lower() for e in (os.environ.get('ADMIN_EMAILS') or '').split(',') if e.strip()}
+
+    # On-demand request profiler (admin only, off by default)
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED') == '1'
+    PROFILER_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILER_SAMPLE_INTERVAL_MS') or 5)
+    PROFILER_DIR = os.environ.get('PROFILER_DIR') or os.path.join(tempfile.gettempdir(), 'classdeck-profiles')
+    PROFILER_MAX_FILES = int(os.environ.get('PROFILER_MAX_FILES') or 50)
+
+    # Google API quota budget (token buckets, split between the processes)
+    QUOTA_ENABLED = os.environ.get('QUOTA_ENABLED', '1') == '1'
+    QUOTA_PROJECT_PER_MINUTE = float(os.environ.get('QUOTA_PROJECT_PER_MINUTE') or 3000)
+    QUOTA_PROJECT_BURST = float(os.environ.get('QUOTA_PROJECT_BURST') or 600)
+    QUOTA_USER_PER_MINUTE = float(os.environ.get('QUOTA_USER_PER_MINUTE') or 300)
+    QUOTA_USER_BURST = float(os.environ.get('QUOTA_USER_BURST') or 120)
+    QUOTA_BACKGROUND_RESERVE = float(os.environ.get('QUOTA_BACKGROUND_RESERVE') or 0.25)
+    QUOTA_INTERACTIVE_MAX_WAIT_MS = float(os.environ.get('QUOTA_INTERACTIVE_MAX_WAIT_MS') or 1000)
+    QUOTA_BACKGROUND_MAX_WAIT_MS = float(os.environ.get('QUOTA_BACKGROUND_MAX_WAIT_MS') or 10000)
+    QUOTA_PROCESSES = int(os.environ.get('QUOTA_PROCESSES') or 0)
+
+    # Local full-text search
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE') or 20)
+
+    # Files page (attachment index)
+    FILES_PAGE_SIZE = int(os.environ.get('FILES_PAGE_SIZE') or 30)
+
+    # Classroom-to-Calendar sync
+    CALENDAR_SYNC_CALENDAR_ID = os.environ.get('CALENDAR_SYNC_CALENDAR_ID') or 'primary'
+
+    # Subscribable .ics deadline feed
+    ICS_FEED_REFRESH_MINUTES = int(os.environ.get('ICS_FEED_REFRESH_MINUTES') or 60)
+
+    # Workload analytics
+    WORKLOAD_REFRESH_MINUTES = int(os.environ.get('WORKLOAD_REFRESH_MINUTES') or 30)
+    WORKLOAD_CACHE_SECONDS = int(os.environ.get('WORKLOAD_CACHE_SECONDS') or 300)
+
+    # Dashboard new-assignment notifications (read from the coursework cache)
+    NEW_ASSIGNMENT_REFRESH_MINUTES = int(os.environ.get('NEW_ASSIGNMENT_REFRESH_MINUTES') or 5)
+
+    # Live dashboard updates (Server-Sent Events)
+    NOTIFICATIONS_ENABLED = os.environ.get('NOTIFICATIONS_ENABLED', '1') == '1'
+    NOTIFICATIONS_POLL_SECONDS = float(os.environ.get('NOTIFICATIONS_POLL_SECONDS') or 60)
+    NOTIFICATIONS_HEARTBEAT_SECONDS = int(os.environ.get('NOTIFICATIONS_HEARTBEAT_SECONDS') or 15)
+    NOTIFICATIONS_MAX_STREAM_SECONDS = int(os.environ.get('NOTIFICATIONS_MAX_STREAM_SECONDS') or 300)
+    NOTIFICATIONS_BUFFER_SIZE = int(os.environ.get('NOTIFICATIONS_BUFFER_SIZE') or 100)
+    NOTIFICATIONS_RESUME_SECONDS = int(os.environ.get('NOTIFICATIONS_RESUME_SECONDS') or 120)
+    NOTIFICATIONS_MAX_STREAMS = int(os.environ.get('NOTIFICATIONS_MAX_STREAMS') or 0)
+
+    # Streaming data export
+    EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES') or 64 * 1024)
+
+    # Async serving mode
+    ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+    ASYNC_GOOGLE_MAX_CONNECTIONS = int(os.environ.get('ASYNC_GOOGLE_MAX_CONNECTIONS') or 20)
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS') or 40)
+
+    # Production server (gunicorn.conf.py, ``flask serve``)
+    SERVE_BIND = os.environ.get('SERVE_BIND') or f"0.0.0.0:{os.environ.get('PORT') or 8000}"
+    SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS') or 0)
+    SERVE_THREADS = int(os.environ.get('SERVE_THREADS') or 0)
+    SERVE_IO_WAIT_RATIO = float(os.environ.get('SERVE_IO_WAIT_RATIO') or 10)
+    SERVE_TIMEOUT = int(os.environ.get('SERVE_TIMEOUT') or 60)
+    SERVE_GRACEFUL_TIMEOUT = int(os.environ.get('SERVE_GRACEFUL_TIMEOUT') or 30)
+    SERVE_MAX_REQUESTS = int(os.environ.get('SERVE_MAX_REQUESTS') or 5000)
+    SERVE_WARM_ROSTERS = int(os.environ.get('SERVE_WARM_ROSTERS') or 200)
+
+    # Request coalescing
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', '1') == '1'
+    SINGLE_FLIGHT_SHARED = os.environ.get('SINGLE_FLIGHT_SHARED') == '1'
+    SINGLE_FLIGHT_LOCK_SECONDS = float(os.environ.get('SINGLE_FLIGHT_LOCK_SECONDS') or 35)
+    SINGLE_FLIGHT_RESULT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_RESULT_SECONDS') or 5)
+    SINGLE_FLIGHT_POLL_MS = float(os.environ.get('SINGLE_FLIGHT_POLL_MS') or 50)
+
+    # Template fragment cache
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', '1') == '1'
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES') or 5000)
+    FRAGMENT_CACHE_SHARED = os.environ.get('FRAGMENT_CACHE_SHARED') == '1'
+    FRAGMENT_CACHE_SHARED_TTL_SECONDS = int(os.environ.get('FRAGMENT_CACHE_SHARED_TTL_SECONDS') or 86400)
+
+    # Response compression and HTML minification
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+    COMPRESSION_MIMETYPES = set((os.environ.get('COMPRESSION_MIMETYPES') or
+                                 'text/html,text/css,text/plain,text/calendar,application/json,'
+                                 'application/javascript,application/x-ndjson,image/svg+xml').split(','))
+    COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES') or 1024)
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL') or 6)
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY') or 5)
+    COMPRESSION_STREAMING = os.environ.get('COMPRESSION_STREAMING', '1') == '1'
+    COMPRESSION_STREAM_FLUSH_BYTES = int(os.environ.get('COMPRESSION_STREAM_FLUSH_BYTES') or 16384)
+    HTML_MINIFY = os.environ.get('HTML_MINIFY', '1') == '1'
+
+    # Cache warm-up on login
+    WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', '1') == '1'
+    WARMUP_TIME_BUDGET_SECONDS = float(os.environ.get('WARMUP_TIME_BUDGET_SECONDS') or 20)
+    WARMUP_MIN_INTERVAL_SECONDS = int(os.environ.get('WARMUP_MIN_INTERVAL_SECONDS') or 300)
+    WARMUP_WAIT_SECONDS = float(os.environ.get('WARMUP_WAIT_SECONDS') or 3)
+    COURSE_LIST_CACHE_SECONDS = int(os.environ.get('COURSE_LIST_CACHE_SECONDS') or 120)
+
+    # Latency budget with stale fallback
+    LATENCY_BUDGET_MS = {
+        'index': float(os.environ.get('LATENCY_BUDGET_INDEX_MS') or 1500),
+        'course_stream': float(os.environ.get('LATENCY_BUDGET_COURSE_STREAM_MS') or 2000),
+    }
+    LATENCY_BUDGET_THREADS = int(os.environ.get('LATENCY_BUDGET_THREADS') or 32)
+    STALE_MAX_AGE_HOURS = int(os.environ.get('STALE_MAX_AGE_HOURS') or 168)
+
+    # Background job queue
+    JOBS_RUN_IN_PROCESS = os.environ.get('JOBS_RUN_IN_PROCESS', '1') == '1'
+    JOBS_IN_PROCESS_THREADS = int(os.environ.get('JOBS_IN_PROCESS_THREADS') or 2)
+    JOBS_WORKER_THREADS = int(os.environ.get('JOBS_WORKER_THREADS') or 4)
+    JOBS_LEASE_SECONDS = int(os.environ.get('JOBS_LEASE_SECONDS') or 300)
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS') or 5)
+    JOBS_RETRY_BASE_SECONDS = float(os.environ.get('JOBS_RETRY_BASE_SECONDS') or 30)
+    JOBS_RETRY_MAX_SECONDS = float(os.environ.get('JOBS_RETRY_MAX_SECONDS') or 3600)
+    JOBS_QUOTA_RETRY_SECONDS = float(os.environ.get('JOBS_QUOTA_RETRY_SECONDS') or 60)
+    JOBS_MAX_DEFERRALS = int(os.environ.get('JOBS_MAX_DEFERRALS') or 30)
+    JOBS_RETENTION_HOURS = int(os.environ.get('JOBS_RETENTION_HOURS') or 168)
+    JOBS_CRON_TIME_BUDGET = float(os.environ.get('JOBS_CRON_TIME_BUDGET') or 50)
+    CRON_SECRET = os.environ.get('CRON_SECRET')
+
+    # Garbage collection of stale local rows
+    GC_INTERVAL_HOURS = int(os.environ.get('GC_INTERVAL_HOURS') or 24)
+    GC_USERS_PER_RUN = int(os.environ.get('GC_USERS_PER_RUN') or 20)
+    GC_BATCH_SIZE = int(os.environ.get('GC_BATCH_SIZE') or 500)
+    GC_BATCH_PAUSE_MS = float(os.environ.get('GC_BATCH_PAUSE_MS') or 50)
+    GC_MUTE_RETENTION_DAYS = int(os.environ.get('GC_MUTE_RETENTION_DAYS') or 30)
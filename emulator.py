@@ -0,0 +1,548 @@
+"""
+Local Google Classroom API emulator.
+Serves the Classroom, userinfo and token endpoints used by ClassDeck from deterministic
+synthetic data (plus an in-memory Calendar events store for calendar sync), so the app can be load
+tested without touching Google.
+
+Point the app at it with ``GOOGLE_API_ENDPOINT=http://127.0.0.1:8081`` and enable the
+fake-user login bypass with ``EMULATOR_LOGIN_ENABLED=1``.
+
+Usage:
+    python emulator.py --port 8081 --latency-ms 80 --page-size 20 --rate-429 0.01 --rate-5xx 0.005
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.parser import BytesParser
+from urllib.parse import urlsplit, parse_qs
+from flask import Flask, request, Response
+
+class EmulatorConfig:
+    """
+    Tunable behaviour of the emulator.
+
+    Attributes:
+        latency_ms (float): Base latency added to every HTTP request.
+        jitter_ms (float): Random extra latency (uniform 0..jitter_ms) per HTTP request.
+        batch_item_latency_ms (float): Extra latency per sub-request in a batch.
+        page_size (int): Maximum number of items returned per page.
+        rate_429 (float): Probability (0-1) that an API call fails with 429.
+        rate_5xx (float): Probability (0-1) that an API call fails with 503.
+        courses (int): Number of courses per fake user.
+        coursework (int): Number of coursework items per course.
+        announcements (int): Number of announcements per course.
+        materials (int): Number of coursework materials per course.
+    """
+    def __init__(self, latency_ms=0, jitter_ms=0, batch_item_latency_ms=0, page_size=100,
+                 rate_429=0.0, rate_5xx=0.0, courses=8, coursework=20, announcements=10, materials=5):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.batch_item_latency_ms = batch_item_latency_ms
+        self.page_size = page_size
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.courses = courses
+        self.coursework = coursework
+        self.announcements = announcements
+        self.materials = materials
+
+class ApiError(Exception):
+    """An error response in Google's JSON error format."""
+    def __init__(self, code, status, message):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.message = message
+
+    def body(self):
+        return {'error': {'code': self.code, 'message': self.message, 'status': self.status}}
+
+def _seed(*parts):
+    """Returns a stable integer seed for the given parts."""
+    return int(hashlib.sha256(':'.join(str(p) for p in parts).encode()).hexdigest()[:12], 16)
+
+def _timestamp(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+class FakeClassroom:
+    """
+    Deterministic synthetic Classroom data for any number of fake users.
+
+    A user is identified by the email embedded in their bearer token
+    (``emu-token:<email>``), and all of their data is derived from that email.
+    Generated data is memoized per user.
+    """
+    SUBMISSION_STATES = ['CREATED', 'TURNED_IN', 'RETURNED', 'RECLAIMED_BY_STUDENT']
+
+    def __init__(self, config):
+        self.config = config
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def user_id(self, email):
+        return str(_seed('user', email) % 10**20)
+
+    def userinfo(self, email):
+        name = email.split('@')[0].replace('.', ' ').title()
+        return {
+            'id': self.user_id(email),
+            'email': email,
+            'verified_email': True,
+            'name': name,
+            'picture': ''
+        }
+
+    def data(self, email):
+        with self._lock:
+            if email not in self._cache:
+                self._cache[email] = self._generate(email)
+            return self._cache[email]
+
+    def _generate(self, email):
+        rng = random.Random(_seed('data', email))
+        now = datetime.utcnow().replace(microsecond=0)
+        courses = []
+        by_course = {}
+        for i in range(self.config.courses):
+            course_id = str(_seed('course', email, i) % 10**12)
+            owner_id = str(_seed('teacher', email, i) % 10**20)
+            created = now - timedelta(days=rng.randint(30, 300))
+            course = {
+                'id': course_id,
+                'name': f'Course {i + 1}',
+                'section': f'Section {chr(65 + i % 26)}',
+                'ownerId': owner_id,
+                'enrollmentCode': hashlib.md5(course_id.encode()).hexdigest()[:7],
+                'courseState': 'ARCHIVED' if i == self.config.courses - 1 and self.config.courses > 2 else 'ACTIVE',
+                'alternateLink': f'https://classroom.google.com/c/{course_id}',
+                'creationTime': _timestamp(created),
+                'updateTime': _timestamp(created + timedelta(days=1))
+            }
+            courses.append(course)
+
+            coursework = []
+            submissions = []
+            for j in range(self.config.coursework):
+                work_id = f'{course_id}{j:04d}'
+                created_at = now - timedelta(hours=rng.randint(1, 24 * 120))
+                due = created_at + timedelta(days=rng.randint(1, 21))
+                work = {
+                    'courseId': course_id,
+                    'id': work_id,
+                    'title': f'Assignment {j + 1}',
+                    'description': f'Complete the exercises for unit {j % 12 + 1}.',
+                    'state': 'PUBLISHED',
+                    'alternateLink': f'https://classroom.google.com/c/{course_id}/a/{work_id}/details',
+                    'creationTime': _timestamp(created_at),
+                    'updateTime': _timestamp(created_at),
+                    'workType': 'ASSIGNMENT',
+                    'maxPoints': 100,
+                    'materials': self._materials(rng, work_id, 1)
+                }
+                if rng.random() < 0.85:
+                    work['dueDate'] = {'year': due.year, 'month': due.month, 'day': due.day}
+                    work['dueTime'] = {'hours': due.hour, 'minutes': due.minute}
+                coursework.append(work)
+
+                state = rng.choice(self.SUBMISSION_STATES)
+                submission = {
+                    'courseId': course_id,
+                    'courseWorkId': work_id,
+                    'id': f'sub{work_id}',
+                    'userId': self.user_id(email),
+                    'state': state,
+                    'creationTime': _timestamp(created_at),
+                    'updateTime': _timestamp(created_at + timedelta(hours=rng.randint(1, 72))),
+                    'courseWorkType': 'ASSIGNMENT'
+                }
+                history = [{'stateHistory': {'state': 'CREATED', 'stateTimestamp': _timestamp(created_at)}}]
+                if state in ('TURNED_IN', 'RETURNED'):
+                    submission['late'] = rng.random() < 0.2
+                    offset = rng.randint(1, 48) if submission['late'] else -rng.randint(0, 24 * 5)
+                    turned_in = due + timedelta(hours=offset) if 'dueDate' in work else created_at + timedelta(days=2)
+                    history.append({'stateHistory': {'state': 'TURNED_IN', 'stateTimestamp': _timestamp(turned_in)}})
+                    if state == 'RETURNED':
+                        history.append({'stateHistory': {'state': 'RETURNED',
+                                                         'stateTimestamp': _timestamp(turned_in + timedelta(days=3))}})
+                submission['submissionHistory'] = history
+                submissions.append(submission)
+
+            announcements = []
+            for j in range(self.config.announcements):
+                created_at = now - timedelta(hours=rng.randint(1, 24 * 120))
+                item_id = f'{course_id}a{j:04d}'
+                announcements.append({
+                    'courseId': course_id,
+                    'id': item_id,
+                    'text': f'Reminder {j + 1}: check the syllabus and bring your notebook.',
+                    'state': 'PUBLISHED',
+                    'alternateLink': f'https://classroom.google.com/c/{course_id}/p/{item_id}',
+                    'creationTime': _timestamp(created_at),
+                    'updateTime': _timestamp(created_at),
+                    'materials': self._materials(rng, item_id, rng.randint(0, 2))
+                })
+
+            materials = []
+            for j in range(self.config.materials):
+                created_at = now - timedelta(hours=rng.randint(1, 24 * 120))
+                item_id = f'{course_id}m{j:04d}'
+                materials.append({
+                    'courseId': course_id,
+                    'id': item_id,
+                    'title': f'Lecture notes {j + 1}',
+                    'state': 'PUBLISHED',
+                    'alternateLink': f'https://classroom.google.com/c/{course_id}/m/{item_id}/details',
+                    'creationTime': _timestamp(created_at),
+                    'updateTime': _timestamp(created_at),
+                    'materials': self._materials(rng, item_id, 2)
+                })
+
+            for items in (coursework, announcements, materials):
+                items.sort(key=lambda x: x['updateTime'], reverse=True)
+
+            by_course[course_id] = {
+                'course': course,
+                'courseWork': coursework,
+                'studentSubmissions': submissions,
+                'announcements': announcements,
+                'courseWorkMaterial': materials
+            }
+
+        return {'courses': courses, 'by_course': by_course}
+
+    def _materials(self, rng, item_id, count):
+        materials = []
+        for k in range(count):
+            kind = rng.choice(['driveFile', 'link', 'youtubeVideo'])
+            if kind == 'driveFile':
+                file_id = hashlib.md5(f'{item_id}:{k}'.encode()).hexdigest()[:28]
+                title = rng.choice(['Worksheet.pdf', 'Slides.pptx', 'Notes.docx', 'Data.xlsx'])
+                materials.append({'driveFile': {'driveFile': {
+                    'id': file_id,
+                    'title': title,
+                    'alternateLink': f'https://drive.google.com/file/d/{file_id}/view',
+                    'thumbnailUrl': ''
+                }, 'shareMode': 'VIEW'}})
+            elif kind == 'link':
+                materials.append({'link': {
+                    'url': f'https://example.com/resources/{item_id}/{k}',
+                    'title': 'Reference reading',
+                    'thumbnailUrl': ''
+                }})
+            else:
+                video_id = hashlib.md5(f'yt:{item_id}:{k}'.encode()).hexdigest()[:11]
+                materials.append({'youtubeVideo': {
+                    'id': video_id,
+                    'title': 'Lecture recording',
+                    'alternateLink': f'https://www.youtube.com/watch?v={video_id}',
+                    'thumbnailUrl': ''
+                }})
+        return materials
+
+    def teacher(self, user_id):
+        rng = random.Random(_seed('teacher-name', user_id))
+        first = rng.choice(['Ada', 'Alan', 'Grace', 'Edsger', 'Barbara', 'Donald', 'Frances', 'John'])
+        last = rng.choice(['Lovelace', 'Turing', 'Hopper', 'Dijkstra', 'Liskov', 'Knuth', 'Allen', 'McCarthy'])
+        return {'id': user_id, 'name': {'givenName': first, 'familyName': last, 'fullName': f'{first} {last}'}}
+
+class FakeCalendar:
+    """
+    In-memory Google Calendar events store, enough for the calendar sync engine.
+    Supports inserting, patching, getting, listing and deleting events on any calendar.
+    """
+    def __init__(self):
+        self.events = {}
+        self._lock = threading.Lock()
+
+    def handle(self, email, method, parts, body):
+        """
+        Handles a request below /calendar/v3/.
+
+        Returns:
+            tuple: (status code, JSON payload).
+        """
+        if len(parts) < 3 or parts[0] != 'calendars' or parts[2] != 'events':
+            raise ApiError(404, 'NOT_FOUND', 'Unknown calendar path.')
+        key = (email, parts[1])
+        event_id = parts[3] if len(parts) > 3 else None
+        payload = json.loads(body) if body else {}
+        with self._lock:
+            events = self.events.setdefault(key, {})
+            if event_id is None:
+                if method == 'POST':
+                    event = dict(payload, id=payload.get('id') or uuid.uuid4().hex, status='confirmed')
+                    if event['id'] in events:
+                        raise ApiError(409, 'ALREADY_EXISTS', 'The requested identifier already exists.')
+                    events[event['id']] = event
+                    return 200, event
+                if method == 'GET':
+                    return 200, {'items': list(events.values())}
+            elif event_id in events:
+                if method == 'GET':
+                    return 200, events[event_id]
+                if method in ('PATCH', 'PUT'):
+                    events[event_id] = dict(events[event_id], **payload) if method == 'PATCH' else dict(payload, id=event_id)
+                    return 200, events[event_id]
+                if method == 'DELETE':
+                    del events[event_id]
+                    return 204, None
+            else:
+                raise ApiError(404, 'NOT_FOUND', 'Not Found')
+        raise ApiError(405, 'INVALID_ARGUMENT', f'Method {method} not supported by the emulator.')
+
+class ClassroomEmulator:
+    """
+    Request handler for the emulated Google endpoints.
+
+    Independent of any HTTP server: ``handle()`` takes a method, path, query string,
+    headers and body and returns a status code, headers and body. It is served over HTTP
+    by the Flask app in this module and can be used in-process as a stub transport.
+    """
+    def __init__(self, config=None):
+        self.config = config or EmulatorConfig()
+        self.classroom = FakeClassroom(self.config)
+        self.calendar = FakeCalendar()
+        self._rng = random.Random()
+        self._rng_lock = threading.Lock()
+        self.stats = {'requests': 0, 'api_calls': 0, 'batches': 0, 'faults': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _random(self):
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _sleep(self, batch_parts=0):
+        delay = self.config.latency_ms + self._random() * self.config.jitter_ms
+        delay += batch_parts * self.config.batch_item_latency_ms
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _fault(self):
+        roll = self._random()
+        if roll < self.config.rate_429:
+            self._count('faults')
+            raise ApiError(429, 'RESOURCE_EXHAUSTED', 'Quota exceeded (emulated).')
+        if roll < self.config.rate_429 + self.config.rate_5xx:
+            self._count('faults')
+            raise ApiError(503, 'UNAVAILABLE', 'The service is currently unavailable (emulated).')
+
+    def _email(self, headers):
+        auth = headers.get('Authorization') or headers.get('authorization') or ''
+        if not auth.startswith('Bearer emu-token:'):
+            raise ApiError(401, 'UNAUTHENTICATED', 'Request had invalid authentication credentials.')
+        return auth[len('Bearer emu-token:'):]
+
+    def handle(self, method, path, query, headers, body=b''):
+        """
+        Handles a single HTTP request to the emulator.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Request path (e.g., '/v1/courses').
+            query (str): Raw query string.
+            headers (Mapping): Request headers.
+            body (bytes): Request body.
+
+        Returns:
+            tuple: (status code, headers dict, body bytes).
+        """
+        self._count('requests')
+        if method == 'POST' and path.strip('/').startswith('batch'):
+            self._count('batches')
+            return self._handle_batch(headers, body)
+
+        if method == 'POST' and path.rstrip('/') == '/token':
+            self._sleep()
+            return self._json(200, self._token(body))
+
+        self._sleep()
+        status, payload = self._dispatch(method, path, query, headers, body)
+        return self._json(status, payload)
+
+    def _json(self, status, payload):
+        body = b'' if status == 204 else json.dumps(payload).encode()
+        return status, {'Content-Type': 'application/json; charset=UTF-8'}, body
+
+    def _token(self, body):
+        form = parse_qs(body.decode() if isinstance(body, bytes) else (body or ''))
+        refresh_token = (form.get('refresh_token') or [''])[0]
+        email = refresh_token[len('emu-refresh:'):] if refresh_token.startswith('emu-refresh:') else 'anonymous@example.com'
+        return {
+            'access_token': f'emu-token:{email}',
+            'expires_in': 3600,
+            'token_type': 'Bearer',
+            'scope': ' '.join((form.get('scope') or [''])[0].split())
+        }
+
+    def _dispatch(self, method, path, query, headers, body=b''):
+        self._count('api_calls')
+        try:
+            self._fault()
+            email = self._email(headers)
+            parts = [p for p in path.split('/') if p]
+            if parts[:2] == ['calendar', 'v3']:
+                return self.calendar.handle(email, method, parts[2:], body)
+            if method != 'GET':
+                raise ApiError(405, 'INVALID_ARGUMENT', f'Method {method} not supported by the emulator.')
+            return 200, self._route(method, path, parse_qs(query or ''), email)
+        except ApiError as e:
+            return e.code, e.body()
+
+    def _route(self, method, path, params, email):
+        parts = [p for p in path.split('/') if p]
+
+        if parts[:3] == ['oauth2', 'v2', 'userinfo']:
+            return self.classroom.userinfo(email)
+
+        if parts[:1] != ['v1']:
+            raise ApiError(404, 'NOT_FOUND', f'Unknown path {path}.')
+        parts = parts[1:]
+        data = self.classroom.data(email)
+
+        if parts == ['courses']:
+            courses = data['courses']
+            states = params.get('courseStates')
+            if states:
+                courses = [c for c in courses if c['courseState'] in states]
+            return self._page(courses, 'courses', params)
+
+        if len(parts) == 2 and parts[0] == 'userProfiles':
+            return self.classroom.teacher(parts[1])
+
+        if len(parts) >= 2 and parts[0] == 'courses':
+            course_data = data['by_course'].get(parts[1])
+            if not course_data:
+                raise ApiError(404, 'NOT_FOUND', 'Requested entity was not found.')
+            rest = parts[2:]
+            if not rest:
+                return course_data['course']
+            if rest == ['courseWork']:
+                return self._page(course_data['courseWork'], 'courseWork', params)
+            if rest == ['announcements']:
+                return self._page(course_data['announcements'], 'announcements', params)
+            if rest == ['courseWorkMaterials']:
+                return self._page(course_data['courseWorkMaterial'], 'courseWorkMaterial', params)
+            if len(rest) == 3 and rest[0] == 'courseWork' and rest[2] == 'studentSubmissions':
+                submissions = course_data['studentSubmissions']
+                if rest[1] != '-':
+                    submissions = [s for s in submissions if s['courseWorkId'] == rest[1]]
+                states = params.get('states')
+                if states:
+                    submissions = [s for s in submissions if s['state'] in states]
+                return self._page(submissions, 'studentSubmissions', params)
+
+        raise ApiError(404, 'NOT_FOUND', f'Unknown path {path}.')
+
+    def _page(self, items, key, params):
+        page_size = self.config.page_size
+        if params.get('pageSize'):
+            page_size = min(page_size, int(params['pageSize'][0]) or page_size)
+        offset = int((params.get('pageToken') or ['0'])[0] or 0)
+        result = {}
+        page = items[offset:offset + page_size]
+        if page:
+            result[key] = page
+        if offset + page_size < len(items):
+            result['nextPageToken'] = str(offset + page_size)
+        return result
+
+    def _handle_batch(self, headers, body):
+        content_type = headers.get('Content-Type') or headers.get('content-type') or ''
+        message = BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        parts = message.get_payload() if message.is_multipart() else []
+        self._sleep(batch_parts=len(parts))
+
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for part in parts:
+            content_id = part.get('Content-ID', '')
+            raw = part.get_payload(decode=True) or b''
+            head, _, sub_body = raw.partition(b'\r\n\r\n')
+            if not _:
+                head, _, sub_body = raw.partition(b'\n\n')
+            lines = head.decode().splitlines()
+            sub_method, target, _version = lines[0].split(' ', 2)
+            sub_headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                sub_headers[name.strip()] = value.strip()
+            # Batched calls inherit the outer Authorization header unless they carry their own
+            if 'Authorization' not in sub_headers and 'authorization' not in sub_headers:
+                sub_headers['Authorization'] = headers.get('Authorization') or headers.get('authorization') or ''
+            url = urlsplit(target)
+            status, payload = self._dispatch(sub_method, url.path, url.query, sub_headers, sub_body)
+            response_id = content_id.strip('<>')
+            chunks.append(
+                f'--{boundary}\r\n'
+                'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{response_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} {"OK" if status < 300 else "Error"}\r\n'
+                'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+                f'{"" if status == 204 else json.dumps(payload)}\r\n'
+            )
+        chunks.append(f'--{boundary}--\r\n')
+        return 200, {'Content-Type': f'multipart/mixed; boundary={boundary}'}, ''.join(chunks).encode()
+
+def create_app(config=None):
+    """
+    Creates the Flask app that serves a ClassroomEmulator over HTTP.
+
+    Args:
+        config (EmulatorConfig, optional): Emulator behaviour settings.
+
+    Returns:
+        flask.Flask: The emulator web app. The handler is available as ``app.emulator``.
+    """
+    emulator_app = Flask('classroom_emulator')
+    emulator = ClassroomEmulator(config)
+    emulator_app.emulator = emulator
+
+    @emulator_app.route('/_emulator/stats')
+    def stats():
+        return dict(emulator.stats)
+
+    @emulator_app.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'PATCH', 'PUT', 'DELETE'])
+    @emulator_app.route('/<path:path>', methods=['GET', 'POST', 'PATCH', 'PUT', 'DELETE'])
+    def dispatch(path):
+        status, headers, body = emulator.handle(
+            request.method, '/' + path, request.query_string.decode(), request.headers, request.get_data()
+        )
+        return Response(body, status=status, headers=headers)
+
+    return emulator_app
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Google Classroom API emulator.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--batch-item-latency-ms', type=float, default=0)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--rate-5xx', type=float, default=0.0)
+    parser.add_argument('--courses', type=int, default=8)
+    parser.add_argument('--coursework', type=int, default=20)
+    parser.add_argument('--announcements', type=int, default=10)
+    parser.add_argument('--materials', type=int, default=5)
+    args = parser.parse_args()
+
+    config = EmulatorConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        batch_item_latency_ms=args.batch_item_latency_ms, page_size=args.page_size,
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, courses=args.courses,
+        coursework=args.coursework, announcements=args.announcements, materials=args.materials
+    )
+    create_app(config).run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
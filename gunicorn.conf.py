@@ -0,0 +1,41 @@
+"""
+gunicorn configuration for running ClassDeck in production::
+
+    gunicorn -c gunicorn.conf.py run:app
+
+or ``flask --app run serve``. Settings come from the SERVE_* variables in config.py; see app.server
+for how the app is preloaded, warmed up and made safe to fork, and for reloading.
+"""
+import os
+from app import app, quota, server
+
+bind = app.config['SERVE_BIND']
+worker_class = 'gthread'
+workers = server.worker_count()
+threads = server.thread_count()
+timeout = app.config['SERVE_TIMEOUT']
+graceful_timeout = app.config['SERVE_GRACEFUL_TIMEOUT']
+max_requests = app.config['SERVE_MAX_REQUESTS']
+# Keeps the workers from all being replaced at the same moment
+max_requests_jitter = max_requests // 10
+preload_app = True
+# Worker heartbeats on tmpfs, so a slow disk cannot make healthy workers look stuck
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+def on_starting(arbiter):
+    # The app is already imported (preload_app); warm up before the socket is bound
+    stats = server.warm_up()
+    arbiter.log.info(f"Warmed up: {stats['templates']} templates compiled, {stats['rosters']} rosters built")
+    threads_left = server.stray_threads()
+    if threads_left:
+        arbiter.log.warning(f"Threads started before fork will not exist in the workers: {threads_left}")
+
+def when_ready(arbiter):
+    # Runs before the workers are forked, with the worker count after command-line overrides
+    quota.scheduler.split(app.config['QUOTA_PROCESSES'] or arbiter.num_workers)
+    arbiter.log.info(f"Serving with {arbiter.num_workers} workers x {arbiter.cfg.threads} threads, "
+                     f"each with 1/{quota.scheduler.processes} of the Google project quota")
+
+def post_fork(arbiter, worker):
+    server.after_fork()
@@ -0,0 +1,242 @@
+"""
+End-to-end load generator for ClassDeck.
+Drives simulated students through the dashboard, missing assignments, course stream and
+course reordering routes of a running ClassDeck instance backed by the Classroom API emulator,
+and reports p50/p95/p99 latency, throughput and error rates per route.
+
+Start the emulator and the app first, e.g.::
+
+    python emulator.py --port 8081 --latency-ms 80
+    GOOGLE_API_ENDPOINT=http://127.0.0.1:8081 EMULATOR_LOGIN_ENABLED=1 flask --app run run --port 5000
+
+Usage:
+    python loadtest.py --base-url http://127.0.0.1:5000 --users 200 --workers 4 --threads 25 --duration 60
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+COURSE_LINK_RE = re.compile(r'href="/course/([^"/?]+)"')
+
+# Relative weight of each route in a simulated session
+ROUTE_MIX = [
+    ('/', 4),
+    ('/missing', 2),
+    ('/course/<id>', 3),
+    ('/update_course_order', 1),
+]
+
+def percentile(sorted_values, pct):
+    """
+    Returns the nearest-rank percentile of an already sorted list.
+
+    Args:
+        sorted_values (list): Sorted sample values.
+        pct (float): Percentile in the range 0-100.
+
+    Returns:
+        float: The percentile value, or 0.0 for an empty list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+class SimulatedStudent:
+    """
+    One fake student with their own HTTP session and logged-in cookie.
+
+    Attributes:
+        email (str): The fake user's email (identifies their emulator data).
+        course_ids (list): Google course IDs discovered on the dashboard.
+    """
+    def __init__(self, base_url, email, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.email = email
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.course_ids = []
+
+    def login(self):
+        response = self.session.get(self.base_url + '/dev/login', params={'email': self.email}, timeout=self.timeout)
+        response.raise_for_status()
+        self.course_ids = COURSE_LINK_RE.findall(response.text)
+
+    def request(self, route, rng):
+        """
+        Performs one request for the given route template.
+
+        Returns:
+            requests.Response: The response.
+        """
+        if route == '/course/<id>':
+            course_id = rng.choice(self.course_ids) if self.course_ids else 'unknown'
+            return self.session.get(f'{self.base_url}/course/{course_id}', timeout=self.timeout)
+        if route == '/update_course_order':
+            order = list(self.course_ids)
+            rng.shuffle(order)
+            return self.session.post(self.base_url + route, json={'order': order}, timeout=self.timeout)
+        response = self.session.get(self.base_url + route, timeout=self.timeout)
+        if route == '/' and response.ok:
+            self.course_ids = list(dict.fromkeys(COURSE_LINK_RE.findall(response.text))) or self.course_ids
+        return response
+
+def run_worker(worker_index, args):
+    """
+    Runs one load-generating process with ``args.threads`` concurrent students.
+
+    Args:
+        worker_index (int): Index of this worker process.
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Returns:
+        dict: route -> {'latencies': [...], 'errors': int, 'error_codes': {...}}
+    """
+    results = defaultdict(lambda: {'latencies': [], 'errors': 0, 'error_codes': defaultdict(int)})
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    routes = [r for r, _ in ROUTE_MIX if r in args.routes]
+    weights = [w for r, w in ROUTE_MIX if r in args.routes]
+
+    # Users are spread over worker processes and threads round-robin
+    users = [u for u in range(args.users) if u % args.workers == worker_index]
+
+    def record(route, elapsed, error_code=None):
+        with lock:
+            entry = results[route]
+            entry['latencies'].append(elapsed)
+            if error_code is not None:
+                entry['errors'] += 1
+                entry['error_codes'][str(error_code)] += 1
+
+    def drive(thread_users):
+        rng = random.Random(worker_index * 7919 + thread_users[0])
+        students = []
+        for u in thread_users:
+            student = SimulatedStudent(args.base_url, f'student{u}@{args.domain}', args.timeout)
+            start = time.perf_counter()
+            try:
+                student.login()
+                record('/dev/login', time.perf_counter() - start)
+                students.append(student)
+            except Exception as e:
+                record('/dev/login', time.perf_counter() - start, type(e).__name__)
+        while students and time.monotonic() < deadline:
+            student = rng.choice(students)
+            route = rng.choices(routes, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = student.request(route, rng)
+                elapsed = time.perf_counter() - start
+                record(route, elapsed, response.status_code if response.status_code >= 400 else None)
+            except Exception as e:
+                record(route, time.perf_counter() - start, type(e).__name__)
+            if args.think_ms:
+                time.sleep(rng.uniform(0, args.think_ms) / 1000.0)
+
+    threads = min(args.threads, len(users)) or 1
+    groups = [users[i::threads] for i in range(threads)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(drive, [g for g in groups if g]))
+
+    return {route: {'latencies': v['latencies'], 'errors': v['errors'], 'error_codes': dict(v['error_codes'])}
+            for route, v in results.items()}
+
+def merge_results(parts):
+    merged = defaultdict(lambda: {'latencies': [], 'errors': 0, 'error_codes': defaultdict(int)})
+    for part in parts:
+        for route, v in part.items():
+            merged[route]['latencies'].extend(v['latencies'])
+            merged[route]['errors'] += v['errors']
+            for code, n in v['error_codes'].items():
+                merged[route]['error_codes'][code] += n
+    return merged
+
+def summarize(merged, elapsed):
+    """
+    Computes the per-route report.
+
+    Args:
+        merged (dict): Merged raw results from all workers.
+        elapsed (float): Wall-clock duration of the run in seconds.
+
+    Returns:
+        dict: route -> summary statistics.
+    """
+    report = {}
+    for route, v in sorted(merged.items()):
+        latencies = sorted(v['latencies'])
+        count = len(latencies)
+        report[route] = {
+            'requests': count,
+            'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+            'error_rate': round(v['errors'] / count, 4) if count else 0.0,
+            'errors': dict(v['error_codes']),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        }
+    return report
+
+def print_report(report, args, elapsed):
+    print(f"\nClassDeck load test: {args.users} users, {args.workers} worker(s) x {args.threads} thread(s), "
+          f"{elapsed:.1f}s{' [' + args.label + ']' if args.label else ''}")
+    header = f"{'route':<24}{'reqs':>8}{'rps':>9}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print('-' * len(header))
+    for route, r in report.items():
+        print(f"{route:<24}{r['requests']:>8}{r['throughput_rps']:>9.1f}{r['error_rate'] * 100:>7.2f}%"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+    total = sum(r['requests'] for route, r in report.items() if route != '/dev/login')
+    print(f"\nTotal throughput: {total / elapsed:.1f} req/s")
+
+def run(args):
+    """
+    Runs the load test across ``args.workers`` processes and returns the report.
+
+    Returns:
+        dict: route -> summary statistics.
+    """
+    start = time.perf_counter()
+    if args.workers == 1:
+        parts = [run_worker(0, args)]
+    else:
+        with multiprocessing.Pool(args.workers) as pool:
+            parts = pool.starmap(run_worker, [(i, args) for i in range(args.workers)])
+    elapsed = time.perf_counter() - start
+    return summarize(merge_results(parts), elapsed), elapsed
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='ClassDeck end-to-end load generator.')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=50, help='Number of simulated students.')
+    parser.add_argument('--workers', type=int, default=1, help='Load-generating processes.')
+    parser.add_argument('--threads', type=int, default=10, help='Concurrent sessions per worker process.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds.')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='Max random pause between requests.')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds.')
+    parser.add_argument('--domain', default='example.com', help='Email domain for fake users.')
+    parser.add_argument('--routes', nargs='+', default=[r for r, _ in ROUTE_MIX],
+                        help='Routes to include in the mix.')
+    parser.add_argument('--label', default='', help='Free-form label, e.g. the server worker/thread config.')
+    parser.add_argument('--json', dest='json_out', help='Write the report as JSON to this file.')
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    report, elapsed = run(args)
+    print_report(report, args, elapsed)
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'config': vars(args), 'elapsed_s': elapsed, 'routes': report}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 """
 Entry point for running the ClassDeck application.
-Starts the Flask development server.
+Starts the Flask development server; in production, ``run:app`` is served by gunicorn with
+gunicorn.conf.py (``flask --app run serve``).
 """
 from app import app
 
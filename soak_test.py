@@ -0,0 +1,339 @@
+"""
+Soak test for memory and resource leaks in long-running workers.
+
+The script replays hundreds or thousands of requests against the dashboard, missing assignments and course
+stream pages through the Flask test client, against a fresh SQLite database, as several fake users
+in turn. Each route is replayed on its own, so that growth can be attributed to it. After
+``--warmup`` requests (which fill the caches), the process is sampled every ``--sample-every``
+requests: RSS, memory allocated by Python (``tracemalloc``), open file descriptors, open sockets
+and threads. Growth per thousand requests is the least-squares slope of each series over the
+second half of the run, once memory that only settles slowly (such as the C allocator's arenas of
+the worker threads, which tracemalloc does not see but RSS does) has stopped growing; when it
+exceeds its ``--max-*-per-1k`` threshold the run fails with exit status 1. For every route the
+lines that allocated the most memory that is still held between the end of the warmup and the end
+of the run are listed, to point at the leak.
+
+By default Google is replaced by an in-process stub transport: the app's GoogleHttp (quota
+accounting, single flight, timing) is used as in production, but instead of opening a connection
+each call is answered by the Classroom API emulator's handler. ``--transport http`` runs the
+emulator as a subprocess and talks to it over real connections instead, to also catch leaked
+sockets.
+
+Usage:
+    python soak_test.py --requests 3000 --users 4 --courses 8 --max-rss-kb-per-1k 4096 --json soak.json
+"""
+import argparse
+import gc
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+import httplib2
+import requests
+
+ROUTES = ('index', 'missing_assignments', 'course_stream')
+
+# Series sampled during a run, with the threshold option that limits their growth
+METRICS = (
+    ('rss_kb', 'max_rss_kb_per_1k'),
+    ('traced_kb', 'max_traced_kb_per_1k'),
+    ('fds', 'max_fds_per_1k'),
+    ('sockets', 'max_sockets_per_1k'),
+    ('threads', 'max_threads_per_1k'),
+)
+
+class StubTransport(httplib2.Http):
+    """
+    httplib2 transport that answers every request from an in-process ClassroomEmulator.
+
+    Placed after GoogleHttp in a subclass's bases, it replaces only the network round trip.
+
+    Attributes:
+        emulator (ClassroomEmulator): Handler the requests are sent to.
+    """
+    emulator = None
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        parts = urlsplit(uri)
+        if isinstance(body, str):
+            body = body.encode()
+        status, response_headers, content = self.emulator.handle(method, parts.path, parts.query,
+                                                                 dict(headers or {}), body or b'')
+        return httplib2.Response({'status': status, **response_headers}), content
+
+def install_stub(emulator):
+    """Makes the app send all Google API calls to ``emulator`` in-process."""
+    from app import google_client
+
+    class SoakHttp(google_client.GoogleHttp, StubTransport):
+        pass
+
+    SoakHttp.emulator = emulator
+    google_client.GoogleHttp = SoakHttp
+
+def wait_for(url, timeout=30):
+    """Polls a URL until it answers or ``timeout`` seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+def rss_kb():
+    """Returns the resident set size of this process in KiB (the peak where /proc is not available)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def open_fds():
+    """
+    Counts the open file descriptors of this process.
+
+    Returns:
+        tuple: (file descriptors, of which sockets), or (None, None) where /proc is not available.
+    """
+    fd_dir = '/proc/self/fd'
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return None, None
+    sockets = 0
+    for fd in fds:
+        try:
+            if os.readlink(os.path.join(fd_dir, fd)).startswith('socket:'):
+                sockets += 1
+        except OSError:
+            pass # Closed since it was listed (e.g. the listing's own descriptor)
+    return len(fds), sockets
+
+def sample(done):
+    """
+    Measures the process after a full garbage collection.
+
+    Args:
+        done (int): Number of requests replayed so far.
+
+    Returns:
+        dict: The request count and one value per metric in METRICS.
+    """
+    gc.collect()
+    fds, sockets = open_fds()
+    return {'requests': done, 'rss_kb': rss_kb(), 'traced_kb': tracemalloc.get_traced_memory()[0] // 1024,
+            'fds': fds, 'sockets': sockets, 'threads': threading.active_count()}
+
+def growth_per_1k(samples, metric):
+    """
+    Returns the least-squares slope of a metric per thousand requests, or None if it was not measured.
+    """
+    points = [(s['requests'], s[metric]) for s in samples if s[metric] is not None]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return 1000 * sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+def top_allocators(before, after, limit):
+    """
+    Lists the source lines whose allocations grew the most between two tracemalloc snapshots.
+
+    Returns:
+        list: {'where', 'size_kb', 'count'} dicts, largest growth first.
+    """
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__), # The samples
+              tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'), tracemalloc.Filter(False, '<unknown>'))
+    diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    return [{'where': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+             'size_kb': round(stat.size_diff / 1024, 1), 'count': stat.count_diff}
+            for stat in diff[:limit] if stat.size_diff > 0]
+
+def login(client, email):
+    """
+    Logs a fake user in and finds their courses.
+
+    Returns:
+        list: The Google IDs of the courses on the user's dashboard.
+    """
+    client.get('/dev/login?email=' + email)
+    dashboard = client.get('/').get_data(as_text=True)
+    return list(dict.fromkeys(re.findall(r'/course/([^/"?]+)', dashboard)))
+
+def route_paths(route, users):
+    """
+    Yields, forever, the (client, path) pairs to replay for a route, taking the users in turn.
+
+    Args:
+        route (str): One of ROUTES.
+        users (list): (test client, course IDs) of the logged-in users.
+    """
+    turn = 0
+    while True:
+        client, courses = users[turn % len(users)]
+        if route == 'index':
+            yield client, '/'
+        elif route == 'missing_assignments':
+            yield client, '/missing'
+        else:
+            yield client, f'/course/{courses[(turn // len(users)) % len(courses)]}'
+        turn += 1
+
+def soak(route, users, args):
+    """
+    Replays one route and measures the process while it runs.
+
+    Returns:
+        dict: The samples, growth per thousand requests of each metric, the top allocators and the
+            number of responses that were not 200.
+    """
+    paths = route_paths(route, users)
+    errors = 0
+
+    def replay(count):
+        nonlocal errors
+        for _ in range(count):
+            client, path = next(paths)
+            response = client.get(path)
+            response.get_data()
+            if response.status_code != 200:
+                errors += 1
+            response.close()
+
+    replay(args.warmup)
+    before = tracemalloc.take_snapshot() # Taken first, so the baseline sample includes its memory
+    samples = [sample(0)]
+    done = 0
+    started = time.monotonic()
+    while done < args.requests:
+        count = min(args.sample_every, args.requests - done)
+        replay(count)
+        done += count
+        samples.append(sample(done))
+        if args.verbose:
+            print(f"  {route} {done:>6} requests  rss {samples[-1]['rss_kb']} KiB  traced {samples[-1]['traced_kb']} KiB"
+                  f"  fds {samples[-1]['fds']}  sockets {samples[-1]['sockets']}  threads {samples[-1]['threads']}")
+    elapsed = time.monotonic() - started
+    after = tracemalloc.take_snapshot()
+    return {
+        'samples': samples,
+        'growth_per_1k': {metric: growth_per_1k(samples[len(samples) // 2:], metric) for metric, _ in METRICS},
+        'top_allocators': top_allocators(before, after, args.top),
+        'errors': errors,
+        'requests_per_second': round(done / elapsed, 1) if elapsed else None,
+    }
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Replay requests and fail if memory, descriptors or threads leak.')
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--requests', type=int, default=1000, help='Measured requests per route.')
+    parser.add_argument('--warmup', type=int, default=100, help='Requests per route before measuring.')
+    parser.add_argument('--sample-every', type=int, default=50, help='Requests between samples.')
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--courses', type=int, default=8)
+    parser.add_argument('--announcements', type=int, default=10, help='Announcements per course.')
+    parser.add_argument('--coursework', type=int, default=20, help='Coursework items per course.')
+    parser.add_argument('--materials', type=int, default=5, help='Materials per course.')
+    parser.add_argument('--transport', choices=('stub', 'http'), default='stub',
+                        help='Answer Google calls in-process, or from an emulator subprocess over HTTP.')
+    parser.add_argument('--emulator-port', type=int, default=8081)
+    parser.add_argument('--trace-frames', type=int, default=1, help='Frames tracemalloc keeps per allocation.')
+    parser.add_argument('--top', type=int, default=10, help='Allocators to list per route.')
+    parser.add_argument('--max-rss-kb-per-1k', type=float, default=4096)
+    parser.add_argument('--max-traced-kb-per-1k', type=float, default=256)
+    parser.add_argument('--max-fds-per-1k', type=float, default=1)
+    parser.add_argument('--max-sockets-per-1k', type=float, default=1)
+    parser.add_argument('--max-threads-per-1k', type=float, default=1)
+    parser.add_argument('--verbose', action='store_true', help='Print every sample.')
+    parser.add_argument('--json', dest='json_out', help='Write the samples and results as JSON to this file.')
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    workdir = tempfile.mkdtemp(prefix='classdeck-soak-')
+    endpoint = (f'http://127.0.0.1:{args.emulator_port}' if args.transport == 'http'
+                else 'http://classroom-emulator.invalid')
+    os.environ.update(DATABASE_URL=f'sqlite:///{os.path.join(workdir, "soak.db")}', GOOGLE_API_ENDPOINT=endpoint,
+                      EMULATOR_LOGIN_ENABLED='1', JOBS_RUN_IN_PROCESS='0', QUOTA_ENABLED='0')
+    emulator_args = ['--courses', str(args.courses), '--announcements', str(args.announcements),
+                     '--coursework', str(args.coursework), '--materials', str(args.materials)]
+    emulator_process = None
+    if args.transport == 'http':
+        emulator_process = subprocess.Popen([sys.executable, 'emulator.py', '--port', str(args.emulator_port)]
+                                            + emulator_args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if emulator_process:
+            wait_for(f'{endpoint}/')
+        from app import app, db
+        if args.transport == 'stub':
+            import emulator
+            config = emulator.EmulatorConfig(courses=args.courses, announcements=args.announcements,
+                                             coursework=args.coursework, materials=args.materials)
+            install_stub(emulator.ClassroomEmulator(config))
+        with app.app_context():
+            db.create_all()
+
+        tracemalloc.start(args.trace_frames)
+        users = []
+        for i in range(args.users):
+            client = app.test_client()
+            users.append((client, login(client, f'soak{i}@example.com')))
+        if not all(courses for _, courses in users):
+            raise RuntimeError('A fake user has no courses on their dashboard; is the emulator reachable?')
+
+        results = {}
+        for route in args.routes:
+            print(f'Replaying {route}: {args.warmup} warmup + {args.requests} measured requests')
+            results[route] = soak(route, users, args)
+        tracemalloc.stop()
+    finally:
+        if emulator_process:
+            emulator_process.terminate()
+            emulator_process.wait()
+
+    failures = []
+    print(f"\n{'route':<22}{'req/s':>8}{'errors':>8}" + ''.join(f'{metric + "/1k":>16}' for metric, _ in METRICS))
+    for route, result in results.items():
+        cells = []
+        for metric, option in METRICS:
+            growth = result['growth_per_1k'][metric]
+            limit = getattr(args, option)
+            failed = growth is not None and growth > limit
+            if failed:
+                failures.append(f'{route}: {metric} grew {growth:.1f} per 1000 requests (limit {limit:g})')
+            cells.append(f"{'n/a' if growth is None else f'{growth:.1f}'}{'!' if failed else ' '}")
+        if result['errors']:
+            failures.append(f"{route}: {result['errors']} responses were not 200")
+        print(f"{route:<22}{result['requests_per_second'] or 0:>8}{result['errors']:>8}"
+              + ''.join(f'{cell:>16}' for cell in cells))
+    for route, result in results.items():
+        print(f'\nTop allocators still held after replaying {route}:')
+        for stat in result['top_allocators']:
+            print(f"  {stat['size_kb']:>10.1f} KiB {stat['count']:>+8} blocks  {stat['where']}")
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'config': vars(args), 'results': results, 'failures': failures}, f, indent=2)
+    if failures:
+        print('\nFAILED\n' + '\n'.join(failures))
+        sys.exit(1)
+    print('\nOK')
+
+if __name__ == '__main__':
+    main()
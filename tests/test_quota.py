@@ -0,0 +1,53 @@
+"""
+Tests for the Google quota budget with the budgets split between gunicorn workers.
+
+Google calls are answered in-process by the Classroom API emulator (see soak_test.install_stub).
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='classdeck-test-'), 'test.db')}",
+                  GOOGLE_API_ENDPOINT='http://classroom-emulator.invalid', EMULATOR_LOGIN_ENABLED='1',
+                  JOBS_RUN_IN_PROCESS='0', WARMUP_ENABLED='0', QUOTA_ENABLED='1')
+
+import emulator
+from soak_test import install_stub
+from app import app, db, coursework_cache, quota
+from app.models import CachedCourseWork, User
+
+class QuotaSplitTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The emulator archives the last of its courses, leaving 30 active ones
+        install_stub(emulator.ClassroomEmulator(emulator.EmulatorConfig(courses=31, coursework=5)))
+        with app.app_context():
+            db.create_all()
+        app.test_client().get('/dev/login?email=student@example.com')
+
+    def tearDown(self):
+        quota.scheduler.split(app.config['QUOTA_PROCESSES'] or 1)
+
+    def test_background_batches_fit_above_the_reserve(self):
+        quota.scheduler.split(16)
+        limit = quota.scheduler.batch_limit()
+        self.assertLess(limit, 50)
+        with quota.background():
+            self.assertEqual(quota.batch_limit(50), limit)
+            self.assertTrue(quota.has_budget(1, 500))
+        self.assertEqual(quota.batch_limit(50), 50)
+
+    def test_refresh_of_30_courses_with_4_workers(self):
+        quota.scheduler.split(4)
+        with app.app_context():
+            user = User.query.filter_by(email='student@example.com').one()
+            coursework_cache.refresh(user)
+            courses = db.session.query(CachedCourseWork.google_course_id).filter_by(user_id=user.id).distinct().count()
+        self.assertEqual(courses, 30)
+        self.assertEqual(quota.scheduler.stats['deferred'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
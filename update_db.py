@@ -1,11 +1,24 @@
 """
 Database update script.
-Creates any missing tables based on the current models without dropping existing data.
+Creates any missing tables based on the current models without dropping existing data, and adds
+columns that were added to existing models (e.g. Course.revision) to their tables.
 Useful for adding new tables (like MutedItem) to an existing database.
 """
+from sqlalchemy import inspect, text
 from app import app, db
 from app.models import MutedItem
 
 with app.app_context():
     db.create_all()
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer # Quotes reserved names such as "user" on Postgres
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(f'ALTER TABLE {preparer.format_table(table)} '
+                                      f'ADD COLUMN {preparer.format_column(column)} '
+                                      f'{column.type.compile(db.engine.dialect)}'))
+                    print(f"Added column {table.name}.{column.name}")
     print("Database tables updated.")